@@ -0,0 +1,232 @@
+"""
+A2A task building, the shared task store and push delivery.
+
+``run_message`` does the work of one ``message/send``: parse, compare and
+analyse, returning the finished task. The view awaits it inline for blocking
+requests; for ``blocking: false`` it stores a ``working`` task and hands the
+same coroutine to a Celery worker (``ai.tasks.run_message``), which saves
+the result in the task store (``tasks/get``) and POSTs it to the client's
+push URL.
+
+Task ids are issued here (``new_task_id``), never taken from the client's
+JSON-RPC id, and a stored task is only served back to the client that
+created it (``requester``).
+"""
+import asyncio
+import hashlib
+import uuid
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from core import envelopes, metrics
+from core.renderers import dumps
+from prices.services import comparison_rows, get_comparison, get_multi_comparison
+from prices.trend import get_trend, trend_summary
+
+from .services import parse_text, response_text
+
+PUSH_DELIVERIES = metrics.Counter(
+    "a2a_push_deliveries_total",
+    "Push notifications of finished A2A tasks, by outcome.",
+    ["outcome"],
+)
+
+TASK_KEY = "a2a:task:{}"
+
+
+def new_task_id() -> str:
+    """Server-side task id; random, so one client can't guess another's."""
+    return uuid.uuid4().hex
+
+
+def requester(request) -> str:
+    """Opaque owner of the tasks ``request`` creates: its ``X-API-KEY``, else its IP, hashed."""
+    api_key = request.headers.get("X-API-KEY")
+    identity = f"key:{api_key}" if api_key else f"ip:{request.META.get('REMOTE_ADDR', '')}"
+    return hashlib.sha256(identity.encode()).hexdigest()[:32]
+
+
+def now() -> str:
+    return envelopes.timestamp()
+
+
+def agent_message(text: str, task_id: str, data: dict = None) -> dict:
+    parts = [envelopes.text_part(text)]
+    if data is not None:
+        parts.append(envelopes.data_part(data))
+    return envelopes.message("agent", parts, task_id)
+
+
+def user_message(user_msg_raw, task_id: str) -> dict:
+    # Ensure user message has messageId and is a dict
+    if isinstance(user_msg_raw, dict):
+        user_msg = dict(user_msg_raw)
+        user_msg.setdefault("kind", "message")
+        user_msg.setdefault("messageId", envelopes.new_id())
+        return user_msg
+    return envelopes.message("user", [p for p in (getattr(user_msg_raw, "parts", []) or [])], task_id)
+
+
+def build_task(task_id: str, context_id: str, state: str, agent_msg: dict, user_msg: dict, artifacts=()) -> dict:
+    return envelopes.task(task_id, context_id, state, agent_msg, artifacts, history=[user_msg, agent_msg])
+
+
+def analysis_artifact(text: str, artifact_id: str = None, stale: dict = None) -> dict:
+    parts = [envelopes.text_part(text)]
+    if stale:
+        parts.append(envelopes.data_part(stale))
+    return envelopes.artifact("comparison_data", parts, artifact_id)
+
+
+def asset_artifacts(comp: dict) -> list:
+    """One ``comparison_data`` artifact per asset of a multi-asset comparison (else none)."""
+    rows = comparison_rows(comp)
+    if len(rows) < 2:
+        return []
+    return [envelopes.artifact("comparison_data", [envelopes.data_part(row)]) for row in rows]
+
+
+def staleness(comp: dict):
+    """``{"stale": True, "stale_seconds": n}`` if any figure was served stale, else ``None``."""
+    ages = [row.get("stale_seconds", 0) for row in comparison_rows(comp) if row.get("stale")]
+    return {"stale": True, "stale_seconds": max(ages)} if ages else None
+
+
+def comparison_error_text(symbol, comp: dict) -> str:
+    error_msg = comp.get("details", "An error occurred while fetching the data")
+    return f"Sorry, I couldn't get the price information for {symbol}. {error_msg}"
+
+
+def confirmation_text(symbol) -> str:
+    symbol_display = symbol if symbol else "the asset"
+    return f"I've analyzed the price information for {symbol_display}. You can find the detailed analysis in the artifacts."
+
+
+def requested_symbols(parsed: dict) -> list:
+    """Symbols a parse result asks about, in order (``[None]`` if none)."""
+    symbols = [a.get("symbol") for a in parsed.get("assets") or [] if a.get("symbol")]
+    return symbols or [parsed.get("symbol")]
+
+
+def symbols_label(symbols: list):
+    """``"BTC"``, ``"BTC and ETH"``, ``"BTC, ETH and SOL"`` (``None`` if empty)."""
+    symbols = [s for s in symbols if s]
+    if len(symbols) > 1:
+        return ", ".join(symbols[:-1]) + " and " + symbols[-1]
+    return symbols[0] if symbols else None
+
+
+async def compare(parsed: dict):
+    """Run the price comparison a parse result asks for.
+
+    Returns ``(label, comparison)``; several assets become one combined
+    multi-asset comparison.
+    """
+    symbols = requested_symbols(parsed)
+    if len(symbols) > 1:
+        return symbols_label(symbols), await get_multi_comparison(symbols, parsed.get("date"))
+    return symbols[0], await get_comparison(symbols[0], parsed.get("date"))
+
+
+async def trend_task(task_id: str, context_id: str, parsed: dict, user_msg: dict) -> dict:
+    """Finished task for a trend intent: summary text plus a ``trend_data`` artifact.
+
+    ``user_msg`` is the normalised user message (``user_message``).
+    """
+    symbol = parsed.get("symbol")
+    try:
+        trend = await get_trend(symbol, parsed.get("window") or "7d")
+    except Exception as e:
+        agent_msg = agent_message(comparison_error_text(symbol, {"details": str(e)}), task_id)
+        return build_task(task_id, context_id, "failed", agent_msg, user_msg)
+
+    artifact = envelopes.artifact("trend_data", [envelopes.data_part(trend)])
+    agent_msg = agent_message(trend_summary(trend), task_id)
+    return build_task(task_id, context_id, "completed", agent_msg, user_msg, [artifact])
+
+
+async def run_message(task_id: str, user_msg_raw, user_text: str, context_id: str = None) -> dict:
+    """Parse, compare and analyse one user message; return the final task."""
+    user_msg = user_message(user_msg_raw, task_id)
+    parsed = await parse_text(user_text)
+
+    # ✅ Chat mode → normal friendly assistant reply
+    if parsed.get("mode") == "chat":
+        msg = agent_message(parsed.get("message", ""), task_id)
+        return build_task(task_id, context_id or "chat", "completed", msg, user_msg)
+
+    # ✅ Trend over the last N days / weeks
+    if parsed.get("intent") == "trend":
+        return await trend_task(task_id, context_id or envelopes.new_id(), parsed, user_msg)
+
+    # ✅ Crypto data mode (one or several assets)
+    symbol, comp = await compare(parsed)
+
+    # Check for errors in the response
+    if isinstance(comp, dict) and comp.get("error"):
+        agent_msg = agent_message(comparison_error_text(symbol, comp), task_id)
+        return build_task(task_id, context_id or envelopes.new_id(), "failed", agent_msg, user_msg)
+
+    # If no errors, proceed with analysis
+    analysis_text = await response_text(comp)
+    agent_msg = agent_message(confirmation_text(symbol), task_id)
+    return build_task(
+        task_id, context_id or envelopes.new_id(), "completed", agent_msg,
+        user_msg, [analysis_artifact(analysis_text, stale=staleness(comp)), *asset_artifacts(comp)],
+    )
+
+
+def task_store_is_shared() -> bool:
+    """Whether tasks saved by a Celery worker reach every web worker (needs ``CACHE_REDIS_URL``)."""
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def save_task(task: dict, owner: str):
+    """Store ``task`` where any web worker can serve it to ``tasks/get`` for ``owner``."""
+    cache.set(TASK_KEY.format(task["id"]), {"owner": owner, "task": task}, settings.A2A_TASK_TTL)
+
+
+def get_task(task_id: str, owner: str, history_length: int = None):
+    """The stored task, or ``None`` if it is unknown, expired or not ``owner``'s."""
+    entry = cache.get(TASK_KEY.format(task_id))
+    if entry is None or entry.get("owner") != owner:
+        return None
+    task = entry["task"]
+    if history_length is not None:
+        task = dict(task, history=task["history"][-history_length:] if history_length else [])
+    return task
+
+
+def push_headers(config: dict) -> dict:
+    headers = {"Content-Type": "application/json"}
+    if config.get("token"):
+        headers["X-A2A-Notification-Token"] = config["token"]
+    auth = config.get("authentication") or {}
+    schemes = auth.get("schemes") or []
+    if schemes and auth.get("credentials"):
+        headers["Authorization"] = f"{schemes[0]} {auth['credentials']}"
+    return headers
+
+
+async def push_task(config: dict, rpc_id: str, task: dict) -> bool:
+    """POST the finished task to the client's push URL, with retries."""
+    payload = envelopes.rpc_result(rpc_id, task)
+    delay = 1.0
+    async with httpx.AsyncClient(timeout=settings.A2A_PUSH_TIMEOUT) as client:
+        for attempt in range(settings.A2A_PUSH_RETRIES):
+            try:
+                r = await client.post(config["url"], content=dumps(payload), headers=push_headers(config))
+                if r.status_code < 500:
+                    PUSH_DELIVERIES.labels(outcome="delivered" if r.is_success else "rejected").inc()
+                    return r.is_success
+            except httpx.HTTPError:
+                pass
+            if attempt + 1 < settings.A2A_PUSH_RETRIES:
+                await asyncio.sleep(delay)
+                delay *= 2
+    PUSH_DELIVERIES.labels(outcome="failed").inc()
+    return False
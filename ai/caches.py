@@ -0,0 +1,121 @@
+"""
+In-process caches for Gemini results.
+
+``parse_cache`` holds intent-parse results keyed on the normalized user text.
+It stores the relative date phrase the model returned ("yesterday") rather
+than a resolved date, so cached entries stay correct after midnight.
+
+``analysis_cache`` holds ``response_text`` narratives keyed on one
+``(asset, date, current-price band, direction)`` tuple per compared asset.
+A hit is re-rendered with the exact figures of the new comparison.
+"""
+import math
+import re
+import threading
+from decimal import Decimal, InvalidOperation
+
+from cachetools import TTLCache
+from django.conf import settings
+
+from core import metrics
+
+_PUNCTUATION = re.compile(r"[^\w\s-]")
+
+
+def normalize_query(text: str) -> str:
+    """Case-, whitespace- and punctuation-insensitive cache key for ``text``."""
+    text = (text or "").lower().replace("'", "").replace("\u2019", "")
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+class LRUTTLCache:
+    """Bounded, thread-safe LRU cache with a per-entry TTL and hit counters."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._requests = metrics.Counter(
+            f"{name}_requests_total",
+            f"Lookups in the {name} cache, by result.",
+            ["result"],
+        )
+
+    def get(self, key):
+        with self._lock:
+            value = self._cache.get(key)
+        self._requests.labels(result="hit" if value is not None else "miss").inc()
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
+
+
+parse_cache = LRUTTLCache("parse_cache", settings.PARSE_CACHE_MAXSIZE, settings.PARSE_CACHE_TTL)
+analysis_cache = LRUTTLCache("analysis_cache", settings.ANALYSIS_CACHE_MAXSIZE, settings.ANALYSIS_CACHE_TTL)
+
+# Number formats a narrative may quote a figure in; longest replaced first
+_FIGURE_FORMATS = (
+    lambda d: f"{d:,}",
+    lambda d: str(d),
+    lambda d: f"{d:,.2f}",
+    lambda d: f"{d:.2f}",
+)
+RERENDERED_FIGURES = ("current_price", "percent_change")
+
+
+def price_bucket(price, band_pct: float) -> int:
+    """Index of the log-scale price band, ``band_pct`` percent wide, holding ``price``."""
+    return math.floor(math.log(float(price)) / math.log1p(band_pct / 100))
+
+
+def analysis_key(figures: dict):
+    """Cache key for a comparison's figures, or ``None`` if they are unusable."""
+    try:
+        current = Decimal(figures["current_price"])
+        if current <= 0:
+            return None
+        band_pct = settings.ANALYSIS_CACHE_BAND_PCT
+        return (
+            figures["asset"],
+            figures["date"],
+            # A band of 0 (or less) disables banding: only the exact price hits
+            price_bucket(current, band_pct) if band_pct > 0 else current.normalize(),
+            figures.get("direction"),
+        )
+    except (KeyError, TypeError, InvalidOperation):
+        return None
+
+
+def rerender(text: str, old: dict, new: dict) -> str:
+    """Swap ``old`` figures quoted in a cached narrative for the ``new`` ones.
+
+    Only whole numbers are replaced, so other figures that merely contain an
+    old value (a past price ending in the same digits) are left alone.
+    """
+    replacements = {}
+    for name in RERENDERED_FIGURES:
+        try:
+            before, after = Decimal(old[name]), Decimal(new[name])
+        except (KeyError, TypeError, InvalidOperation):
+            continue
+        if before == after:
+            continue
+        for fmt in _FIGURE_FORMATS:
+            replacements.setdefault(fmt(before), fmt(after))
+    if not replacements:
+        return text
+    # Whole numbers only ("2.00" must not match inside "$42.00"), longest
+    # first, in one pass so a replaced figure is never replaced again
+    alternatives = "|".join(re.escape(b) for b in sorted(replacements, key=len, reverse=True))
+    pattern = re.compile(rf"(?<![\d.,])(?:{alternatives})(?![\d]|[.,]\d)")
+    return pattern.sub(lambda m: replacements[m.group(0)], text)
@@ -0,0 +1,229 @@
+"""
+Deterministic fast path for ``parse_text``.
+
+A small grammar over greetings, known tickers/asset names and date phrases
+answers the common messages ("hi", "btc yesterday", "ETH price 3 days ago")
+in microseconds and returns the same dicts as the Gemini parser, including
+several assets in one message ("btc, eth and sol last week") and trend
+questions ("7-day trend for BTC"). Anything
+with a word the grammar does not understand is treated as ambiguous and
+returns ``None`` so the caller falls through to the LLM.
+
+Tickers that are also everyday words ("not", "one", "people") only count
+as assets with a cue that they mean the coin: ``$NOT``, ``NOT`` in
+capitals, or a quote currency (``not usdt``, ``NOT-USDT``). Otherwise the
+message goes to the LLM, so "is it not going up?" is never read as Notcoin.
+"""
+import re
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from core import metrics
+from prices.symbols import current_index
+
+FAST_PATH = metrics.Counter(
+    "parse_fastpath_total",
+    "parse_text calls answered by the rule-based fast path (hit) or sent to the LLM (miss).",
+    ["result"],
+)
+
+GREETING_REPLY = "Hello! 👋 How can I help you today?"
+HELP_REPLY = (
+    "I help you check cryptocurrency prices for any date. You can say things like:\n"
+    "- 'Check btc yesterday'\n"
+    "- 'Solana price 3 days ago'\n"
+    "- 'Compare ETH one week ago'"
+)
+
+GREETINGS = {
+    "hi", "hello", "hey", "hiya", "yo", "hi there", "hello there", "hey there",
+    "good morning", "good afternoon", "good evening", "gm",
+}
+HELP_PHRASES = {
+    "help", "what do you do", "who are you", "what can you do", "how do i use you",
+    "how does this work",
+}
+
+# Words that carry no meaning for a price lookup
+FILLER = {
+    "a", "an", "the", "of", "for", "on", "at", "in", "is", "was", "what", "whats",
+    "s", "me", "show", "tell", "get", "give", "check", "price", "prices", "value",
+    "compare", "comparison", "how", "much", "did", "cost", "usd", "usdt", "please",
+    "pls", "current", "currently", "rate", "worth", "coin", "token", "to", "vs",
+    "and", "from", "since", "then", "there", "i", "want", "know", "see", "can", "you",
+}
+
+# Listed tickers (or aliases) that are also common English words
+WORD_TICKERS = {
+    "ace", "act", "ai", "ark", "band", "bat", "big", "blur", "bone", "book", "cat",
+    "city", "core", "dog", "dogs", "edge", "flow", "fuel", "game", "gas", "go", "gods",
+    "high", "hook", "ice", "id", "it", "joe", "key", "king", "looks", "magic", "mask",
+    "max", "me", "meme", "move", "near", "not", "ok", "one", "order", "people", "pump",
+    "ray", "render", "safe", "sand", "sun", "super", "trump", "up", "usual", "wave",
+    "win", "zero",
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "fourteen": 14, "thirty": 30,
+}
+_NUM = r"(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")"
+
+DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4}-\d{2}-\d{2})\b"), "iso"),
+    (re.compile(rf"\b{_NUM} (day|days|week|weeks|month|months) ago\b"), "ago"),
+    (re.compile(r"\blast (week|month)\b"), "last"),
+    (re.compile(r"\b(day before yesterday)\b"), "before_yesterday"),
+    (re.compile(r"\b(yesterday)\b"), "yesterday"),
+    (re.compile(r"\b(today|now|right now)\b"), "today"),
+]
+
+# "7-day trend for BTC", "how did eth perform over the last 4 weeks"
+TREND_WORDS = {"trend", "trends", "trending", "perform", "performed", "performance"}
+TREND_FILLER = {"last", "past", "over", "during", "this", "day", "week"}
+TREND_WINDOW = re.compile(rf"\b{_NUM}[ -](day|days|week|weeks)\b")
+
+_CLEAN = re.compile(r"[^a-z0-9\- ]+")
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("'", "")
+    return " ".join(_CLEAN.sub(" ", text).split())
+
+
+def _match_date(text: str, today: date):
+    """Return ``(date, text_without_phrase)`` for the first date phrase found."""
+    for pattern, kind in DATE_PATTERNS:
+        m = pattern.search(text)
+        if not m:
+            continue
+        if kind == "iso":
+            try:
+                dt = date.fromisoformat(m.group(1))
+            except ValueError:
+                return None, text
+        elif kind == "ago":
+            n = m.group(1)
+            n = int(n) if n.isdigit() else NUMBER_WORDS[n]
+            unit = m.group(2).rstrip("s")
+            if unit == "day":
+                dt = today - timedelta(days=n)
+            elif unit == "week":
+                dt = today - timedelta(weeks=n)
+            else:
+                dt = today - relativedelta(months=n)
+        elif kind == "last":
+            dt = today - (timedelta(weeks=1) if m.group(1) == "week" else relativedelta(months=1))
+        elif kind == "before_yesterday":
+            dt = today - timedelta(days=2)
+        elif kind == "yesterday":
+            dt = today - timedelta(days=1)
+        else:
+            dt = today
+        return dt, (text[:m.start()] + " " + text[m.end():]).strip()
+    return today, text
+
+
+def _has_ticker_cue(word: str, text: str) -> bool:
+    """Whether ``text`` writes ``word`` as a ticker: ``$word``, ``WORD`` or ``word usdt``."""
+    escaped = re.escape(word)
+    if re.search(rf"\${escaped}\b", text, re.I):
+        return True
+    if re.search(rf"\b{escaped}[-/ ]?usdt?\b", text, re.I):
+        return True
+    # Capitals only count when the whole message isn't shouted
+    return not text.isupper() and re.search(rf"(?<![\w$]){escaped.upper()}\b", text) is not None
+
+
+def _match_assets(words: list, text: str):
+    """Find the assets named in ``words``; every other word must be filler.
+
+    Returns the distinct symbols in the order they appear, or ``None`` if
+    there are none, a word is not understood, or a ticker that is also a
+    common word appears without a ticker cue in ``text``.
+    """
+    index = current_index()
+    found = []
+    i = 0
+    while i < len(words):
+        symbol, size = None, 1
+        if words[i] not in FILLER:
+            # Longest multi-word name first ("hamster kombat", "shiba inu")
+            for size in (3, 2, 1):
+                if i + size <= len(words):
+                    symbol = index.resolve(" ".join(words[i:i + size]), fuzzy=False)
+                    if symbol is not None:
+                        break
+            if symbol is None:
+                # Unknown word: leave it to the LLM
+                return None
+            if size == 1 and words[i] in WORD_TICKERS and not _has_ticker_cue(words[i], text):
+                # Probably the word, not the coin: leave it to the LLM
+                return None
+            if symbol not in found:
+                found.append(symbol)
+        i += size
+    return found or None
+
+
+def fast_parse(text: str, today: date = None):
+    """Parse ``text`` without the LLM, or return ``None`` if it is ambiguous."""
+    result = _fast_parse(text or "", today or date.today())
+    FAST_PATH.labels(result="hit" if result is not None else "miss").inc()
+    return result
+
+
+def _fast_parse(text: str, today: date):
+    normalized = _normalize(text)
+    if not normalized:
+        return None
+    if normalized in GREETINGS:
+        return {"message": GREETING_REPLY, "mode": "chat"}
+    if normalized in HELP_PHRASES:
+        return {"message": HELP_REPLY, "mode": "chat"}
+
+    if TREND_WORDS.intersection(normalized.split()):
+        return _trend_intent(normalized, text)
+
+    dt, rest = _match_date(normalized, today)
+    if dt is None:
+        return None
+    symbols = _match_assets(rest.replace("-", " ").split(), text)
+    if symbols is None:
+        return None
+    assets = [{"asset": current_index().name(s), "symbol": s} for s in symbols]
+    return {
+        **assets[0],
+        "assets": assets,
+        "date": dt.strftime("%Y-%m-%d"),
+        "raw": text,
+    }
+
+
+def _trend_intent(normalized: str, text: str):
+    """Trend question over an N-day / N-week window (7 days by default)."""
+    window = "7d"
+    m = TREND_WINDOW.search(normalized)
+    if m:
+        n = m.group(1)
+        n = int(n) if n.isdigit() else NUMBER_WORDS[n]
+        window = f"{n}{m.group(2)[0]}"
+        normalized = (normalized[:m.start()] + " " + normalized[m.end():]).strip()
+    words = [
+        w for w in normalized.replace("-", " ").split()
+        if w not in TREND_WORDS and w not in TREND_FILLER
+    ]
+    symbols = _match_assets(words, text)
+    if symbols is None or len(symbols) != 1:
+        return None
+    return {
+        "intent": "trend",
+        "asset": current_index().name(symbols[0]),
+        "symbol": symbols[0],
+        "assets": [{"asset": current_index().name(symbols[0]), "symbol": symbols[0]}],
+        "window": window,
+        "date": None,
+        "raw": text,
+    }
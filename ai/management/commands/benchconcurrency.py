@@ -0,0 +1,96 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from prices.services import build_task_response
+
+A2A_PATH = "/api/v1/a2a/crypto"
+A2A_BODY = json.dumps({
+    "jsonrpc": "2.0",
+    "id": "bench",
+    "method": "message/send",
+    "params": {
+        "message": {
+            "kind": "message",
+            "role": "user",
+            "parts": [{"kind": "text", "text": "check btc yesterday"}],
+        }
+    },
+})
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark in-flight capacity of the A2A endpoint under WSGI vs ASGI.\n"
+        "Gemini and OKX are replaced by fixed-latency fakes so the run is offline "
+        "and only measures how many requests each server model keeps in flight. "
+        "WSGI is modelled as N sync gunicorn workers (threads), ASGI as ONE "
+        "event-loop worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=60, help="Total requests per run.")
+        parser.add_argument(
+            "--latency", type=float, default=0.3,
+            help="Simulated latency (seconds) of each upstream hop (parse, compare, analysis).",
+        )
+        parser.add_argument("--wsgi-workers", type=int, default=3, help="Sync workers for the WSGI run.")
+
+    def handle(self, *args, **options):
+        total = options["requests"]
+        latency = options["latency"]
+        workers = options["wsgi_workers"]
+
+        async def fake_parse_text(text):
+            await asyncio.sleep(latency)
+            return {"asset": "bitcoin", "symbol": "BTC", "date": "2025-01-01"}
+
+        async def fake_get_comparison(symbol, dt):
+            await asyncio.sleep(latency)
+            return build_task_response(symbol, Decimal("100"), Decimal("110"), date(2025, 1, 1))
+
+        async def fake_response_text(data):
+            await asyncio.sleep(latency)
+            return "Simulated analysis."
+
+        with mock.patch("ai.a2a.parse_text", fake_parse_text), \
+                mock.patch("ai.a2a.get_comparison", fake_get_comparison), \
+                mock.patch("ai.a2a.response_text", fake_response_text):
+            wsgi = self._run_wsgi(total, workers)
+            asgi = asyncio.run(self._run_asgi(total))
+
+        self.stdout.write(f"{total} requests, {latency * 3:.2f}s simulated upstream time each")
+        self._report(f"WSGI ({workers} sync workers)", total, wsgi)
+        self._report("ASGI (1 async worker)", total, asgi)
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {wsgi / asgi:.1f}x"))
+
+    def _run_wsgi(self, total, workers):
+        def one(_):
+            response = Client().post(A2A_PATH, A2A_BODY, content_type="application/json")
+            assert response.status_code == 200, response.content
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(one, range(total)))
+        return time.perf_counter() - started
+
+    async def _run_asgi(self, total):
+        client = AsyncClient()
+
+        async def one():
+            response = await client.post(A2A_PATH, A2A_BODY, content_type="application/json")
+            assert response.status_code == 200, response.content
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - started
+
+    def _report(self, label, total, elapsed):
+        self.stdout.write(f"{label}: {elapsed:.2f}s wall, {total / elapsed:.1f} req/s")
@@ -0,0 +1,166 @@
+import ast
+import json
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+
+from ai import a2a
+from core.renderers import ORJSONResponse
+from prices.services import build_task_response, direction, percent_change
+
+USER_MSG = {
+    "kind": "message",
+    "role": "user",
+    "parts": [{"kind": "text", "text": "check btc yesterday"}],
+}
+ANALYSIS = "Bitcoin (BTC) rose 10% since 2025-01-01. " * 20
+
+
+def legacy_build_task_response(asset, old_price, new_price, dt):
+    """The comparison envelope as it was built before core.envelopes."""
+    task_id = str(uuid.uuid4())
+    msg_id_user = str(uuid.uuid4())
+    msg_id_agent = str(uuid.uuid4())
+    pc = percent_change(new_price, old_price)
+    dir_text = direction(pc)
+    text_msg = (
+        f"Asset: {asset.upper()}\n"
+        f"Date checked: {dt}\n"
+        f"Price on date: ${old_price}\n"
+        f"Current price: ${new_price}\n"
+        f"Percentage change: {pc}%\n"
+        f"Direction: {dir_text}\n"
+    )
+    artifact_data = {
+        "asset": asset.upper(),
+        "date": str(dt),
+        "price_on_date": str(old_price),
+        "current_price": str(new_price),
+        "percent_change": str(pc),
+        "direction": dir_text,
+    }
+    return {
+        "jsonrpc": "2.0",
+        "id": task_id,
+        "result": {
+            "id": task_id,
+            "contextId": f"crypto-{asset.lower()}",
+            "status": {
+                "state": "completed",
+                "timestamp": datetime.utcnow().isoformat(),
+                "message": {
+                    "kind": "message", "role": "agent",
+                    "parts": [{"kind": "text", "text": text_msg}],
+                    "messageId": msg_id_agent, "taskId": task_id,
+                },
+            },
+            "artifacts": [{
+                "artifactId": str(uuid.uuid4()),
+                "name": "comparison_data",
+                "parts": [{"kind": "text", "text": str(artifact_data)}],
+            }],
+            "history": [
+                {"kind": "message", "role": "user",
+                 "parts": [{"kind": "text", "text": f"Check {asset} price {dt}"}],
+                 "messageId": msg_id_user, "taskId": task_id},
+                {"kind": "message", "role": "agent",
+                 "parts": [{"kind": "text", "text": text_msg}],
+                 "messageId": msg_id_agent, "taskId": task_id},
+            ],
+            "kind": "task",
+        },
+        "error": None,
+    }
+
+
+def legacy_a2a_task(task_id, analysis_text):
+    """The hand-built A2A success task of the old view."""
+    now = datetime.utcnow().isoformat() + "Z"
+    agent_msg = {
+        "kind": "message", "role": "agent", "messageId": str(uuid.uuid4()),
+        "parts": [{"kind": "text", "text": "I've analyzed the price information for BTC."}],
+        "taskId": task_id,
+    }
+    user_msg = dict(USER_MSG)
+    user_msg.setdefault("messageId", str(uuid.uuid4()))
+    return {
+        "id": task_id,
+        "contextId": str(uuid.uuid4()),
+        "status": {"state": "completed", "timestamp": now, "message": agent_msg},
+        "artifacts": [{
+            "artifactId": str(uuid.uuid4()),
+            "name": "comparison_data",
+            "parts": [{"kind": "text", "text": analysis_text}],
+        }],
+        "history": [user_msg, agent_msg],
+        "kind": "task",
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark of per-response envelope building and JSON serialization.\n"
+        "'before' is the previous path (uuid4 ids, str(artifact_data) text parts, "
+        "JsonResponse); 'after' is core.envelopes + ORJSONResponse with data parts. "
+        "Client-side decoding of the comparison figures is timed too."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000, help="Responses per measurement.")
+
+    def handle(self, *args, **options):
+        n = options["iterations"]
+        args = ("BTC", Decimal("93412.5"), Decimal("104250.1"), date(2025, 1, 1))
+
+        def before_comparison():
+            return JsonResponse(legacy_build_task_response(*args)).content
+
+        def after_comparison():
+            return ORJSONResponse(build_task_response(*args)).content
+
+        def before_a2a():
+            return JsonResponse({"jsonrpc": "2.0", "id": "1", "result": legacy_a2a_task("1", ANALYSIS)}).content
+
+        def after_a2a():
+            agent_msg = a2a.agent_message(a2a.confirmation_text("BTC"), "1")
+            task = a2a.build_task(
+                "1", a2a.envelopes.new_id(), "completed", agent_msg,
+                a2a.user_message(USER_MSG, "1"), [a2a.analysis_artifact(ANALYSIS)],
+            )
+            return ORJSONResponse(a2a.envelopes.rpc_result("1", task)).content
+
+        legacy_body = before_comparison()
+        body = after_comparison()
+
+        def before_decode():
+            text = json.loads(legacy_body)["result"]["artifacts"][0]["parts"][0]["text"]
+            return ast.literal_eval(text)
+
+        def after_decode():
+            return json.loads(body)["result"]["artifacts"][0]["parts"][0]["data"]
+
+        assert before_decode()["current_price"] == after_decode()["current_price"]
+
+        rows = [
+            ("comparison envelope", before_comparison, after_comparison),
+            ("A2A task envelope", before_a2a, after_a2a),
+            ("client decode of figures", before_decode, after_decode),
+        ]
+        self.stdout.write(f"{n} iterations, µs per response")
+        self.stdout.write(f"{'':28}{'before':>10}{'after':>10}{'speed-up':>10}")
+        for label, before, after in rows:
+            b, a = self._time(before, n), self._time(after, n)
+            self.stdout.write(f"{label:28}{b:>10.2f}{a:>10.2f}{b / a:>9.1f}x")
+        self.stdout.write(f"comparison body: {len(legacy_body)} → {len(body)} bytes")
+
+    @staticmethod
+    def _time(fn, n):
+        fn()
+        started = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - started) / n * 1e6
@@ -36,11 +36,15 @@ class ExecuteParams(BaseModel):
     taskId: Optional[str] = None
     messages: List[A2AMessage]
 
+class TaskQueryParams(BaseModel):
+    id: str
+    historyLength: Optional[int] = None
+
 class JSONRPCRequest(BaseModel):
     jsonrpc: Literal["2.0"]
     id: str
-    method: Literal["message/send", "execute"]
-    params: MessageParams | ExecuteParams
+    method: Literal["message/send", "message/stream", "execute", "tasks/get"]
+    params: MessageParams | ExecuteParams | TaskQueryParams
 
 class TaskStatus(BaseModel):
     state: Literal["working", "completed", "input-required", "failed"]
@@ -1,10 +1,19 @@
+import asyncio
 import json
 from django.conf import settings
 from datetime import datetime, timedelta
 import dateparser
 from google import genai
+from google.genai import errors as genai_errors
 import re
 
+from core import metrics
+from core.instrumentation import upstream_call
+from prices.services import comparison_rows
+
+from .caches import analysis_cache, analysis_key, normalize_query, parse_cache, rerender
+from .fastpath import fast_parse
+
 def normalize_date(date_text: str):
     if not date_text:
         return None
@@ -27,6 +36,60 @@ if not GEMINI_KEY:
 # Initialize Google GenAI client
 client = genai.Client()
 
+AI_STAGE_SECONDS = metrics.Histogram(
+    "ai_stage_duration_seconds",
+    "Latency of the intent parse and the analysis, cache and fast-path hits included.",
+    ["stage"],
+)
+
+
+async def generate(prompt: str, timeout: float):
+    """Run one Gemini generation on the async client surface.
+
+    The call never blocks the event loop, is abandoned after ``timeout``
+    seconds (raising ``TimeoutError``) and is cancelled together with the
+    request task when the HTTP client disconnects.
+    """
+    with upstream_call("gemini", "generate_content") as call:
+        try:
+            async with asyncio.timeout(timeout):
+                return await client.aio.models.generate_content(
+                    model=getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash"),
+                    contents=prompt,
+                )
+        except genai_errors.APIError as e:
+            call.status = e.code
+            raise
+
+async def generate_stream(prompt: str, timeout: float):
+    """Yield text chunks of one Gemini generation as they are produced.
+
+    ``timeout`` bounds the whole generation, not each chunk; the deadline is
+    applied around every ``await`` on the stream so it never fires while the
+    consumer is busy with an already-yielded chunk.
+    """
+    deadline = asyncio.get_running_loop().time() + timeout
+    with upstream_call("gemini", "generate_content_stream") as call:
+        try:
+            async with asyncio.timeout_at(deadline):
+                stream = await client.aio.models.generate_content_stream(
+                    model=getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash"),
+                    contents=prompt,
+                )
+            iterator = aiter(stream)
+            while True:
+                async with asyncio.timeout_at(deadline):
+                    try:
+                        chunk = await anext(iterator)
+                    except StopAsyncIteration:
+                        return
+                text = getattr(chunk, "text", None)
+                if text:
+                    yield text
+        except genai_errors.APIError as e:
+            call.status = e.code
+            raise
+
 SYSTEM_PROMPT = """
 You are a crypto assistant and command parser.
 
@@ -44,6 +107,11 @@ CRYPTO MODE (Structured JSON rules):
 - NEVER include normal text around JSON
 - Return only JSON like:
 {"asset":"bitcoin","symbol":"BTC","date":"yesterday"}
+- When the user names MORE THAN ONE asset, list all of them under "assets" (same date for all):
+{"assets":[{"asset":"bitcoin","symbol":"BTC"},{"asset":"ethereum","symbol":"ETH"}],"date":"1 week ago"}
+- When the user asks for a TREND / performance over a period, add "intent":"trend" and a "window"
+  of N days ("7d") or N weeks ("4w") instead of a date (default "7d"):
+{"intent":"trend","asset":"bitcoin","symbol":"BTC","window":"7d"}
 
 If no date given, assume "today" and use JSON.
 
@@ -77,6 +145,18 @@ User: "compare eth price one week ago"
 Response:
 {"asset":"ethereum","symbol":"ETH","date":"1 week ago"}
 
+User: "compare BTC, ETH and SOL since last week"
+Response:
+{"assets":[{"asset":"bitcoin","symbol":"BTC"},{"asset":"ethereum","symbol":"ETH"},{"asset":"solana","symbol":"SOL"}],"date":"1 week ago"}
+
+User: "What is the 7-day trend for BTC?"
+Response:
+{"intent":"trend","asset":"bitcoin","symbol":"BTC","window":"7d"}
+
+User: "how has solana done over the last month"
+Response:
+{"intent":"trend","asset":"solana","symbol":"SOL","window":"4w"}
+
 REMEMBER:
 - If crypto detected → JSON only
 - If normal chat → normal text reply
@@ -96,16 +176,72 @@ Return ONLY valid JSON like:
 NOTE: do not actually return 2025-month in number-day in number but return it with the month as a number and also the date as a number also the updated year
 """
 
+# Words that make a user's date relative to the day they asked
+RELATIVE_DATE_WORDS = re.compile(
+    r"\b(today|now|tonight|yesterday|ago|last|past|previous|this (week|month|year))\b", re.I
+)
+
+
+def _date_phrase(model_date, user_text: str):
+    """Keep the model's date as a phrase that still resolves correctly later.
+
+    Relative phrases ("yesterday") are kept as-is. When the user asked in
+    relative words, an ISO date is the model resolving them for us, so it is
+    turned back into "today" / "N days ago". Absolute dates ("march 3rd")
+    stay ISO dates.
+    """
+    if not model_date:
+        return None
+    try:
+        absolute = datetime.strptime(model_date, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return model_date
+    if not RELATIVE_DATE_WORDS.search(user_text or ""):
+        return model_date
+    days = (datetime.now().date() - absolute).days
+    if days == 0:
+        return "today"
+    if days > 0:
+        return f"{days} days ago"
+    return model_date
+
+
+def _parse_result(entry: dict) -> dict:
+    """Build the parse_text result for a (possibly cached) parse entry."""
+    if entry.get("mode") == "chat":
+        return dict(entry)
+    result = {
+        "asset": entry["asset"],
+        "symbol": entry["symbol"],
+        "assets": [dict(a) for a in entry.get("assets") or [{"asset": entry["asset"], "symbol": entry["symbol"]}]],
+        "date": normalize_date(entry["date_phrase"]),
+        "raw": entry["raw"],
+    }
+    if entry.get("intent") == "trend":
+        result.update(intent="trend", window=entry["window"])
+    return result
+
+
+@AI_STAGE_SECONDS.labels(stage="parse_text").time()
 async def parse_text(text: str) -> dict:
+    # ✅ Rule-based fast path: greetings and unambiguous price queries never
+    # reach Gemini
+    fast = fast_parse(text)
+    if fast is not None:
+        return fast
+
+    # ✅ Repeated phrasings reuse an earlier Gemini parse
+    key = normalize_query(text)
+    cached = parse_cache.get(key)
+    if cached is not None:
+        return _parse_result(cached)
+
     try:
         # Use Gemini to generate a reply. We send the system prompt and the user input
         # concatenated so the model receives the same instruction context.
         prompt = SYSTEM_PROMPT + "\n\nUSER:\n" + text
 
-        response = client.models.generate_content(
-            model=getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash"),
-            contents=prompt,
-        )
+        response = await generate(prompt, settings.GEMINI_PARSE_TIMEOUT)
 
         # response.text matches sample usage; fallback to string conversion
         raw = getattr(response, "text", None) or str(response)
@@ -134,20 +270,31 @@ async def parse_text(text: str) -> dict:
                 data = None
 
         if data:
-            parsed_date = normalize_date(data.get("date"))
-            return {
-                "asset": data.get("asset"),
-                "symbol": data.get("symbol"),
-                "date": parsed_date,
+            assets = [
+                {"asset": a.get("asset"), "symbol": a.get("symbol")}
+                for a in (data.get("assets") or []) if isinstance(a, dict)
+            ] or [{"asset": data.get("asset"), "symbol": data.get("symbol")}]
+            # Cache the date *phrase*, resolved again on every hit
+            entry = {
+                **assets[0],
+                "assets": assets,
+                "date_phrase": _date_phrase(data.get("date"), text),
                 "raw": raw
             }
+            if data.get("intent") == "trend":
+                entry.update(intent="trend", window=data.get("window") or "7d", date_phrase=None)
+        else:
+            # ✅ Normal Chat Mode
+            entry = {
+                "message": raw,
+                "mode": "chat"
+            }
 
-        # ✅ Normal Chat Mode
-        return {
-            "message": raw,
-            "mode": "chat"
-        }
+        parse_cache.set(key, entry)
+        return _parse_result(entry)
 
+    except TimeoutError:
+        return {"error": "PARSE_TIMEOUT", "details": f"Gemini did not answer within {settings.GEMINI_PARSE_TIMEOUT}s"}
     except Exception as e:
         return {"error": "PARSE_FAILED", "details": str(e)}
 
@@ -190,21 +337,87 @@ Based on the latest data, BTC appears to be trending slightly upward, suggesting
 
 As always, crypto markets are highly volatile — this is not financial advice, but a snapshot of current conditions.
 """
+def _cached_analysis(data: dict):
+    """Return ``(key, rows, text)``; ``text`` is a re-rendered cache hit or ``None``.
+
+    Multi-asset comparisons are keyed on every asset's figures, so a hit
+    needs the same assets, date and price bands.
+    """
+    rows = comparison_rows(data)
+    keys = tuple(analysis_key(row) for row in rows)
+    if not keys or None in keys:
+        return None, rows, None
+    cached = analysis_cache.get(keys)
+    if cached is None:
+        return keys, rows, None
+    text, cached_rows = cached
+    for old, new in zip(cached_rows, rows):
+        text = rerender(text, old, new)
+    return keys, rows, text
+
+
+def _remember_analysis(key, rows: list, text: str):
+    if key is not None and text:
+        analysis_cache.set(key, (text, [dict(row) for row in rows]))
+
+
+def _analysis_prompt(data: dict) -> str:
+    # data already is a dict, no need to json.loads
+    formatted_user_input = json.dumps(data, ensure_ascii=False)
+    return SYSTEM_PROMPT2 + "\n\nDATA:\n" + formatted_user_input
+
+
+@AI_STAGE_SECONDS.labels(stage="response_text").time()
 async def response_text(data: dict) -> dict:
+    # ✅ Same asset/date and roughly the same price: reuse the narrative
+    key, rows, cached = _cached_analysis(data)
+    if cached is not None:
+        return cached
+
     try:
-        # data already is a dict, no need to json.loads
-        formatted_user_input = json.dumps(data, ensure_ascii=False)
+        response = await generate(_analysis_prompt(data), settings.GEMINI_ANALYSIS_TIMEOUT)
 
-        prompt = SYSTEM_PROMPT2 + "\n\nDATA:\n" + formatted_user_input
+        raw = getattr(response, "text", None) or str(response)
+        text = raw.strip()
+        _remember_analysis(key, rows, text)
+        return text
+
+    except TimeoutError:
+        return json.dumps({
+            "error": "RESPONSE_TIMEOUT",
+            "details": f"Gemini did not answer within {settings.GEMINI_ANALYSIS_TIMEOUT}s",
+        })
+    except Exception as e:
+        # Return a JSON string so artifact text is always a string
+        return json.dumps({"error": "RESPONSE_FAILED", "details": str(e)})
 
-        response = client.models.generate_content(
-            model=getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash"),
-            contents=prompt,
-        )
 
-        raw = getattr(response, "text", None) or str(response)
-        return raw.strip()
+async def response_text_stream(data: dict):
+    """Streaming variant of ``response_text``: yields the analysis in chunks.
 
+    A cached narrative is yielded as a single chunk. Failures are yielded as
+    the same JSON error string ``response_text`` returns, so the caller can
+    always treat the joined chunks as the artifact text.
+    """
+    key, rows, cached = _cached_analysis(data)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = []
+    try:
+        async for chunk in generate_stream(_analysis_prompt(data), settings.GEMINI_ANALYSIS_TIMEOUT):
+            chunks.append(chunk)
+            yield chunk
+    except TimeoutError:
+        error = {
+            "error": "RESPONSE_TIMEOUT",
+            "details": f"Gemini did not answer within {settings.GEMINI_ANALYSIS_TIMEOUT}s",
+        }
     except Exception as e:
-        # Return a JSON string so artifact text is always a string
-        return json.dumps({"error": "RESPONSE_FAILED", "details": str(e)})
\ No newline at end of file
+        error = {"error": "RESPONSE_FAILED", "details": str(e)}
+    else:
+        _remember_analysis(key, rows, "".join(chunks).strip())
+        return
+    # Keep any partial analysis readable, with the error after it
+    yield ("\n\n" if chunks else "") + json.dumps(error)
@@ -0,0 +1,26 @@
+import asyncio
+
+from celery import shared_task
+
+from . import a2a
+
+
+async def _run_message(rpc_id, task_id, context_id, user_msg_raw, user_text, push_config, owner):
+    try:
+        task = await a2a.run_message(task_id, user_msg_raw, user_text, context_id)
+    except Exception as e:
+        agent_msg = a2a.agent_message(f"Sorry, something went wrong while processing your request. {e}", task_id)
+        task = a2a.build_task(task_id, context_id, "failed", agent_msg, a2a.user_message(user_msg_raw, task_id))
+    a2a.save_task(task, owner)
+    if push_config and push_config.get("url"):
+        await a2a.push_task(push_config, rpc_id, task)
+    return task["status"]["state"]
+
+
+@shared_task(ignore_result=True)
+def run_message(rpc_id, task_id, context_id, user_msg_raw, user_text, push_config=None, owner=None):
+    """Finish a non-blocking ``message/send`` off the web worker.
+
+    ``owner`` (``a2a.requester``) is the only client ``tasks/get`` serves the task to.
+    """
+    return asyncio.run(_run_message(rpc_id, task_id, context_id, user_msg_raw, user_text, push_config, owner))
@@ -1,3 +1,304 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+
+from prices import symbols
+from prices.services import _comparison_row, build_multi_task_response
+from prices.symbols import SymbolIndex
+
+from . import a2a, services
+from .caches import analysis_key, rerender
+from .fastpath import fast_parse
+from .services import _date_phrase
+
+TODAY = date(2025, 6, 10)
+
+
+class FastPathTests(SimpleTestCase):
+    def setUp(self):
+        saved = symbols._current
+        self.addCleanup(setattr, symbols, "_current", saved)
+        index = SymbolIndex.from_inst_ids({"BTC-USDT", "ETH-USDT", "NOT-USDT", "ONE-USDT", "PEOPLE-USDT"})
+        symbols.install_index(index, 60)
+
+    def symbols_of(self, text):
+        parsed = fast_parse(text, TODAY)
+        return None if parsed is None else [a["symbol"] for a in parsed["assets"]]
+
+    def test_plain_tickers_and_names(self):
+        self.assertEqual(self.symbols_of("btc yesterday"), ["BTC"])
+        self.assertEqual(fast_parse("btc yesterday", TODAY)["date"], "2025-06-09")
+        self.assertEqual(self.symbols_of("compare bitcoin and eth 3 days ago"), ["BTC", "ETH"])
+
+    def test_word_tickers_without_a_cue_go_to_the_model(self):
+        self.assertIsNone(fast_parse("is it not going up?", TODAY))
+        self.assertIsNone(fast_parse("not yesterday", TODAY))
+        self.assertIsNone(fast_parse("price of one", TODAY))
+        self.assertIsNone(fast_parse("PEOPLE YESTERDAY", TODAY))
+
+    def test_word_tickers_with_a_cue(self):
+        self.assertEqual(self.symbols_of("$not yesterday"), ["NOT"])
+        self.assertEqual(self.symbols_of("NOT price yesterday"), ["NOT"])
+        self.assertEqual(self.symbols_of("one usdt price"), ["ONE"])
+        self.assertEqual(self.symbols_of("btc and PEOPLE last week"), ["BTC", "PEOPLE"])
+
+
+class DatePhraseTests(SimpleTestCase):
+    def test_absolute_dates_stay_absolute(self):
+        self.assertEqual(_date_phrase("2025-03-03", "btc on march 3rd"), "2025-03-03")
+        self.assertEqual(_date_phrase("2025-03-03", "btc 2025-03-03"), "2025-03-03")
+
+    def test_relative_dates_are_kept_relative(self):
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        self.assertEqual(_date_phrase(yesterday, "btc yesterday"), "1 days ago")
+        self.assertEqual(_date_phrase(date.today().isoformat(), "eth price now"), "today")
+        self.assertEqual(_date_phrase("yesterday", "btc yesterday"), "yesterday")
+
+
+class AnalysisCacheTests(SimpleTestCase):
+    def test_rerender_replaces_whole_figures_only(self):
+        text = "BTC was $42.00 and is now $45,300.50, up 2.0000% (2.00%)."
+        old = {"current_price": "45300.50", "percent_change": "2.0000"}
+        new = {"current_price": "45345.10", "percent_change": "2.1005"}
+        self.assertEqual(
+            rerender(text, old, new),
+            "BTC was $42.00 and is now $45,345.10, up 2.1005% (2.10%).",
+        )
+
+    def test_rerender_does_not_chain_replacements(self):
+        old = {"current_price": "10", "percent_change": "20"}
+        new = {"current_price": "20", "percent_change": "30"}
+        self.assertEqual(rerender("now 10, up 20%", old, new), "now 20, up 30%")
+
+    def test_zero_band_disables_banding(self):
+        figures = {"asset": "bitcoin", "date": "2025-01-01", "current_price": "100.5", "direction": "increase"}
+        with self.settings(ANALYSIS_CACHE_BAND_PCT=0):
+            self.assertEqual(analysis_key(figures)[2], Decimal("100.5"))
+        with self.settings(ANALYSIS_CACHE_BAND_PCT=0.5):
+            self.assertIsInstance(analysis_key(figures)[2], int)
+
+
+@override_settings(GEMINI_PARSE_TIMEOUT=0.05, GEMINI_ANALYSIS_TIMEOUT=0.05)
+class GeminiDeadlineTests(SimpleTestCase):
+    def setUp(self):
+        services.parse_cache.clear()
+
+    def patch_model(self, name, fn):
+        patcher = mock.patch.object(services.client.aio.models, name, side_effect=fn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def slow_generate(self, **kwargs):
+        await asyncio.sleep(1)
+
+    async def test_slow_parse_maps_to_parse_timeout(self):
+        self.patch_model("generate_content", self.slow_generate)
+        result = await services.parse_text("what do you think about the markets lately")
+        self.assertEqual(result["error"], "PARSE_TIMEOUT")
+
+    async def test_slow_analysis_maps_to_response_timeout(self):
+        self.patch_model("generate_content", self.slow_generate)
+        self.assertEqual(json.loads(await services.response_text({}))["error"], "RESPONSE_TIMEOUT")
+
+    async def test_stream_timeout_keeps_the_partial_analysis(self):
+        async def chunks():
+            yield SimpleNamespace(text="Bitcoin rose")
+            await asyncio.sleep(1)
+            yield SimpleNamespace(text=" sharply")
+
+        async def stream(**kwargs):
+            return chunks()
+
+        self.patch_model("generate_content_stream", stream)
+        parts = [chunk async for chunk in services.response_text_stream({})]
+        self.assertEqual(parts[0], "Bitcoin rose")
+        self.assertEqual(json.loads(parts[1])["error"], "RESPONSE_TIMEOUT")
+
+    async def test_slow_consumer_does_not_use_up_the_deadline(self):
+        async def chunks():
+            for text in ("a", "b"):
+                yield SimpleNamespace(text=text)
+
+        async def stream(**kwargs):
+            return chunks()
+
+        self.patch_model("generate_content_stream", stream)
+        parts = []
+        async for chunk in services.generate_stream("prompt", 0.05):
+            parts.append(chunk)
+            await asyncio.sleep(0.1)
+        self.assertEqual(parts, ["a", "b"])
+
+
+class A2ATaskTests(SimpleTestCase):
+    URL = "/api/v1/a2a/crypto"
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(a2a, "task_store_is_shared", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rpc(self, rpc_id, method, params):
+        return {"jsonrpc": "2.0", "id": rpc_id, "method": method, "params": params}
+
+    async def test_task_ids_are_issued_by_the_server_and_owned(self):
+        message = {"kind": "message", "role": "user", "messageId": "m1", "parts": [{"kind": "text", "text": "btc"}]}
+        send = self.rpc("1", "message/send", {"message": message, "configuration": {"blocking": False}})
+        with mock.patch("ai.views.run_message.delay") as delay:
+            r = await self.async_client.post(self.URL, send, content_type="application/json", headers={"X-API-KEY": "a"})
+        task = r.json()["result"]
+        self.assertEqual(r.json()["id"], "1")
+        self.assertRegex(task["id"], r"^[0-9a-f]{32}$")
+        self.assertEqual(delay.call_args.args[1], task["id"])
+
+        get = self.rpc("2", "tasks/get", {"id": task["id"]})
+        r = await self.async_client.post(self.URL, get, content_type="application/json", headers={"X-API-KEY": "a"})
+        self.assertEqual(r.json()["result"]["id"], task["id"])
+        r = await self.async_client.post(self.URL, get, content_type="application/json", headers={"X-API-KEY": "b"})
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(r.json()["error"]["code"], -32001)
+
+    def non_blocking(self):
+        message = {"kind": "message", "role": "user", "messageId": "m1", "parts": [{"kind": "text", "text": "btc"}]}
+        return self.rpc("1", "message/send", {"message": message, "configuration": {"blocking": False}})
+
+    async def test_non_blocking_needs_a_shared_task_store(self):
+        with mock.patch.object(a2a, "task_store_is_shared", return_value=False), \
+                mock.patch("ai.views.run_message.delay") as delay:
+            r = await self.async_client.post(self.URL, self.non_blocking(), content_type="application/json")
+        self.assertEqual(r.json()["error"]["code"], -32004)
+        delay.assert_not_called()
+
+    async def test_enqueue_failure_marks_the_task_failed(self):
+        with mock.patch("ai.views.run_message.delay", side_effect=ConnectionError("broker down")):
+            r = await self.async_client.post(self.URL, self.non_blocking(), content_type="application/json")
+        task = r.json()["result"]
+        self.assertEqual(task["status"]["state"], "failed")
+        get = self.rpc("2", "tasks/get", {"id": task["id"]})
+        r = await self.async_client.post(self.URL, get, content_type="application/json")
+        self.assertEqual(r.json()["result"]["status"]["state"], "failed")
+
+    async def test_message_without_a_text_part(self):
+        message = {"kind": "message", "role": "user", "messageId": "m1",
+                   "parts": [{"kind": "data", "data": {"symbol": "BTC"}}]}
+        chat = {"mode": "chat", "message": "What would you like to know?"}
+        with mock.patch.object(a2a, "parse_text", return_value=chat) as parse:
+            r = await self.async_client.post(
+                self.URL, self.rpc("1", "message/send", {"message": message}), content_type="application/json",
+            )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["result"]["status"]["state"], "completed")
+        parse.assert_called_once_with("")
+
+    async def test_every_path_keeps_the_normalised_user_message(self):
+        raw = {"role": "user", "parts": [{"kind": "text", "text": "btc trend"}]}
+        with mock.patch.object(a2a, "parse_text", return_value={"intent": "trend", "symbol": "BTC"}), \
+                mock.patch.object(a2a, "get_trend", side_effect=ValueError("no data")):
+            task = await a2a.run_message("t1", raw, "btc trend")
+        self.assertEqual(task["status"]["state"], "failed")
+        self.assertEqual(task["history"][0]["kind"], "message")
+        self.assertTrue(task["history"][0]["messageId"])
+
+        failed = {"error": True, "details": "unknown symbol"}
+        with mock.patch.object(a2a, "parse_text", return_value={"symbol": "ZZZ"}), \
+                mock.patch.object(a2a, "get_comparison", return_value=failed):
+            task = await a2a.run_message("t2", raw, "zzz")
+        self.assertEqual(task["status"]["state"], "failed")
+        self.assertTrue(task["history"][0]["messageId"])
+
+    async def test_multi_asset_task_has_an_artifact_per_asset(self):
+        day = date(2025, 1, 1)
+        rows = [_comparison_row("BTC", Decimal("100"), Decimal("110"), day),
+                _comparison_row("ETH", Decimal("10"), Decimal("9"), day)]
+        comp = build_multi_task_response(rows, {}, day, {})
+        parsed = {"assets": [{"symbol": "BTC"}, {"symbol": "ETH"}], "date": "2025-01-01"}
+        with mock.patch.object(a2a, "parse_text", return_value=parsed), \
+                mock.patch.object(a2a, "get_multi_comparison", return_value=comp), \
+                mock.patch.object(a2a, "response_text", return_value="analysis"):
+            task = await a2a.run_message("t3", {"role": "user", "parts": []}, "btc and eth")
+        self.assertEqual(task["status"]["state"], "completed")
+        self.assertEqual(task["artifacts"][0]["parts"][0]["text"], "analysis")
+        per_asset = [a["parts"][0]["data"] for a in task["artifacts"][1:]]
+        self.assertEqual([row["asset"] for row in per_asset], [row["asset"] for row in rows])
+
+
+class BatchTests(SimpleTestCase):
+    URL = A2ATaskTests.URL
+
+    def setUp(self):
+        patcher = mock.patch("ai.views.fetch_okx_symbols")
+        self.fetch_symbols = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.running = self.peak = 0
+
+        async def run_message(task_id, message, user_text):
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            # Later elements finish first
+            await asyncio.sleep(0.05 / int(user_text))
+            self.running -= 1
+            return {"id": task_id, "text": user_text}
+
+        patcher = mock.patch.object(a2a, "run_message", side_effect=run_message)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, rpc_id, text):
+        message = {"kind": "message", "role": "user", "messageId": "m", "parts": [{"kind": "text", "text": text}]}
+        return {"jsonrpc": "2.0", "id": rpc_id, "method": "message/send", "params": {"message": message}}
+
+    async def post(self, bodies):
+        return await self.async_client.post(self.URL, bodies, content_type="application/json")
+
+    async def test_responses_keep_request_order(self):
+        r = await self.post([self.send(str(i), str(i)) for i in range(1, 6)])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([item["id"] for item in r.json()], ["1", "2", "3", "4", "5"])
+        self.assertEqual([item["result"]["text"] for item in r.json()], ["1", "2", "3", "4", "5"])
+
+    async def test_errors_stay_with_their_element(self):
+        stream = {**self.send("3", "1"), "method": "message/stream"}
+        r = await self.post([self.send("1", "1"), 42, stream, {"jsonrpc": "2.0", "id": "4", "method": "nope"}])
+        items = r.json()
+        self.assertEqual(items[0]["result"]["text"], "1")
+        self.assertEqual([item.get("error", {}).get("code") for item in items[1:]], [-32600, -32600, -32603])
+        self.assertEqual([item["id"] for item in items], ["1", None, "3", "4"])
+
+    async def test_notifications_get_no_response(self):
+        notification = self.send("x", "1")
+        del notification["id"]
+        r = await self.post([notification, self.send("1", "2")])
+        self.assertEqual([item["id"] for item in r.json()], ["1"])
+        r = await self.post([notification, notification])
+        self.assertEqual(r.status_code, 204)
+        self.assertEqual(r.content, b"")
+
+    @override_settings(A2A_BATCH_CONCURRENCY=2)
+    async def test_concurrency_is_capped(self):
+        r = await self.post([self.send(str(i), "1") for i in range(6)])
+        self.assertEqual(len(r.json()), 6)
+        self.assertEqual(self.peak, 2)
+
+    @override_settings(A2A_BATCH_MAX_SIZE=2)
+    async def test_oversized_batch_is_one_error(self):
+        r = await self.post([self.send(str(i), "1") for i in range(3)])
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json()["error"]["code"], -32600)
+        self.assertIsNone(r.json()["id"])
+
+    async def test_task_lookups_skip_the_symbol_index(self):
+        get = {"jsonrpc": "2.0", "id": "1", "method": "tasks/get", "params": {"id": "unknown"}}
+        r = await self.post([get, {**get, "id": "2"}])
+        self.assertEqual([item["error"]["code"] for item in r.json()], [-32001, -32001])
+        self.fetch_symbols.assert_not_called()
+        await self.post([get, self.send("3", "1")])
+        self.fetch_symbols.assert_called_once()
@@ -1,30 +1,108 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from asgiref.sync import async_to_sync
-from datetime import datetime
-import uuid
-
-from .services import parse_text, response_text
-from prices.services import get_comparison
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+import asyncio
+import json
+
+from core import envelopes
+from core.renderers import ORJSONResponse, dumps
+
+from . import a2a
+from .services import parse_text, response_text_stream
+from .tasks import run_message
+from prices.services import comparison_rows, fetch_okx_symbols
 from .models import (
     JSONRPCRequest, JSONRPCResponse, TaskResult, TaskStatus,
     A2AMessage, Artifact, MessagePart
 )
 
-class A2ACryptoAPIView(APIView):
-    """A2A endpoint for Telex crypto agent"""
 
-    def post(self, request):
-        body = request.data
+def _is_notification(body) -> bool:
+    """A well-formed JSON-RPC request without an ``id`` member."""
+    return isinstance(body, dict) and "id" not in body and bool(body.get("jsonrpc")) and bool(body.get("method"))
+
+
+def _sse(rpc_id, result: dict = None, error: dict = None) -> bytes:
+    """One Server-Sent Event carrying a JSON-RPC response."""
+    payload = envelopes.rpc_result(rpc_id, result) if error is None else envelopes.rpc_error(rpc_id, **error)
+    return b"data: " + dumps(payload) + b"\n\n"
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class A2ACryptoAPIView(View):
+    """A2A endpoint for Telex crypto agent.
+
+    Native async view: under ASGI (core.asgi) a single worker keeps many
+    requests in flight while they await Gemini and OKX. ``message/stream``
+    answers with Server-Sent Events: a ``working`` status with the prices,
+    the analysis as it is generated, then the ``completed`` task.
+    """
+
+    http_method_names = ["post"]
+
+    async def post(self, request):
+        try:
+            body = json.loads(request.body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return ORJSONResponse(envelopes.rpc_error(None, -32700, "Parse error"), status=400)
+
+        if isinstance(body, list):
+            payload, status = await self.batch(body)
+            if payload is None:
+                return HttpResponse(status=204)
+            return ORJSONResponse(payload, safe=False, status=status)
+
+        payload, status = await self.handle(body)
+        if isinstance(payload, StreamingHttpResponse):
+            return payload
+        return ORJSONResponse(payload, status=status)
+
+    async def batch(self, bodies: list):
+        """Run a JSON-RPC batch concurrently; return ``(payload, status)``.
+
+        Responses keep request order. At most ``A2A_BATCH_CONCURRENCY``
+        elements run at once. Elements that ask for the same symbol or price
+        share one upstream lookup through the symbol index and single-flight
+        (``prices.singleflight``). Notifications (elements without an ``id``)
+        get no response, as JSON-RPC requires; a batch of nothing else
+        answers with no payload at all.
+        """
+        if not bodies:
+            return envelopes.rpc_error(None, -32600, "Invalid Request"), 400
+        if len(bodies) > settings.A2A_BATCH_MAX_SIZE:
+            return envelopes.rpc_error(None, -32600, f"Batch too large (max {settings.A2A_BATCH_MAX_SIZE})"), 400
+
+        requests = [b for b in bodies if not _is_notification(b)]
+        if not requests:
+            return None, 204
+
+        # Load the symbol index once for the whole batch, if anything needs it
+        if any(isinstance(b, dict) and b.get("method") != "tasks/get" for b in requests):
+            await fetch_okx_symbols()
+
+        semaphore = asyncio.Semaphore(settings.A2A_BATCH_CONCURRENCY)
+
+        async def run(body):
+            async with semaphore:
+                payload, _ = await self.handle(body, streaming=False)
+                return payload
+
+        return list(await asyncio.gather(*(run(b) for b in requests))), 200
+
+    async def handle(self, body, streaming: bool = True):
+        """Handle one JSON-RPC request object; return ``(payload, status)``.
+
+        For ``message/stream`` the payload is the ``StreamingHttpResponse``.
+        """
+        if not isinstance(body, dict):
+            body = {}
         request_id = body.get("id")
 
         # ✅ Basic JSON-RPC validation
         if not body.get("jsonrpc") or not request_id:
-            return Response({
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {"code": -32600, "message": "Invalid Request"}
-            }, status=400)
+            return envelopes.rpc_error(request_id, -32600, "Invalid Request"), 400
 
         try:
             # Extract last message text
@@ -32,7 +110,7 @@ class A2ACryptoAPIView(APIView):
             params = body.get("params", {})
 
             last_message_dict = None
-            if method == "message/send":
+            if method in ("message/send", "message/stream"):
                 last_message_dict = params.get("message")
             elif method == "execute":
                 msgs = params.get("messages")
@@ -53,7 +131,15 @@ class A2ACryptoAPIView(APIView):
             # ✅ Validate using schema AFTER sanitizing
             rpc_request = JSONRPCRequest(**body)
 
-            if rpc_request.method == "message/send":
+            if rpc_request.method == "tasks/get":
+                task = a2a.get_task(
+                    rpc_request.params.id, a2a.requester(self.request), rpc_request.params.historyLength,
+                )
+                if task is None:
+                    return envelopes.rpc_error(rpc_request.id, -32001, "Task not found"), 404
+                return envelopes.rpc_result(rpc_request.id, task), 200
+
+            if rpc_request.method in ("message/send", "message/stream"):
                 # Convert model object to dict if needed
                 msg_obj = rpc_request.params.message
                 if hasattr(msg_obj, "model_dump"):
@@ -64,148 +150,118 @@ class A2ACryptoAPIView(APIView):
                 msgs = rpc_request.params.messages
                 messages = [m.model_dump() if hasattr(m, "model_dump") else m for m in msgs]
             else:
-                return Response({
-                    "jsonrpc": "2.0",
-                    "id": rpc_request.id,
-                    "error": {"code": -32601, "message": "Method not found"}
-                }, status=400)
+                return envelopes.rpc_error(rpc_request.id, -32601, "Method not found"), 400
+
+            if rpc_request.method == "message/stream":
+                if not streaming:
+                    return envelopes.rpc_error(rpc_request.id, -32600, "message/stream is not supported in a batch"), 400
+                response = StreamingHttpResponse(
+                    self.stream(rpc_request.id, messages, user_text),
+                    content_type="text/event-stream",
+                )
+                response["Cache-Control"] = "no-cache"
+                # Stop nginx-style proxies from buffering the event stream
+                response["X-Accel-Buffering"] = "no"
+                return response, 200
+
+            # ✅ The JSON-RPC id only labels the response; the task id is ours
+            task_id = a2a.new_task_id()
+            configuration = getattr(rpc_request.params, "configuration", None)
+
+            if configuration is not None and not configuration.blocking:
+                # ✅ Non-blocking: answer "working" now, finish on a Celery worker
+                if not a2a.task_store_is_shared():
+                    return envelopes.rpc_error(
+                        rpc_request.id, -32004,
+                        "Non-blocking requests need a shared task store (set CACHE_REDIS_URL)",
+                    ), 400
+                context_id = envelopes.new_id()
+                user_msg = a2a.user_message(messages[-1], task_id)
+                agent_msg = a2a.agent_message("Working on it. I'll let you know when the analysis is ready.", task_id)
+                task = a2a.build_task(task_id, context_id, "working", agent_msg, user_msg)
+                owner = a2a.requester(self.request)
+                a2a.save_task(task, owner)
+                push = configuration.pushNotificationConfig
+                try:
+                    run_message.delay(
+                        rpc_request.id, task_id, context_id, messages[-1], user_text,
+                        push.model_dump() if push else None, owner,
+                    )
+                except Exception as e:
+                    # The task was saved before enqueueing so a fast worker's result
+                    # isn't overwritten; don't leave it "working" forever
+                    agent_msg = a2a.agent_message(f"Sorry, the request could not be queued. {e}", task_id)
+                    task = a2a.build_task(task_id, context_id, "failed", agent_msg, user_msg)
+                    a2a.save_task(task, owner)
+                return envelopes.rpc_result(rpc_request.id, task), 200
+
+            task = await a2a.run_message(task_id, messages[-1], user_text)
+            return envelopes.rpc_result(rpc_request.id, task), 200
 
-            # Parse crypto intent
-            parsed = async_to_sync(parse_text)(user_text)
+        except Exception as e:
+            return envelopes.rpc_error(request_id, -32603, "Internal error", str(e)), 500
+
+    async def stream(self, rpc_id, messages, user_text):
+        """Event stream for ``message/stream``.
 
+        Every event is a JSON-RPC response whose ``result`` is an A2A
+        ``status-update``, ``artifact-update`` or the final ``task``.
+        """
+        task_id = a2a.new_task_id()
+        context_id = envelopes.new_id()
+        user_msg = a2a.user_message(messages[-1], task_id)
+        try:
+            parsed = await parse_text(user_text)
 
-            # ✅ Chat mode → normal friendly assistant reply
             if parsed.get("mode") == "chat":
-                reply_text = parsed.get("message", "")
-                msg_id = str(uuid.uuid4())
-                task_id = rpc_request.id or str(uuid.uuid4())
-                now = datetime.utcnow().isoformat() + "Z"
-                # Build agent message as a plain dict to match external schema strictly
-                msg = {
-                    "kind": "message",
-                    "role": "agent",
-                    "messageId": msg_id,
-                    "parts": [{"kind": "text", "text": reply_text}],
-                    "taskId": task_id,
-                }
-                # Ensure user message has messageId and convert to model
-                user_msg_raw = messages[-1]
-                if isinstance(user_msg_raw, dict):
-                    if "messageId" not in user_msg_raw:
-                        user_msg_raw = dict(user_msg_raw)
-                        user_msg_raw["messageId"] = str(uuid.uuid4())
-                    user_msg = dict(user_msg_raw)
-                    # ensure kind present
-                    user_msg.setdefault("kind", "message")
-                else:
-                    user_msg = {
-                        "kind": "message",
-                        "role": "user",
-                        "messageId": str(uuid.uuid4()),
-                        "parts": [p for p in (getattr(user_msg_raw, "parts", []) or [])],
-                        "taskId": task_id,
-                    }
-                # Build response as plain dict to ensure exact schema
-                task = {
-                    "id": task_id,
-                    "contextId": "chat",
-                    "status": {
-                        "state": "completed",
-                        "timestamp": now,
-                        "message": msg,
-                    },
-                    "artifacts": [],
-                    "history": [user_msg, msg],
-                    "kind": "task",
-                }
-                return Response({"jsonrpc": "2.0", "id": rpc_request.id, "result": task})
-
-            # ✅ Crypto data mode
-            dt = parsed.get("date")
-            symbol = parsed.get("symbol")
-            comp = async_to_sync(get_comparison)(symbol, dt)
-            msg_id = str(uuid.uuid4())
-            task_id = rpc_request.id or str(uuid.uuid4())
-            now = datetime.utcnow().isoformat() + "Z"
-
-            # Check for errors in the response
+                msg = a2a.agent_message(parsed.get("message", ""), task_id)
+                yield _sse(rpc_id, a2a.build_task(task_id, "chat", "completed", msg, user_msg))
+                return
+
+            if parsed.get("intent") == "trend":
+                yield _sse(rpc_id, await a2a.trend_task(task_id, context_id, parsed, user_msg))
+                return
+
+            symbol, comp = await a2a.compare(parsed)
             if isinstance(comp, dict) and comp.get("error"):
-                error_msg = comp.get("details", "An error occurred while fetching the data")
-                agent_msg = {
-                    "kind": "message",
-                    "role": "agent",
-                    "messageId": msg_id,
-                    "parts": [{"kind": "text", "text": f"Sorry, I couldn't get the price information for {symbol}. {error_msg}"}],
-                    "taskId": task_id,
-                }
-                
-                # Return error response
-                task = {
-                    "id": task_id,
-                    "contextId": str(uuid.uuid4()),
-                    "status": {
-                        "state": "failed",
-                        "timestamp": now,
-                        "message": agent_msg,
-                    },
-                    "artifacts": [],
-                    "history": [messages[-1], agent_msg],
-                    "kind": "task",
-                }
-                return Response({"jsonrpc": "2.0", "id": rpc_request.id, "result": task})
-
-            # If no errors, proceed with analysis
-            analysis_text = async_to_sync(response_text)(comp)
-            symbol_display = symbol if symbol else "the asset"
-            confirmation_text = f"I've analyzed the price information for {symbol_display}. You can find the detailed analysis in the artifacts."
-            agent_msg = {
-                "kind": "message",
-                "role": "agent",
-                "messageId": msg_id,
-                "parts": [{"kind": "text", "text": confirmation_text}],
-                "taskId": task_id,
-            }
-
-            # Build artifact with the detailed analysis
-            artifact_1 = {
-                "artifactId": str(uuid.uuid4()),
-                "name": "comparison_data",
-                "parts": [{"kind": "text", "text": analysis_text}]
-            }
-
-            # Ensure user message has messageId and is a dict
-            user_msg_raw = messages[-1]
-            if isinstance(user_msg_raw, dict):
-                user_msg = dict(user_msg_raw)
-                user_msg.setdefault("kind", "message")
-                user_msg.setdefault("messageId", str(uuid.uuid4()))
-            else:
-                user_msg = {
-                    "kind": "message",
-                    "role": "user",
-                    "messageId": str(uuid.uuid4()),
-                    "parts": [p for p in (getattr(user_msg_raw, "parts", []) or [])],
-                    "taskId": task_id,
-                }
+                agent_msg = a2a.agent_message(a2a.comparison_error_text(symbol, comp), task_id)
+                yield _sse(rpc_id, a2a.build_task(task_id, context_id, "failed", agent_msg, user_msg))
+                return
 
-            task = {
-                "id": task_id,
-                "contextId": str(uuid.uuid4()),
+            # ✅ Prices first, before any analysis is generated
+            summary = comp["result"]["status"]["message"]["parts"][0]["text"]
+            rows = comparison_rows(comp)
+            figures = rows[0] if len(rows) == 1 else {"comparisons": rows}
+            yield _sse(rpc_id, {
+                "kind": "status-update",
+                "taskId": task_id,
+                "contextId": context_id,
                 "status": {
-                    "state": "completed",
-                    "timestamp": now,
-                    "message": agent_msg,
+                    "state": "working",
+                    "timestamp": a2a.now(),
+                    "message": a2a.agent_message(summary, task_id, figures),
                 },
-                "artifacts": [artifact_1],
-                "history": [user_msg, agent_msg],
-                "kind": "task",
-            }
-            return Response({"jsonrpc": "2.0", "id": rpc_request.id, "result": task})
+                "final": False,
+            })
 
-        except Exception as e:
-            return Response({
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {"code": -32603, "message": "Internal error", "data": str(e)}
-            }, status=500)
+            # ✅ Analysis chunks as Gemini produces them
+            artifact_id = envelopes.new_id()
+            chunks = []
+            async for chunk in response_text_stream(comp):
+                yield _sse(rpc_id, {
+                    "kind": "artifact-update",
+                    "taskId": task_id,
+                    "contextId": context_id,
+                    "artifact": a2a.analysis_artifact(chunk, artifact_id),
+                    "append": bool(chunks),
+                    "lastChunk": False,
+                })
+                chunks.append(chunk)
 
+            agent_msg = a2a.agent_message(a2a.confirmation_text(symbol), task_id)
+            artifact = a2a.analysis_artifact("".join(chunks).strip(), artifact_id, a2a.staleness(comp))
+            artifacts = [artifact, *a2a.asset_artifacts(comp)]
+            yield _sse(rpc_id, a2a.build_task(task_id, context_id, "completed", agent_msg, user_msg, artifacts))
+
+        except Exception as e:
+            yield _sse(rpc_id, error={"code": -32603, "message": "Internal error", "data": str(e)})
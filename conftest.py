@@ -0,0 +1,21 @@
+import os
+
+import django
+import pytest
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+# ai.services refuses to import without a key; tests never call Gemini
+os.environ.setdefault("GEMINI_API_KEY", "test")
+django.setup()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_databases():
+    """Migrated test databases, as ``manage.py test`` sets up, for the ``TestCase`` classes."""
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(old_config, verbosity=0)
+    teardown_test_environment()
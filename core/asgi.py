@@ -7,10 +7,69 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+
+class CancelOnDisconnect:
+    """Cancel the running request when the HTTP client goes away.
+
+    Django 4.2's ASGI handler stops reading ``receive`` once the body is in,
+    so a client that hangs up mid-request would leave the view (and any
+    Gemini or OKX call it is awaiting) running to completion. This wrapper
+    keeps listening after the body and cancels the request task on
+    ``http.disconnect`` if no response has been completed yet.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        body_read = asyncio.Event()
+        state = {"done": False, "disconnected": False}
+
+        async def tracked_receive():
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                state["disconnected"] = True
+            elif not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["done"] = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, tracked_receive, tracked_send))
+
+        async def watch():
+            await body_read.wait()
+            while not state["done"]:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    state["disconnected"] = True
+                    if not state["done"]:
+                        app_task.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            # Swallow our own cancellation; re-raise if the server cancelled us
+            current = asyncio.current_task()
+            if not state["disconnected"] or (current and current.cancelling()):
+                raise
+        finally:
+            watcher.cancel()
+
+
+application = CancelOnDisconnect(get_asgi_application())
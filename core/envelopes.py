@@ -0,0 +1,76 @@
+"""
+Pre-shaped Telex/A2A response envelopes.
+
+Every builder returns plain dicts in the exact key order of the external
+schema, ready for ``core.renderers``. Per-response costs are kept down:
+
+- one ``timestamp()`` string is taken per envelope and shared by its parts,
+- structured figures travel as ``data`` parts (real JSON objects) rather
+  than Python reprs inside ``text`` parts.
+"""
+import uuid
+from datetime import datetime
+
+
+def new_id() -> str:
+    """Random UUID4 string (dashed, as clients already receive); safe across forked workers."""
+    return str(uuid.uuid4())
+
+
+def timestamp() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def text_part(text: str) -> dict:
+    return {"kind": "text", "text": text}
+
+
+def data_part(data: dict) -> dict:
+    return {"kind": "data", "data": data}
+
+
+def message(role: str, parts: list, task_id: str = None, message_id: str = None) -> dict:
+    return {
+        "kind": "message",
+        "role": role,
+        "messageId": message_id or new_id(),
+        "parts": parts,
+        "taskId": task_id,
+    }
+
+
+def artifact(name: str, parts: list, artifact_id: str = None) -> dict:
+    return {
+        "artifactId": artifact_id or new_id(),
+        "name": name,
+        "parts": parts,
+    }
+
+
+def task(task_id: str, context_id: str, state: str, status_message: dict,
+         artifacts=(), history=None, at: str = None) -> dict:
+    envelope = {
+        "id": task_id,
+        "contextId": context_id,
+        "status": {
+            "state": state,
+            "timestamp": at or timestamp(),
+            "message": status_message,
+        },
+        "artifacts": list(artifacts),
+    }
+    if history is not None:
+        envelope["history"] = history
+    envelope["kind"] = "task"
+    return envelope
+
+
+def rpc_result(rpc_id, result: dict) -> dict:
+    return {"jsonrpc": "2.0", "id": rpc_id, "result": result}
+
+
+def rpc_error(rpc_id, code: int, message: str, data=None) -> dict:
+    error = {"code": code, "message": message}
+    if data is not None:
+        error["data"] = data
+    return {"jsonrpc": "2.0", "id": rpc_id, "error": error}
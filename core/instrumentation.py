@@ -0,0 +1,97 @@
+"""
+Request and upstream instrumentation shared by the apps.
+
+``RequestMetricsMiddleware`` times every request per resolved view (the time
+to produce the response; a streamed body is not included) and counts the
+requests in flight. ``UPSTREAM_RESPONSES`` / ``UPSTREAM_IN_FLIGHT`` are
+updated by the OKX, Binance, CoinGecko and Gemini clients through
+``upstream_call``.
+"""
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+REQUEST_SECONDS = metrics.Histogram(
+    "http_request_duration_seconds",
+    "Time to produce a response, by view, method and status code.",
+    ["view", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = metrics.Gauge(
+    "http_requests_in_flight",
+    "Requests being handled.",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_RESPONSES = metrics.Counter(
+    "upstream_responses_total",
+    "Upstream API calls, by upstream, endpoint and HTTP status (or error kind).",
+    ["upstream", "endpoint", "status"],
+)
+UPSTREAM_IN_FLIGHT = metrics.Gauge(
+    "upstream_requests_in_flight",
+    "Upstream API calls waiting for a response.",
+    ["upstream"],
+    multiprocess_mode="livesum",
+)
+
+METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
+
+
+@contextmanager
+def upstream_call(upstream: str, endpoint: str):
+    """Count one upstream call; set ``call.status`` to the HTTP status on a response.
+
+    An exception leaving the block is counted under its class name.
+    """
+    call = _Call()
+    with UPSTREAM_IN_FLIGHT.labels(upstream=upstream).track_inprogress():
+        try:
+            yield call
+        except BaseException as e:
+            call.status = call.status or type(e).__name__
+            raise
+        finally:
+            UPSTREAM_RESPONSES.labels(upstream=upstream, endpoint=endpoint, status=call.status or "ok").inc()
+
+
+class _Call:
+    status = None
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _observe(request, response, started):
+        match = getattr(request, "resolver_match", None)
+        REQUEST_SECONDS.labels(
+            # Unrouted paths share one label, so scanners can't grow the series
+            view=match.view_name if match else "unmatched",
+            method=request.method if request.method in METHODS else "other",
+            status=response.status_code,
+        ).observe(time.perf_counter() - started)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with REQUESTS_IN_FLIGHT.track_inprogress():
+            response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with REQUESTS_IN_FLIGHT.track_inprogress():
+            response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
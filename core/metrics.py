@@ -0,0 +1,444 @@
+"""
+Lightweight in-process metrics registry.
+
+Counters, gauges and histograms are declared once at module import time and
+updated from request code, e.g.::
+
+    POOL_LOOKUPS = metrics.Counter("okx_pool_lookups_total", "Pool lookups", ["result"])
+    POOL_LOOKUPS.labels(result="hit").inc()
+
+    STAGE_SECONDS = metrics.Histogram("stage_duration_seconds", "Stage latency", ["stage"])
+
+    @STAGE_SECONDS.labels(stage="parse").time()
+    async def parse(text): ...
+
+``snapshot()`` returns the current values of every registered metric in this
+process.
+
+Multi-process mode: with ``METRICS_MULTIPROC_DIR`` set (e.g. several gunicorn
+workers), every process writes its values to its own file in that directory
+every ``METRICS_FLUSH_INTERVAL`` seconds and at exit, and
+``render_prometheus()`` merges all the files, so a scrape that lands on any
+worker sees the whole server. Counters and histograms are summed over every
+process that ever wrote (counts of exited workers are kept); gauges are
+combined over live processes as their ``multiprocess_mode`` says:
+``"liveall"`` (one series per process, with a ``pid`` label), ``"livesum"``,
+``"max"`` or ``"min"``. The directory should start empty on each deploy.
+"""
+import atexit
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+REGISTRY = {}
+
+# Upper bounds (seconds) suited to cache hits through to LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._functions = {}
+        with _lock:
+            REGISTRY[name] = self
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return _Child(self, values)
+
+    def _add(self, key, amount):
+        _exporter.ensure_started()
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _set(self, key, value):
+        _exporter.ensure_started()
+        with _lock:
+            self._values[key] = value
+
+    def _dump(self) -> dict:
+        """This process's values in the multi-process file format."""
+        with _lock:
+            items = list(self._values.items())
+        return {
+            "kind": self.kind,
+            "documentation": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(key), value] for key, value in items]
+            + [[list(labels.values()), value] for labels, value in self._function_samples()],
+        }
+
+    def _function_samples(self):
+        with _lock:
+            functions = list(self._functions.items())
+        samples = []
+        for key, fn in functions:
+            try:
+                samples.append((dict(zip(self.labelnames, key)), fn()))
+            except Exception:
+                continue
+        return samples
+
+    def samples(self):
+        """Return ``[(labels_dict, value), ...]`` for this metric."""
+        with _lock:
+            items = list(self._values.items())
+        return [(dict(zip(self.labelnames, key)), value) for key, value in items] + self._function_samples()
+
+
+class _Child:
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        self._metric._add(self._key, amount)
+
+    def dec(self, amount=1):
+        self._metric._add(self._key, -amount)
+
+    def set(self, value):
+        self._metric._set(self._key, value)
+
+    def set_function(self, fn):
+        with _lock:
+            self._metric._functions[self._key] = fn
+
+    def observe(self, value):
+        self._metric._observe(self._key, value)
+
+    def time(self):
+        """Observe the duration of a block, or of every call to a function."""
+        return _Timer(self.observe)
+
+    def track_inprogress(self):
+        """Raise the gauge while a block (or every call to a function) runs."""
+        return _InProgress(self)
+
+
+class _Scope:
+    """Context manager that also decorates sync and async functions."""
+
+    def __enter__(self):
+        self._start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop()
+
+    def __call__(self, fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                scope = self._copy()
+                scope._start()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    scope._stop()
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                scope = self._copy()
+                scope._start()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    scope._stop()
+        return wrapper
+
+
+class _Timer(_Scope):
+    def __init__(self, observe):
+        self._observe = observe
+
+    def _copy(self):
+        return _Timer(self._observe)
+
+    def _start(self):
+        self._started = time.perf_counter()
+
+    def _stop(self):
+        self._observe(time.perf_counter() - self._started)
+
+
+class _InProgress(_Scope):
+    def __init__(self, child):
+        self._child = child
+
+    def _copy(self):
+        return self
+
+    def _start(self):
+        self._child.inc()
+
+    def _stop(self):
+        self._child.dec()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), multiprocess_mode: str = "liveall"):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"{name}: multiprocess_mode must be one of {', '.join(GAUGE_MODES)}")
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames)
+
+    def _dump(self) -> dict:
+        return {**super()._dump(), "multiprocess_mode": self.multiprocess_mode}
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, fn):
+        """Evaluate ``fn()`` lazily whenever the gauge is read."""
+        self.labels().set_function(fn)
+
+    def track_inprogress(self):
+        return self.labels().track_inprogress()
+
+
+GAUGE_MODES = ("liveall", "livesum", "max", "min")
+
+
+def _histogram_value(buckets, counts: list) -> dict:
+    cumulative, running = [], 0
+    for count in counts[:-1]:
+        running += count
+        cumulative.append(running)
+    return {"buckets": list(zip(tuple(buckets) + (float("inf"),), cumulative)), "sum": counts[-1], "count": running}
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; a sample's value is ``{"buckets", "sum", "count"}``."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _observe(self, key, value):
+        _exporter.ensure_started()
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with _lock:
+            # Per-bucket (not cumulative) counts, the last one for +Inf, then the sum
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with _lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        return [(dict(zip(self.labelnames, key)), _histogram_value(self.buckets, counts)) for key, counts in items]
+
+    def _dump(self) -> dict:
+        return {**super()._dump(), "buckets": list(self.buckets)}
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+def snapshot() -> dict:
+    """Return ``{metric_name: [(labels, value), ...]}`` for all metrics."""
+    with _lock:
+        metrics = list(REGISTRY.values())
+    return {m.name: m.samples() for m in metrics}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class _Exporter:
+    """Writes this process's metrics to ``METRICS_MULTIPROC_DIR`` in the background."""
+
+    def __init__(self):
+        self._pid = None
+        self._path = None
+        self._directory = None
+        self._checked = False
+        self._lock = threading.Lock()
+
+    def directory(self):
+        if not self._checked:
+            from django.conf import settings
+            if not settings.configured:
+                return None
+            self._directory = getattr(settings, "METRICS_MULTIPROC_DIR", None)
+            self._checked = True
+        return self._directory
+
+    def ensure_started(self):
+        # Started lazily, and again in each forked worker
+        pid = os.getpid()
+        if self._pid == pid or not self.directory():
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            os.makedirs(self._directory, exist_ok=True)
+            # The pid names the file for liveness checks; the suffix keeps a
+            # reused pid from overwriting an exited worker's counts
+            self._path = os.path.join(self._directory, f"metrics_{pid}_{uuid.uuid4().hex[:8]}.json")
+            self._pid = pid
+            threading.Thread(target=self._run, name="metrics-exporter", daemon=True).start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        from django.conf import settings
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        with _lock:
+            metrics = list(REGISTRY.values())
+        data = {m.name: m._dump() for m in metrics}
+        tmp = f"{self._path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._path)
+
+
+_exporter = _Exporter()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_histograms(a: list, b: list) -> list:
+    return [x + y for x, y in zip(a, b)]
+
+
+def collect() -> list:
+    """``[(name, kind, documentation, [(labels, value), ...]), ...]`` to render.
+
+    In multi-process mode this merges the files of every process (this one
+    is flushed first); otherwise it reads the in-process registry.
+    """
+    _exporter.ensure_started()
+    if _exporter.directory() is None:
+        with _lock:
+            metrics = sorted(REGISTRY.values(), key=lambda m: m.name)
+        return [(m.name, m.kind, m.documentation, m.samples()) for m in metrics]
+
+    _exporter.flush()
+    merged = {}
+    for path in glob.glob(os.path.join(_exporter.directory(), "metrics_*.json")):
+        pid = int(os.path.basename(path).split("_")[1])
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = pid == os.getpid() or _alive(pid)
+        for name, metric in data.items():
+            entry = merged.setdefault(name, {**metric, "values": {}})
+            mode = metric.get("multiprocess_mode")
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if mode == "liveall":
+                    key += (str(pid),)
+                if key not in entry["values"]:
+                    entry["values"][key] = value
+                elif metric["kind"] == "histogram":
+                    entry["values"][key] = _merge_histograms(entry["values"][key], value)
+                elif mode == "max":
+                    entry["values"][key] = max(entry["values"][key], value)
+                elif mode == "min":
+                    entry["values"][key] = min(entry["values"][key], value)
+                else:
+                    entry["values"][key] = entry["values"][key] + value
+
+    collected = []
+    for name in sorted(merged):
+        entry = merged[name]
+        labelnames = entry["labelnames"] + (["pid"] if entry.get("multiprocess_mode") == "liveall" else [])
+        if entry["kind"] == "histogram":
+            samples = [(dict(zip(labelnames, k)), _histogram_value(entry["buckets"], v)) for k, v in entry["values"].items()]
+        else:
+            samples = [(dict(zip(labelnames, k)), v) for k, v in entry["values"].items()]
+        collected.append((name, entry["kind"], entry["documentation"], samples))
+    return collected
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    lines = []
+    for name, kind, documentation, samples in collect():
+        lines.append(f"# HELP {name} {_escape(documentation)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            if kind == "histogram":
+                prefix = f"{label_text}," if label_text else ""
+                for bound, count in value["buckets"]:
+                    lines.append(f'{name}_bucket{{{prefix}le="{_format_bound(bound)}"}} {_format_value(count)}')
+                suffix = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"{name}_sum{suffix} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{suffix} {_format_value(value['count'])}")
+                continue
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
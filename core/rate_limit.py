@@ -1,34 +1,367 @@
+"""
+Request rate limiting.
+
+Off unless ``RATE_LIMIT_ENABLED`` is set. Each client then gets a token
+bucket: ``RATE_LIMIT_DEFAULT`` (e.g. ``"30/m"``) is the bucket size, refilled
+evenly over the period, so short bursts are allowed but the long-run rate is
+capped. ``RATE_LIMIT_KEYS`` gives individual API keys their own limits; a
+request whose ``X-API-KEY`` is one of them uses that key's bucket, and every
+other request (unknown key or none) uses its client IP's bucket, so sending
+made-up keys can't buy fresh buckets.
+
+Backends:
+
+- ``RedisBackend`` (``RATE_LIMIT_REDIS`` set) keeps buckets in Redis, shared
+  by every worker. Refill, check and debit are one Lua script, so a decision
+  is a single atomic round trip with no read-then-write race.
+- ``MemoryBackend`` (no Redis) keeps buckets in this process. It is also
+  used, failing open, while Redis is unreachable.
+
+To cut Redis traffic for hot keys, a worker may take several tokens at once
+(a lease) and serve the next requests of that key locally until the lease
+runs out or expires after ``RATE_LIMIT_LEASE_SECONDS``. Leases are sized on
+the key's own recent request rate, so a quiet key still costs exactly one
+token per request, and leased tokens are already debited from the shared
+bucket, so leasing never lets more requests through than the limit. A
+denied key is likewise refused locally until its next token is due.
+
+Every response carries ``X-RateLimit-Limit``, ``X-RateLimit-Remaining`` and
+``X-RateLimit-Reset`` (seconds until the bucket is full again); a 429 also
+carries ``Retry-After``.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import threading
 import time
+import weakref
+from collections import namedtuple
+
 import redis
-from django.http import JsonResponse
+import redis.asyncio as aioredis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from cachetools import LRUCache, TTLCache
 from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics
+from .renderers import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+DECISIONS = metrics.Counter(
+    "rate_limit_decisions_total",
+    "Rate limit decisions, by outcome.",
+    ["outcome"],
+)
+BACKEND_CALLS = metrics.Counter(
+    "rate_limit_backend_calls_total",
+    "Rate limit bucket updates, by backend (lease hits never reach a backend).",
+    ["backend"],
+)
+
+RATE_RE = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*([smhd])\w*\s*$")
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+Limit = namedtuple("Limit", "capacity period")
+Decision = namedtuple("Decision", "allowed limit remaining reset retry_after wait")
+
+# Refill, check and debit in one step. Returns the tokens granted (0 when
+# denied, at most ARGV[3]) and the tokens left, as a string because Redis
+# truncates Lua numbers to integers.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+  tokens = capacity
+  ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = 0
+if tokens >= 1 then
+  granted = math.min(want, math.floor(tokens))
+  tokens = tokens - granted
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {granted, tostring(tokens)}
+"""
+
+
+def parse_rate(rate: str) -> Limit:
+    """``"30/m"``, ``"5/s"``, ``"1000/h"``, ``"100/10s"`` → ``Limit``."""
+    m = RATE_RE.match(rate or "")
+    if not m or int(m.group(1)) < 1:
+        raise ValueError(f"invalid rate limit {rate!r} — use e.g. 30/m")
+    return Limit(int(m.group(1)), int(m.group(2) or 1) * PERIODS[m.group(3)])
+
+
+def _decide(limit: Limit, granted: int, tokens: float) -> Decision:
+    rate = limit.capacity / limit.period
+    return Decision(
+        allowed=granted > 0,
+        limit=limit.capacity,
+        remaining=max(0, math.floor(tokens)),
+        reset=math.ceil((limit.capacity - tokens) / rate),
+        retry_after=0 if granted else max(1, math.ceil((1 - tokens) / rate)),
+        wait=0.0 if granted else (1 - tokens) / rate,
+    )
+
+
+class MemoryBackend:
+    """Token buckets in this process (thread-safe, no I/O)."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        # An idle bucket is full again after one period, so dropping it then
+        # is exact.
+        self._buckets = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, want: int = 1):
+        rate = limit.capacity / limit.period
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + max(0.0, now - ts) * rate)
+            granted = min(want, math.floor(tokens)) if tokens >= 1 else 0
+            tokens -= granted
+            self._buckets[key] = (tokens, now)
+        return granted, tokens
+
+    async def atake(self, key: str, limit: Limit, want: int = 1):
+        return self.take(key, limit, want)
+
+
+class RedisBackend:
+    """Token buckets in Redis, one ``EVALSHA`` per update.
 
-r = redis.from_url(settings.RATE_LIMIT_REDIS)
+    The sync client serves WSGI requests; async requests use one
+    ``redis.asyncio`` client per event loop, as those bind to their loop.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        self.url = url
+        self._script = redis.from_url(url).register_script(TOKEN_BUCKET_LUA)
+        self._async_scripts = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _async_script(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            script = self._async_scripts.get(loop)
+            if script is None:
+                script = aioredis.from_url(self.url).register_script(TOKEN_BUCKET_LUA)
+                self._async_scripts[loop] = script
+        return script
+
+    @staticmethod
+    def _args(limit: Limit, want: int):
+        return [limit.capacity, limit.capacity / limit.period, want]
+
+    def take(self, key: str, limit: Limit, want: int = 1):
+        granted, tokens = self._script(keys=[key], args=self._args(limit, want))
+        return int(granted), float(tokens)
+
+    async def atake(self, key: str, limit: Limit, want: int = 1):
+        granted, tokens = await self._async_script()(keys=[key], args=self._args(limit, want))
+        return int(granted), float(tokens)
+
+
+class _Lease:
+    __slots__ = ("tokens", "left", "expires", "blocked_until", "window", "hits", "recent")
+
+    def __init__(self):
+        self.tokens = 0
+        self.left = 0.0
+        self.expires = 0.0
+        self.blocked_until = 0.0
+        self.window = 0.0
+        self.hits = 0
+        self.recent = 0
+
+
+class RateLimiter:
+    """Token-bucket limiter over a backend, with local leases for hot keys."""
+
+    def __init__(self, backend, fallback: MemoryBackend = None, lease_max: int = 1,
+                 lease_seconds: float = 1.0, maxsize: int = 10000):
+        self.backend = backend
+        self.fallback = fallback
+        self.lease_max = lease_max
+        self.lease_seconds = lease_seconds
+        # Leases only make sense in front of a shared (remote) backend
+        self._leases = LRUCache(maxsize=maxsize) if fallback else None
+        self._lock = threading.Lock()
+
+    def _from_lease(self, key: str, limit: Limit):
+        """Serve from a local lease; return ``(decision, want)`` with one of them ``None``."""
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None:
+                lease = self._leases[key] = _Lease()
+            if now - lease.window >= self.lease_seconds:
+                lease.recent, lease.hits, lease.window = lease.hits, 0, now
+            lease.hits += 1
+            if lease.tokens > 0 and now < lease.expires:
+                lease.tokens -= 1
+                return _decide(limit, 1, lease.left + lease.tokens), None
+            if now < lease.blocked_until:
+                # The shared bucket can't hold a token before then
+                rate = limit.capacity / limit.period
+                return _decide(limit, 0, 1 - (lease.blocked_until - now) * rate), None
+            lease.tokens = 0
+            # Lease what this key uses per window, within a tenth of the
+            # bucket, so a quiet key still takes one token at a time.
+            want = min(self.lease_max, max(1, limit.capacity // 10), max(lease.recent, lease.hits))
+        return None, want
+
+    def _store_lease(self, key: str, limit: Limit, want: int, granted: int, tokens: float):
+        rate = limit.capacity / limit.period
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None:
+                return
+            now = time.monotonic()
+            if granted > 1:
+                lease.tokens = granted - 1
+                lease.left = tokens
+                lease.expires = now + self.lease_seconds
+            elif not granted:
+                # Refuse locally until the next token is due; a hot key waits
+                # for a lease's worth (at most one lease period longer).
+                wait = (1 - tokens) / rate
+                if want > 1:
+                    wait = max(wait, min(self.lease_seconds, (want - tokens) / rate))
+                lease.blocked_until = now + wait
+
+    def _after(self, key: str, limit: Limit, want: int, granted: int, tokens: float, backend) -> Decision:
+        BACKEND_CALLS.labels(backend=backend.name).inc()
+        if self._leases is not None and backend is self.backend:
+            self._store_lease(key, limit, want, granted, tokens)
+            tokens += max(0, granted - 1)
+        return _decide(limit, granted, tokens)
+
+    def check(self, key: str, limit: Limit) -> Decision:
+        want = 1
+        if self._leases is not None:
+            decision, want = self._from_lease(key, limit)
+            if decision is not None:
+                return decision
+        backend = self.backend
+        try:
+            granted, tokens = backend.take(key, limit, want)
+        except redis.RedisError as exc:
+            logger.warning("rate limiter falling back to memory: %s", exc)
+            backend = self.fallback
+            granted, tokens = backend.take(key, limit)
+        return self._after(key, limit, want, granted, tokens, backend)
+
+    async def acheck(self, key: str, limit: Limit) -> Decision:
+        want = 1
+        if self._leases is not None:
+            decision, want = self._from_lease(key, limit)
+            if decision is not None:
+                return decision
+        backend = self.backend
+        try:
+            granted, tokens = await backend.atake(key, limit, want)
+        except redis.RedisError as exc:
+            logger.warning("rate limiter falling back to memory: %s", exc)
+            backend = self.fallback
+            granted, tokens = backend.take(key, limit)
+        return self._after(key, limit, want, granted, tokens, backend)
+
+
+def build_limiter() -> RateLimiter:
+    limits = [parse_rate(settings.RATE_LIMIT_DEFAULT), *map(parse_rate, settings.RATE_LIMIT_KEYS.values())]
+    memory = MemoryBackend(settings.RATE_LIMIT_LOCAL_MAXSIZE, max(l.period for l in limits))
+    if not settings.RATE_LIMIT_REDIS:
+        return RateLimiter(memory)
+    return RateLimiter(
+        RedisBackend(settings.RATE_LIMIT_REDIS),
+        fallback=memory,
+        lease_max=settings.RATE_LIMIT_LEASE_MAX,
+        lease_seconds=settings.RATE_LIMIT_LEASE_SECONDS,
+        maxsize=settings.RATE_LIMIT_LOCAL_MAXSIZE,
+    )
 
-RATE_LIMIT = 30  # requests
-WINDOW = 60      # per 60 seconds
 
 class RateLimitMiddleware:
+    """Token-bucket limit per API key (or client IP), for sync and async stacks."""
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
+        if not settings.RATE_LIMIT_ENABLED:
+            raise MiddlewareNotUsed
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.limiter = build_limiter()
+        self.default_limit = parse_rate(settings.RATE_LIMIT_DEFAULT)
+        self.key_limits = {k: parse_rate(v) for k, v in settings.RATE_LIMIT_KEYS.items()}
+        self.exempt = tuple(settings.RATE_LIMIT_EXEMPT_PATHS)
 
-    def __call__(self, request):
-        key = request.headers.get("X-API-KEY")
+    def identify(self, request):
+        """Return ``(bucket_key, limit)`` for ``request``.
 
-        if not key:
-            return JsonResponse({"error": "API Key required"}, status=401)
+        Only keys listed in ``RATE_LIMIT_KEYS`` get a bucket of their own.
+        """
+        api_key = request.headers.get("X-API-KEY")
+        if api_key in self.key_limits:
+            digest = hashlib.sha256(api_key.encode()).hexdigest()[:32]
+            return f"rl:key:{digest}", self.key_limits[api_key]
+        ip = request.META.get("REMOTE_ADDR", "")
+        if settings.RATE_LIMIT_TRUST_FORWARDED:
+            forwarded = request.headers.get("X-Forwarded-For", "")
+            ip = forwarded.split(",")[0].strip() or ip
+        return f"rl:ip:{ip}", self.default_limit
 
-        redis_key = f"rate:{key}"
-        current_count = r.get(redis_key)
+    @staticmethod
+    def _limited(decision: Decision):
+        DECISIONS.labels(outcome="limited").inc()
+        response = ORJSONResponse({"error": "Rate limit exceeded. Try again later."}, status=429)
+        response["Retry-After"] = str(decision.retry_after)
+        return response
 
-        if current_count and int(current_count) >= RATE_LIMIT:
-            return JsonResponse({
-                "error": "Rate limit exceeded. Try again later."
-            }, status=429)
+    @staticmethod
+    def _headers(response, decision: Decision):
+        response["X-RateLimit-Limit"] = str(decision.limit)
+        response["X-RateLimit-Remaining"] = str(decision.remaining)
+        response["X-RateLimit-Reset"] = str(decision.reset)
+        return response
 
-        if not current_count:
-            r.set(redis_key, 1, ex=WINDOW)
-        else:
-            r.incr(redis_key)
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if request.path.startswith(self.exempt):
+            return self.get_response(request)
+        decision = self.limiter.check(*self.identify(request))
+        if not decision.allowed:
+            return self._headers(self._limited(decision), decision)
+        DECISIONS.labels(outcome="allowed").inc()
+        return self._headers(self.get_response(request), decision)
 
-        return self.get_response(request)
+    async def __acall__(self, request):
+        if request.path.startswith(self.exempt):
+            return await self.get_response(request)
+        decision = await self.limiter.acheck(*self.identify(request))
+        if not decision.allowed:
+            return self._headers(self._limited(decision), decision)
+        DECISIONS.labels(outcome="allowed").inc()
+        return self._headers(await self.get_response(request), decision)
@@ -0,0 +1,35 @@
+"""
+orjson-backed JSON rendering.
+
+``ORJSONResponse`` is the drop-in ``JsonResponse`` replacement the views
+use, so every JSON endpoint goes through the same encoder. Decimals are
+rendered as strings, matching what the envelopes already carry.
+"""
+from decimal import Decimal
+
+import orjson
+from django.http import HttpResponse
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    return orjson.dumps(data, default=_default, option=OPTIONS)
+
+
+class ORJSONResponse(HttpResponse):
+    """``JsonResponse`` with orjson; ``safe=False`` is accepted for parity."""
+
+    def __init__(self, data, safe: bool = True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
@@ -37,13 +37,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.instrumentation.RequestMetricsMiddleware',
+    'core.rate_limit.RateLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    # 'core.rate_limit.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -67,6 +68,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -118,10 +120,23 @@ USE_TZ = True
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 
-STATIC_URL = "/static/"
+# Bulk ticker snapshot (prices.tasks.refresh_ticker_snapshot), run by celery beat
+TICKER_SNAPSHOT_INTERVAL = float(os.getenv("TICKER_SNAPSHOT_INTERVAL", "5"))
+# Comma-separated assets or instIds (BTC,ETH-USDT); empty tracks every -USDT pair
+TICKER_SNAPSHOT_SYMBOLS = [
+    s.strip().upper() for s in os.getenv("TICKER_SNAPSHOT_SYMBOLS", "").split(",") if s.strip()
+]
+# Keep snapshot prices valid for a few missed beats
+TICKER_SNAPSHOT_TTL = max(10, int(TICKER_SNAPSHOT_INTERVAL * 3))
+
+CELERY_BEAT_SCHEDULE = {
+    "refresh-ticker-snapshot": {
+        "task": "prices.tasks.refresh_ticker_snapshot",
+        "schedule": TICKER_SNAPSHOT_INTERVAL,
+    },
+}
 
-COINGECKO_BASE = os.getenv("COINGECKO_BASE")
-BINANCE_BASE = os.getenv("BINANCE_BASE")
+STATIC_URL = "/static/"
 
 # Helper to safely read env values and strip surrounding quotes/whitespace
 def _env_strip(key, default=None):
@@ -131,12 +146,103 @@ def _env_strip(key, default=None):
     # remove accidental surrounding whitespace and quotes
     return val.strip().strip('"').strip("'")
 
-BINANCE_BASE = _env_strip("BINANCE_BASE")
 OKX_BASE = _env_strip("OKX_BASE") or "https://www.okx.com"
+BINANCE_BASE = _env_strip("BINANCE_BASE") or "https://api.binance.com"
+COINGECKO_BASE = _env_strip("COINGECKO_BASE") or "https://api.coingecko.com"
+COINGECKO_API_KEY = _env_strip("COINGECKO_API_KEY")
+
+# Current-price providers (prices.providers), primary first. When the primary has not
+# answered within PRICE_HEDGE_DELAY seconds (or fails), the next one is asked as well and
+# the first good answer wins; a negative delay disables hedging. coingecko is opt-in: it
+# resolves a ticker shared by several coins to the top-ranked one.
+PRICE_PROVIDERS = [
+    p.strip().lower() for p in os.getenv("PRICE_PROVIDERS", "okx,binance").split(",") if p.strip()
+]
+PRICE_HEDGE_DELAY = float(os.getenv("PRICE_HEDGE_DELAY", "0.25"))
+
+# OKX HTTP connection pool (one AsyncClient per event loop / ASGI worker)
+OKX_HTTP_MAX_CONNECTIONS = int(os.getenv("OKX_HTTP_MAX_CONNECTIONS", "20"))
+OKX_HTTP_MAX_KEEPALIVE = int(os.getenv("OKX_HTTP_MAX_KEEPALIVE", "10"))
+OKX_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OKX_HTTP_KEEPALIVE_EXPIRY", "60"))
+OKX_HTTP_TIMEOUT = float(os.getenv("OKX_HTTP_TIMEOUT", "20"))
+OKX_HTTP_CONNECT_TIMEOUT = float(os.getenv("OKX_HTTP_CONNECT_TIMEOUT", "10"))
+
+# Outbound OKX request governor (prices.governor): share of OKX's documented per-endpoint
+# limits this deployment may use, longest queueing wait, and retries with jittered backoff
+OKX_GOVERNOR_HEADROOM = float(os.getenv("OKX_GOVERNOR_HEADROOM", "0.8"))
+OKX_GOVERNOR_MAX_WAIT = float(os.getenv("OKX_GOVERNOR_MAX_WAIT", "10"))
+OKX_MAX_RETRIES = int(os.getenv("OKX_MAX_RETRIES", "3"))
+OKX_RETRY_BACKOFF = float(os.getenv("OKX_RETRY_BACKOFF", "0.25"))
+OKX_RETRY_BACKOFF_MAX = float(os.getenv("OKX_RETRY_BACKOFF_MAX", "4"))
+# Circuit breaker: consecutive failed OKX attempts before failing fast, and for how long
+OKX_BREAKER_THRESHOLD = int(os.getenv("OKX_BREAKER_THRESHOLD", "5"))
+OKX_BREAKER_COOLDOWN = float(os.getenv("OKX_BREAKER_COOLDOWN", "30"))
+
+# Stale-while-revalidate lookups (prices.singleflight): fresh for the cache TTL, then the
+# last good value is served (flagged "stale") for up to the stale TTL while it is refreshed
+PRICE_CACHE_TTL = int(os.getenv("PRICE_CACHE_TTL", "10"))
+PRICE_STALE_TTL = int(os.getenv("PRICE_STALE_TTL", "300"))
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", "3600"))
+HISTORY_STALE_TTL = int(os.getenv("HISTORY_STALE_TTL", "86400"))
+
+# Streaming ticker ingester (manage.py stream_tickers)
+OKX_WS_PUBLIC_URL = _env_strip("OKX_WS_PUBLIC_URL") or "wss://ws.okx.com:8443/ws/v5/public"
+TICKER_STREAM_SYMBOLS = [
+    s.strip().upper()
+    for s in os.getenv("TICKER_STREAM_SYMBOLS", "BTC,ETH,SOL,XRP,ADA,DOGE,DOT").split(",")
+    if s.strip()
+]
+TICKER_STREAM_TTL = int(os.getenv("TICKER_STREAM_TTL", "30"))
+TICKER_STREAM_FLUSH_INTERVAL = float(os.getenv("TICKER_STREAM_FLUSH_INTERVAL", "0.25"))
+
+# Overall latency budget (seconds) for one get_comparison call
+COMPARISON_BUDGET_SECONDS = float(os.getenv("COMPARISON_BUDGET_SECONDS", "8"))
+
+# Trend analytics (prices.trend): longest window in bars, and cache TTL per (symbol, bar, window)
+TREND_MAX_BARS = int(os.getenv("TREND_MAX_BARS", "200"))
+TREND_CACHE_TTL = int(os.getenv("TREND_CACHE_TTL", "300"))
+TREND_STALE_TTL = int(os.getenv("TREND_STALE_TTL", "3600"))
+
+# Portfolio valuation (prices.portfolio)
+PORTFOLIO_MAX_HOLDINGS = int(os.getenv("PORTFOLIO_MAX_HOLDINGS", "1000"))
+PORTFOLIO_CONCURRENCY = int(os.getenv("PORTFOLIO_CONCURRENCY", "16"))
+PORTFOLIO_BUDGET_SECONDS = float(os.getenv("PORTFOLIO_BUDGET_SECONDS", "20"))
+
+# How long each process trusts its decoded OKX symbol index before re-reading it
+SYMBOL_INDEX_LOCAL_TTL = float(os.getenv("SYMBOL_INDEX_LOCAL_TTL", "300"))
+
+# Single-flight refresh of hot cache keys (prices.singleflight)
+SINGLEFLIGHT_LOCK_TIMEOUT = int(os.getenv("SINGLEFLIGHT_LOCK_TIMEOUT", "5"))
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "1.5"))
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", "0.05"))
+# The previous value is kept this many times longer than the key's own TTL
+SINGLEFLIGHT_STALE_FACTOR = int(os.getenv("SINGLEFLIGHT_STALE_FACTOR", "6"))
+
+# In-process cache of Gemini intent parses, keyed on normalized message text
+PARSE_CACHE_MAXSIZE = int(os.getenv("PARSE_CACHE_MAXSIZE", "2048"))
+PARSE_CACHE_TTL = float(os.getenv("PARSE_CACHE_TTL", "3600"))
+
+# In-process cache of Gemini analyses, keyed on (asset, date, price band)
+ANALYSIS_CACHE_MAXSIZE = int(os.getenv("ANALYSIS_CACHE_MAXSIZE", "512"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "300"))
+# Width of a current-price band, in percent
+ANALYSIS_CACHE_BAND_PCT = float(os.getenv("ANALYSIS_CACHE_BAND_PCT", "0.5"))
 
 HF_API_URL = os.getenv("HF_API_URL")
 HF_API_TOKEN = os.getenv("HF_API_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Per-call deadlines (seconds) for Gemini generations
+GEMINI_PARSE_TIMEOUT = float(os.getenv("GEMINI_PARSE_TIMEOUT", "8"))
+GEMINI_ANALYSIS_TIMEOUT = float(os.getenv("GEMINI_ANALYSIS_TIMEOUT", "20"))
+
+# Non-blocking A2A tasks (blocking=false): shared task store and push delivery
+A2A_TASK_TTL = int(os.getenv("A2A_TASK_TTL", "86400"))
+A2A_PUSH_TIMEOUT = float(os.getenv("A2A_PUSH_TIMEOUT", "10"))
+A2A_PUSH_RETRIES = int(os.getenv("A2A_PUSH_RETRIES", "3"))
+# JSON-RPC batches on the A2A endpoint: elements run concurrently, at most this many at once
+A2A_BATCH_CONCURRENCY = int(os.getenv("A2A_BATCH_CONCURRENCY", "8"))
+A2A_BATCH_MAX_SIZE = int(os.getenv("A2A_BATCH_MAX_SIZE", "100"))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -162,5 +268,61 @@ CACHES = {
     }
 }
 
-# Rate-limit Redis database index (optional separation)
-RATE_LIMIT_REDIS = None
+# A shared cache is needed for anything written by other processes (celery
+# beat ticker snapshots, cross-worker locks); set CACHE_REDIS_URL to enable it.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+if CACHE_REDIS_URL:
+    CACHES["default"] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": CACHE_REDIS_URL,
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    }
+
+# Two-tier cache (core.tiered_cache): per-process L1 in front of CACHES["default"] for these
+# key prefixes, as prefix: (max entries, seconds). Other keys go straight to the shared cache.
+TIERED_CACHE_PREFIXES = {
+    "okx_symbol_index": (4, 300),
+    "stale:okx_symbol_index": (4, 300),
+    "tickers:spot-usdt": (4, 2),
+    "stale:tickers:spot-usdt": (4, 5),
+    "price:": (8192, 2),
+    "stale:price:": (8192, 5),
+    "quote:": (8192, 2),
+    "stale:quote:": (8192, 5),
+    "hist:": (8192, 600),
+    "stale:hist:": (8192, 600),
+    "trend:": (512, 30),
+    "stale:trend:": (512, 30),
+}
+# Publish L1 writes over Redis pub/sub so other processes drop their copies (needs CACHE_REDIS_URL)
+TIERED_CACHE_BROADCAST = os.getenv("TIERED_CACHE_BROADCAST", "True") == "True"
+TIERED_CACHE_CHANNEL = os.getenv("TIERED_CACHE_CHANNEL", "tiered-cache:invalidate")
+
+# Request rate limiting (core.rate_limit): token bucket per configured API key, or per client IP.
+# Off by default; behind Telex every A2A call comes from a few IPs, so give Telex a key in
+# RATE_LIMIT_KEYS or list /api/v1/a2a/ in RATE_LIMIT_EXEMPT_PATHS before enabling it.
+# Buckets live in Redis when RATE_LIMIT_REDIS (or CACHE_REDIS_URL) is set, else in-process.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "False") == "True"
+RATE_LIMIT_REDIS = _env_strip("RATE_LIMIT_REDIS") or CACHE_REDIS_URL
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "30/m")
+# Per-key limits: "key1=600/m,key2=10/s"; other X-API-KEY values are limited by IP
+RATE_LIMIT_KEYS = dict(
+    item.strip().split("=", 1) for item in os.getenv("RATE_LIMIT_KEYS", "").split(",") if "=" in item
+)
+RATE_LIMIT_EXEMPT_PATHS = [
+    p.strip() for p in os.getenv("RATE_LIMIT_EXEMPT_PATHS", "/metrics,/admin/").split(",") if p.strip()
+]
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "False") == "True"
+# Hot keys take up to this many tokens per Redis call, served locally for this long
+RATE_LIMIT_LEASE_MAX = int(os.getenv("RATE_LIMIT_LEASE_MAX", "20"))
+RATE_LIMIT_LEASE_SECONDS = float(os.getenv("RATE_LIMIT_LEASE_SECONDS", "1"))
+RATE_LIMIT_LOCAL_MAXSIZE = int(os.getenv("RATE_LIMIT_LOCAL_MAXSIZE", "10000"))
+
+# /metrics across worker processes (core.metrics): each process writes its values to a file
+# in this directory and a scrape merges them. Use an empty, per-deploy directory; unset =
+# per-process metrics only.
+METRICS_MULTIPROC_DIR = _env_strip("PROMETHEUS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
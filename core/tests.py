@@ -0,0 +1,304 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from unittest import mock
+
+import redis
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import metrics
+from .asgi import CancelOnDisconnect
+from .rate_limit import Limit, MemoryBackend, RateLimiter, RateLimitMiddleware, RedisBackend, parse_rate
+from .tiered_cache import TieredCache, _Broadcaster
+
+LIMITED = dict(
+    RATE_LIMIT_ENABLED=True,
+    RATE_LIMIT_REDIS=None,
+    RATE_LIMIT_DEFAULT="2/m",
+    RATE_LIMIT_KEYS={"partner": "5/m"},
+    RATE_LIMIT_EXEMPT_PATHS=["/metrics"],
+)
+
+
+class MemoryBackendTests(SimpleTestCase):
+    def test_bucket_empties_and_refills(self):
+        backend = MemoryBackend(maxsize=10, ttl=60)
+        limit = Limit(3, 60)
+        with mock.patch("core.rate_limit.time.monotonic", return_value=100.0) as clock:
+            self.assertEqual([backend.take("k", limit)[0] for _ in range(4)], [1, 1, 1, 0])
+            clock.return_value = 120.0
+            self.assertEqual(backend.take("k", limit)[0], 1)
+            self.assertEqual(backend.take("k", limit)[0], 0)
+            self.assertEqual(backend.take("other", limit)[0], 1)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("30/m"), Limit(30, 60))
+        self.assertEqual(parse_rate("100/10s"), Limit(100, 10))
+        with self.assertRaises(ValueError):
+            parse_rate("0/m")
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_falls_back_to_memory_when_redis_fails(self):
+        backend = mock.Mock(spec=RedisBackend)
+        backend.name = "redis"
+        backend.take.side_effect = redis.ConnectionError("down")
+        backend.atake.side_effect = redis.ConnectionError("down")
+        limiter = RateLimiter(backend, fallback=MemoryBackend(10, 60), lease_max=5)
+        limit = Limit(2, 60)
+
+        with self.assertLogs("core.rate_limit", "WARNING"):
+            self.assertTrue(limiter.check("k", limit).allowed)
+
+        async def acheck():
+            return await limiter.acheck("k", limit)
+
+        with self.assertLogs("core.rate_limit", "WARNING"):
+            self.assertTrue(asyncio.run(acheck()).allowed)
+            self.assertFalse(asyncio.run(acheck()).allowed)
+
+    def test_leases_never_exceed_the_limit(self):
+        shared = MemoryBackend(10, 60)
+        limiter = RateLimiter(shared, fallback=MemoryBackend(10, 60), lease_max=5, lease_seconds=60)
+        decisions = [limiter.check("k", Limit(10, 60)) for _ in range(30)]
+        self.assertEqual(sum(d.allowed for d in decisions), 10)
+        self.assertGreater(decisions[-1].retry_after, 0)
+
+    def test_redis_backend_makes_one_script_call(self):
+        backend = RedisBackend("redis://127.0.0.1:1/0")
+        backend._script = mock.Mock(return_value=[2, b"0.5"])
+        self.assertEqual(backend.take("k", Limit(3, 60), want=2), (2, 0.5))
+        backend._script.assert_called_once_with(keys=["k"], args=[3, 0.05, 2])
+
+
+class RedisBackendTests(SimpleTestCase):
+    """The token-bucket Lua script, against ``RATE_LIMIT_TEST_REDIS`` if one is reachable."""
+
+    def setUp(self):
+        url = os.getenv("RATE_LIMIT_TEST_REDIS")
+        if not url:
+            self.skipTest("RATE_LIMIT_TEST_REDIS not set")
+        try:
+            redis.from_url(url).ping()
+        except redis.RedisError:
+            self.skipTest(f"no Redis at {url}")
+        self.client = redis.from_url(url)
+        self.backend = RedisBackend(url)
+        self.key = f"rl:test:{uuid.uuid4().hex}"
+        self.addCleanup(self.client.delete, self.key)
+
+    def test_grants_up_to_want_then_denies(self):
+        limit = Limit(3, 60)
+        granted, tokens = self.backend.take(self.key, limit, want=2)
+        self.assertEqual(granted, 2)
+        self.assertAlmostEqual(tokens, 1, places=2)
+        self.assertEqual(self.backend.take(self.key, limit, want=2)[0], 1)
+        self.assertEqual(self.backend.take(self.key, limit)[0], 0)
+        self.assertGreater(self.client.pttl(self.key), 0)
+
+    def test_async_client_shares_the_bucket(self):
+        limit = Limit(2, 60)
+        self.backend.take(self.key, limit)
+        granted, _ = asyncio.run(self.backend.atake(self.key, limit, want=5))
+        self.assertEqual(granted, 1)
+
+
+class RateLimitMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def middleware(self):
+        return RateLimitMiddleware(lambda request: HttpResponse("ok"))
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_off_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            self.middleware()
+
+    @override_settings(**LIMITED)
+    def test_only_configured_keys_get_their_own_bucket(self):
+        middleware = self.middleware()
+        key, limit = middleware.identify(self.factory.get("/", HTTP_X_API_KEY="partner"))
+        self.assertTrue(key.startswith("rl:key:"))
+        self.assertEqual(limit, Limit(5, 60))
+        key, limit = middleware.identify(self.factory.get("/", HTTP_X_API_KEY="made-up"))
+        self.assertEqual(key, "rl:ip:127.0.0.1")
+        self.assertEqual(limit, Limit(2, 60))
+
+    @override_settings(**LIMITED)
+    def test_made_up_keys_share_the_ip_bucket(self):
+        middleware = self.middleware()
+        responses = [middleware(self.factory.get("/", HTTP_X_API_KEY=uuid.uuid4().hex)) for _ in range(3)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429])
+        self.assertIn("Retry-After", responses[-1])
+        self.assertEqual(responses[0]["X-RateLimit-Limit"], "2")
+        self.assertEqual(middleware(self.factory.get("/", HTTP_X_API_KEY="partner")).status_code, 200)
+        self.assertEqual(middleware(self.factory.get("/metrics")).status_code, 200)
+
+
+class TieredCacheBroadcastTests(SimpleTestCase):
+    def setUp(self):
+        backend = LocMemCache("tiered-test", {})
+        backend.clear()
+        self.cache = TieredCache(backend, {"price:": (16, 2)}, broadcast_url="redis://127.0.0.1:1/0")
+        self.cache.broadcaster = mock.Mock()
+
+    def test_writes_are_announced_by_default(self):
+        self.cache.set_many({"price:BTC-USDT": "1", "lock:x": "1"})
+        self.cache.broadcaster.publish.assert_called_once_with(["price:BTC-USDT"])
+
+    def test_announce_false_skips_the_broadcast(self):
+        self.cache.set_many({"price:BTC-USDT": "1", "price:ETH-USDT": "2"}, announce=False)
+        self.cache.set("price:BTC-USDT", "3", announce=False)
+        self.cache.broadcaster.publish.assert_not_called()
+        self.assertEqual(self.cache.get("price:BTC-USDT"), "3")
+
+    def test_async_methods_share_both_tiers(self):
+        async def run():
+            await self.cache.aset_many({"price:BTC-USDT": "1", "lock:x": "1"})
+            self.cache.backend.delete("price:BTC-USDT")
+            return await self.cache.aget_many(["price:BTC-USDT", "lock:x", "price:ETH-USDT"])
+
+        self.assertEqual(asyncio.run(run()), {"price:BTC-USDT": "1", "lock:x": "1"})
+        self.cache.broadcaster.publish.assert_called_once_with(["price:BTC-USDT"])
+
+
+class BroadcasterTests(SimpleTestCase):
+    def test_publish_hands_the_keys_to_a_background_thread(self):
+        client = mock.Mock()
+        published = threading.Event()
+        client.publish.side_effect = lambda *args: published.set()
+        broadcaster = _Broadcaster("redis://127.0.0.1:1/0", "invalidate", evict=mock.Mock())
+        with mock.patch.object(_Broadcaster, "_listen"), mock.patch("core.tiered_cache.redis.from_url", return_value=client):
+            broadcaster.publish(["price:BTC-USDT"])
+            self.assertTrue(published.wait(2))
+        channel, message = client.publish.call_args.args
+        self.assertEqual(channel, "invalidate")
+        self.assertTrue(message.endswith("|price:BTC-USDT"))
+
+
+class MetricsTests(SimpleTestCase):
+    def metric(self, cls, *args, **kwargs):
+        name = f"test_{uuid.uuid4().hex[:8]}"
+        metric = cls(name, "Test metric", *args, **kwargs)
+        self.addCleanup(metrics.REGISTRY.pop, name, None)
+        return metric
+
+    def use_directory(self, directory):
+        exporter = metrics._Exporter()
+        exporter._checked = True
+        exporter._directory = directory
+        if directory:
+            exporter._pid = os.getpid()
+            exporter._path = os.path.join(directory, f"metrics_{os.getpid()}_self.json")
+        patcher = mock.patch.object(metrics, "_exporter", exporter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, directory, pid, data):
+        with open(os.path.join(directory, f"metrics_{pid}_other.json"), "w") as f:
+            json.dump(data, f)
+
+    def test_collect_reads_this_process_without_a_directory(self):
+        self.use_directory(None)
+        counter = self.metric(metrics.Counter, ["result"])
+        counter.labels(result="hit").inc(2)
+        collected = {name: (kind, samples) for name, kind, _, samples in metrics.collect()}
+        self.assertEqual(collected[counter.name], ("counter", [({"result": "hit"}, 2)]))
+
+    def test_collect_merges_every_worker(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.use_directory(directory)
+        counter = self.metric(metrics.Counter, ["result"])
+        livesum = self.metric(metrics.Gauge, multiprocess_mode="livesum")
+        liveall = self.metric(metrics.Gauge)
+        histogram = self.metric(metrics.Histogram, buckets=(1.0,))
+        counter.labels(result="hit").inc()
+        livesum.set(1)
+        liveall.set(1)
+        histogram.observe(0.5)
+
+        other = {
+            counter.name: {**counter._dump(), "samples": [[["hit"], 2]]},
+            livesum.name: {**livesum._dump(), "samples": [[[], 10]]},
+            liveall.name: {**liveall._dump(), "samples": [[[], 10]]},
+            histogram.name: {**histogram._dump(), "samples": [[[], [0, 1, 3.0]]]},
+        }
+        self.write(directory, os.getppid(), other)  # a live worker
+        self.write(directory, 99999999, other)  # an exited one
+
+        collected = {name: samples for name, _, _, samples in metrics.collect()}
+        # Counters and histograms keep the exited worker's counts; gauges drop it
+        self.assertEqual(collected[counter.name], [({"result": "hit"}, 5)])
+        self.assertEqual(collected[livesum.name], [({}, 11)])
+        self.assertCountEqual(
+            collected[liveall.name],
+            [({"pid": str(os.getpid())}, 1), ({"pid": str(os.getppid())}, 10)],
+        )
+        self.assertEqual(collected[histogram.name], [({}, {"buckets": [(1.0, 1), (float("inf"), 3)], "sum": 6.5, "count": 3})])
+
+    def test_render_prometheus(self):
+        self.use_directory(None)
+        counter = self.metric(metrics.Counter, ["path"])
+        histogram = self.metric(metrics.Histogram, ["stage"], buckets=(0.1, 1.0))
+        counter.labels(path='a"b').inc()
+        histogram.labels(stage="parse").observe(0.5)
+        text = metrics.render_prometheus()
+        self.assertIn(f"# HELP {counter.name} Test metric\n# TYPE {counter.name} counter\n", text)
+        self.assertIn(f'{counter.name}{{path="a\\"b"}} 1.0\n', text)
+        self.assertIn(f"# TYPE {histogram.name} histogram\n", text)
+        self.assertIn(f'{histogram.name}_bucket{{stage="parse",le="0.1"}} 0.0\n', text)
+        self.assertIn(f'{histogram.name}_bucket{{stage="parse",le="1.0"}} 1.0\n', text)
+        self.assertIn(f'{histogram.name}_bucket{{stage="parse",le="+Inf"}} 1.0\n', text)
+        self.assertIn(f'{histogram.name}_sum{{stage="parse"}} 0.5\n', text)
+        self.assertIn(f'{histogram.name}_count{{stage="parse"}} 1.0\n', text)
+
+
+class CancelOnDisconnectTests(SimpleTestCase):
+    SCOPE = {"type": "http", "method": "GET", "path": "/"}
+
+    def receiver(self, *messages):
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+        return queue.get
+
+    async def test_disconnect_cancels_the_request(self):
+        cancelled = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await receive()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        receive = self.receiver({"type": "http.request", "body": b""}, {"type": "http.disconnect"})
+        await asyncio.wait_for(CancelOnDisconnect(app)(self.SCOPE, receive, mock.AsyncMock()), 2)
+        self.assertTrue(cancelled.is_set())
+
+    async def test_completed_response_stops_the_watcher(self):
+        async def app(scope, receive, send):
+            await receive()
+            # Let the watcher start waiting for a disconnect
+            await asyncio.sleep(0.01)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        send = mock.AsyncMock()
+        # The client never disconnects: the watcher would wait on receive forever
+        receive = self.receiver({"type": "http.request", "body": b""})
+        before = asyncio.all_tasks()
+        await CancelOnDisconnect(app)(self.SCOPE, receive, send)
+        await asyncio.sleep(0)
+        self.assertEqual(asyncio.all_tasks() - before, set())
+        self.assertEqual(send.await_count, 2)
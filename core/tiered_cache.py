@@ -0,0 +1,354 @@
+"""
+Two-tier cache: a bounded in-process tier in front of the Django cache.
+
+``cache`` has the subset of the Django cache API the price code uses
+(``get``, ``get_many``, ``set``, ``set_many``, ``add``, ``delete``, and
+their ``a``-prefixed versions for async code, which reach L2 without
+blocking the event loop). Keys
+matching a prefix in ``TIERED_CACHE_PREFIXES`` are also kept in a
+per-process TTL/LRU tier (L1) with that prefix's size and TTL, so hot keys
+such as the symbol index or the bulk ticker snapshot are served from memory
+without a network round trip or unpickling. Every other key (locks, task
+store, ...) goes straight to the shared Django cache (L2).
+
+An L1 entry lives for the prefix TTL, never longer than the timeout it was
+written with, so a value read through L1 is at most one prefix TTL older
+than in L2. Misses are not cached.
+
+With ``TIERED_CACHE_BROADCAST`` and a Redis ``CACHE_REDIS_URL``, writes and
+deletes of L1 keys are published on ``TIERED_CACHE_CHANNEL`` (from a
+background thread) and every other process drops its L1 copy, instead of
+waiting for the TTL. Writers of
+short-lived keys that are rewritten more often than their L1 TTL (the ticker
+snapshot and stream writing ``price:`` keys every few seconds) pass
+``announce=False``: the other processes' copies expire within one L1 TTL
+anyway, and announcing would publish every key on every write.
+
+Per-tier lookups are counted in ``tiered_cache_requests_total`` and the hit
+ratios are exported as ``tiered_cache_hit_ratio``; see ``stats()``.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+import redis
+from cachetools import TLRUCache
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = metrics.Counter(
+    "tiered_cache_requests_total",
+    "Tiered cache lookups, by tier, key prefix and result.",
+    ["tier", "prefix", "result"],
+)
+INVALIDATIONS = metrics.Counter(
+    "tiered_cache_invalidations_total",
+    "L1 entries dropped on an invalidation broadcast from another process.",
+)
+
+
+def _expiry(key, entry, now):
+    return entry[1]
+
+
+class Tier:
+    """In-process tier for one key prefix (thread-safe)."""
+
+    def __init__(self, prefix: str, maxsize: int, ttl: float):
+        self.prefix = prefix
+        self.ttl = ttl
+        self._entries = TLRUCache(maxsize=maxsize, ttu=_expiry, timer=time.monotonic)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self.ttl if timeout is DEFAULT_TIMEOUT or timeout is None else min(self.ttl, timeout)
+        if ttl <= 0:
+            return self.delete(key)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class _Broadcaster:
+    """Publishes L1 writes to the other processes and applies theirs.
+
+    Both directions run on background threads: ``publish`` only queues the
+    keys, so a write on the event loop never waits for Redis.
+    """
+
+    def __init__(self, url: str, channel: str, evict):
+        self.url = url
+        self.channel = channel
+        self.evict = evict
+        self._pid = None
+        self._origin = None
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def ensure_listener(self):
+        # Started lazily, and again in each forked worker
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._origin = f"{pid}:{uuid.uuid4().hex}"
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._listen, name="tiered-cache-invalidations", daemon=True).start()
+            threading.Thread(
+                target=self._publish, args=(self._queue,), name="tiered-cache-publisher", daemon=True
+            ).start()
+            self._pid = pid
+
+    def _listen(self):
+        backoff = 1.0
+        while True:
+            try:
+                pubsub = redis.from_url(self.url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1.0
+                for message in pubsub.listen():
+                    origin, _, keys = message["data"].decode().partition("|")
+                    if origin != self._origin:
+                        self.evict(keys.split("\n"))
+            except redis.RedisError as exc:
+                logger.warning("tiered cache invalidation listener: %s", exc)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def publish(self, keys):
+        self.ensure_listener()
+        self._queue.put(list(keys))
+
+    def _publish(self, pending):
+        client = redis.from_url(self.url)
+        while True:
+            keys = pending.get()
+            # Writes queued meanwhile go out in the same message
+            while not pending.empty():
+                keys += pending.get()
+            try:
+                client.publish(self.channel, f"{self._origin}|" + "\n".join(dict.fromkeys(keys)))
+            except redis.RedisError as exc:
+                # Other processes fall back to the L1 TTL
+                logger.warning("tiered cache invalidation publish failed: %s", exc)
+
+
+class TieredCache:
+    def __init__(self, backend, prefixes: dict, broadcast_url: str = None, channel: str = None):
+        self.backend = backend
+        # Longest prefix first, so the most specific prefix wins
+        self.tiers = [
+            Tier(prefix, maxsize, ttl)
+            for prefix, (maxsize, ttl) in sorted(prefixes.items(), key=lambda item: -len(item[0]))
+        ]
+        self.broadcaster = _Broadcaster(broadcast_url, channel, self._evict) if broadcast_url else None
+
+    def tier(self, key: str):
+        for tier in self.tiers:
+            if key.startswith(tier.prefix):
+                return tier
+        return None
+
+    def _evict(self, keys):
+        for key in keys:
+            tier = self.tier(key)
+            if tier is not None:
+                tier.delete(key)
+                INVALIDATIONS.inc()
+
+    def _announce(self, keys):
+        if self.broadcaster is not None:
+            keys = [k for k in keys if self.tier(k) is not None]
+            if keys:
+                self.broadcaster.publish(keys)
+
+    def _local(self, tier, key):
+        if self.broadcaster is not None:
+            self.broadcaster.ensure_listener()
+        value = tier.get(key)
+        REQUESTS.labels(tier="l1", prefix=tier.prefix, result="hit" if value is not None else "miss").inc()
+        return value
+
+    def _fill(self, tier, key, value):
+        REQUESTS.labels(tier="l2", prefix=tier.prefix, result="hit" if value is not None else "miss").inc()
+        if value is not None:
+            tier.set(key, value)
+
+    def get(self, key, default=None):
+        tier = self.tier(key)
+        if tier is None:
+            return self.backend.get(key, default)
+        value = self._local(tier, key)
+        if value is None:
+            value = self.backend.get(key)
+            self._fill(tier, key, value)
+        return default if value is None else value
+
+    async def aget(self, key, default=None):
+        """``get`` without blocking the event loop on an L2 round trip."""
+        tier = self.tier(key)
+        if tier is None:
+            return await self.backend.aget(key, default)
+        value = self._local(tier, key)
+        if value is None:
+            value = await self.backend.aget(key)
+            self._fill(tier, key, value)
+        return default if value is None else value
+
+    def get_many(self, keys) -> dict:
+        found, remote = self._local_many(keys)
+        if remote:
+            found.update(self._fill_many(remote, self.backend.get_many(remote)))
+        return found
+
+    def _local_many(self, keys):
+        """L1 hits, and the keys left to read from L2."""
+        found, remote = {}, []
+        for key in keys:
+            tier = self.tier(key)
+            value = self._local(tier, key) if tier is not None else None
+            if value is not None:
+                found[key] = value
+            else:
+                remote.append(key)
+        return found, remote
+
+    def _fill_many(self, remote, fetched: dict) -> dict:
+        for key in remote:
+            tier = self.tier(key)
+            if tier is not None:
+                self._fill(tier, key, fetched.get(key))
+        return fetched
+
+    async def aget_many(self, keys) -> dict:
+        found, remote = self._local_many(keys)
+        if remote:
+            found.update(self._fill_many(remote, await self.backend.aget_many(remote)))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, announce: bool = True):
+        self.backend.set(key, value, timeout)
+        tier = self.tier(key)
+        if tier is not None:
+            tier.set(key, value, timeout)
+            if announce:
+                self._announce([key])
+
+    def set_many(self, data: dict, timeout=DEFAULT_TIMEOUT, announce: bool = True):
+        """Write ``data`` to both tiers; ``announce=False`` skips the invalidation broadcast."""
+        failed = self.backend.set_many(data, timeout)
+        self._set_local_many(data, timeout, announce)
+        return failed
+
+    def _set_local_many(self, data: dict, timeout, announce: bool):
+        for key, value in data.items():
+            tier = self.tier(key)
+            if tier is not None:
+                tier.set(key, value, timeout)
+        if announce:
+            self._announce(list(data))
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, announce: bool = True):
+        await self.backend.aset(key, value, timeout)
+        tier = self.tier(key)
+        if tier is not None:
+            tier.set(key, value, timeout)
+            if announce:
+                self._announce([key])
+
+    async def aset_many(self, data: dict, timeout=DEFAULT_TIMEOUT, announce: bool = True):
+        failed = await self.backend.aset_many(data, timeout)
+        self._set_local_many(data, timeout, announce)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT) -> bool:
+        added = self.backend.add(key, value, timeout)
+        self._added(key, value, timeout, added)
+        return added
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT) -> bool:
+        added = await self.backend.aadd(key, value, timeout)
+        self._added(key, value, timeout, added)
+        return added
+
+    def _added(self, key, value, timeout, added):
+        tier = self.tier(key)
+        if added and tier is not None:
+            tier.set(key, value, timeout)
+            self._announce([key])
+
+    def delete(self, key):
+        self._forget(key)
+        return self.backend.delete(key)
+
+    async def adelete(self, key):
+        self._forget(key)
+        return await self.backend.adelete(key)
+
+    def _forget(self, key):
+        tier = self.tier(key)
+        if tier is not None:
+            tier.delete(key)
+            self._announce([key])
+
+    def clear_local(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> dict:
+        """Hit ratio (``None`` before any lookup) and lookups per tier."""
+        counts = {}
+        for labels, value in REQUESTS.samples():
+            tier = counts.setdefault(labels["tier"], {"hit": 0, "miss": 0})
+            tier[labels["result"]] += value
+        return {
+            name: {**c, "hit_ratio": c["hit"] / (c["hit"] + c["miss"]) if c["hit"] + c["miss"] else None}
+            for name, c in counts.items()
+        }
+
+
+def _hit_ratio(tier: str):
+    ratio = cache.stats().get(tier, {}).get("hit_ratio")
+    return float("nan") if ratio is None else ratio
+
+
+cache = TieredCache(
+    shared_cache,
+    settings.TIERED_CACHE_PREFIXES,
+    broadcast_url=settings.CACHE_REDIS_URL if settings.TIERED_CACHE_BROADCAST else None,
+    channel=settings.TIERED_CACHE_CHANNEL,
+)
+
+HIT_RATIO = metrics.Gauge(
+    "tiered_cache_hit_ratio",
+    "Share of tiered cache lookups answered by each tier (L2 counts only L1 misses).",
+    ["tier"],
+)
+for _tier in ("l1", "l2"):
+    HIT_RATIO.labels(tier=_tier).set_function(lambda tier=_tier: _hit_ratio(tier))
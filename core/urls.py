@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from .views import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/", include("ai.urls")),
     path("api/v1/", include("prices.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -0,0 +1,15 @@
+from django.http import HttpResponse
+
+from . import metrics
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint.
+
+    Returns every worker's metrics merged when ``PROMETHEUS_MULTIPROC_DIR``
+    is set (see ``core.metrics``), else this process's.
+    """
+    return HttpResponse(
+        metrics.render_prometheus(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Candle
+
+
+@admin.register(Candle)
+class CandleAdmin(admin.ModelAdmin):
+    list_display = ("inst_id", "bar", "ts", "open", "high", "low", "close", "volume")
+    list_filter = ("bar",)
+    search_fields = ("inst_id",)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PricesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prices'
+
+    def ready(self):
+        # Register the ticker snapshot freshness gauge in every process
+        from . import tickers  # noqa: F401
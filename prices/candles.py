@@ -0,0 +1,137 @@
+"""
+Local store of confirmed OKX candles.
+
+Past candles never change, so once a bar is closed we keep it in the
+``Candle`` table and serve historical lookups from there. OKX is only asked
+for ranges the store does not have yet, one full page at a time.
+"""
+import logging
+from decimal import Decimal
+
+from django.db import DatabaseError
+
+from core import metrics
+from .governor import okx_get
+from .models import Candle
+
+logger = logging.getLogger(__name__)
+
+STORE_ERRORS = metrics.Counter(
+    "candle_store_errors_total",
+    "Candle store reads and writes that failed with a database error.",
+    ["operation"],
+)
+
+# history-candles returns at most 100 bars per request
+CANDLE_PAGE_LIMIT = 100
+
+BAR_MS = {
+    "1H": 3_600_000,
+    "4H": 14_400_000,
+    "1D": 86_400_000,
+    "1W": 604_800_000,
+}
+
+
+async def fetch_candle_page(inst_id: str, bar: str = "1D", after: int = None, limit: int = CANDLE_PAGE_LIMIT) -> list:
+    """Return one page of raw OKX candle rows, newest first.
+
+    ``after`` is OKX's pagination cursor: only bars opened strictly before it
+    are returned.
+    """
+    params = {"instId": inst_id, "bar": bar, "limit": str(limit)}
+    if after is not None:
+        params["after"] = str(after)
+
+    r = await okx_get("/api/v5/market/history-candles", params)
+    if r.status_code != 200:
+        raise ValueError("⚠️ Unable to fetch historical price — try another date.")
+    return r.json().get("data", [])
+
+
+def _to_candle(inst_id: str, bar: str, row: list) -> Candle:
+    return Candle(
+        inst_id=inst_id,
+        bar=bar,
+        ts=int(row[0]),
+        open=Decimal(row[1]),
+        high=Decimal(row[2]),
+        low=Decimal(row[3]),
+        close=Decimal(row[4]),
+        volume=Decimal(row[5]),
+    )
+
+
+async def store_candles(inst_id: str, bar: str, rows: list) -> int:
+    """Bulk-upsert the confirmed rows of an OKX candle page.
+
+    Rows whose ``confirm`` flag is ``"0"`` belong to a bar that is still open
+    and are skipped. Returns the number of rows written.
+    """
+    candles = [
+        _to_candle(inst_id, bar, row)
+        for row in rows
+        if len(row) < 9 or row[8] == "1"
+    ]
+    if not candles:
+        return 0
+    await Candle.objects.abulk_create(
+        candles,
+        update_conflicts=True,
+        unique_fields=["inst_id", "bar", "ts"],
+        update_fields=["open", "high", "low", "close", "volume"],
+    )
+    return len(candles)
+
+
+async def store_candles_in_passing(inst_id: str, bar: str, rows: list) -> int:
+    """``store_candles`` for callers that serve ``rows`` anyway.
+
+    A database error is logged and counted instead of raised, so the lookup
+    still answers (the range is just fetched from OKX again next time).
+    """
+    try:
+        return await store_candles(inst_id, bar, rows)
+    except DatabaseError as exc:
+        STORE_ERRORS.labels(operation="write").inc()
+        logger.warning("storing %s %s candles failed: %s", inst_id, bar, exc)
+        return 0
+
+
+async def stored_candle_before(inst_id: str, bar: str, before: int):
+    """Return the stored bar opened in ``[before - bar, before)``, if any.
+
+    This mirrors ``history-candles?after=<before>&limit=1`` for a store
+    without gaps. Database errors (e.g. unapplied migrations) are logged and
+    counted, and read as a miss.
+    """
+    try:
+        return await (
+            Candle.objects
+            .filter(inst_id=inst_id, bar=bar, ts__lt=before, ts__gte=before - BAR_MS[bar])
+            .order_by("-ts")
+            .afirst()
+        )
+    except DatabaseError as exc:
+        STORE_ERRORS.labels(operation="read").inc()
+        logger.warning("reading stored %s %s candles failed: %s", inst_id, bar, exc)
+        return None
+
+
+async def backfill(inst_id: str, bar: str, since: int, until: int = None) -> int:
+    """Page backwards from ``until`` (or now) to ``since`` storing every bar.
+
+    Returns the number of candles written.
+    """
+    written = 0
+    cursor = until
+    while True:
+        rows = await fetch_candle_page(inst_id, bar, after=cursor)
+        if not rows:
+            break
+        written += await store_candles(inst_id, bar, rows)
+        oldest = int(rows[-1][0])
+        if oldest <= since or len(rows) < CANDLE_PAGE_LIMIT:
+            break
+        cursor = oldest
+    return written
@@ -0,0 +1,221 @@
+"""
+Outbound OKX request governor.
+
+Every REST call to OKX goes through ``okx_get``, which first takes a token
+from the bucket of its endpoint. OKX limits public endpoints per IP (e.g.
+20 requests per 2 seconds for ``market/ticker``), so the buckets are shared
+by every worker: they live in Redis when ``CACHE_REDIS_URL`` is set (the
+same atomic token bucket as ``core.rate_limit``) and in-process otherwise.
+
+Each bucket is sized to ``OKX_GOVERNOR_HEADROOM`` of the documented limit
+with a burst of a quarter of that budget and the rest refilled evenly, so
+no rolling window of the documented length can exceed the budget.
+
+A call that finds its bucket empty waits (with jitter) for the next token
+instead of failing, for up to ``OKX_GOVERNOR_MAX_WAIT`` seconds. 429s, 5xx
+responses and transport errors are retried with exponential backoff and
+full jitter, ``OKX_MAX_RETRIES`` times, each retry taking a new token.
+
+``OKX_BREAKER_THRESHOLD`` consecutive failed attempts (5xx responses or
+transport errors, retries included) open a per-process circuit breaker: for
+``OKX_BREAKER_COOLDOWN`` seconds calls fail at once with ``CircuitOpen``
+instead of waiting on timeouts, then a single trial call decides whether it
+closes again.
+"""
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+from django.conf import settings
+
+from core import metrics
+from core.instrumentation import upstream_call
+from core.rate_limit import Limit, MemoryBackend, RateLimiter, RedisBackend
+from .http import HttpClientSingleton
+
+# OKX public REST limits: (requests, per seconds), per IP
+OKX_ENDPOINT_LIMITS = {
+    "/api/v5/market/ticker": (20, 2),
+    "/api/v5/market/tickers": (20, 2),
+    "/api/v5/market/candles": (40, 2),
+    "/api/v5/market/history-candles": (20, 2),
+    "/api/v5/public/instruments": (20, 2),
+}
+# Anything not listed above
+DEFAULT_ENDPOINT_LIMIT = (10, 2)
+
+GOVERNOR_WAIT_SECONDS = metrics.Counter(
+    "okx_governor_wait_seconds_total",
+    "Time OKX calls spent queued for an endpoint token.",
+    ["endpoint"],
+)
+OKX_RETRIES = metrics.Counter(
+    "okx_request_retries_total",
+    "Retried OKX calls, by endpoint and reason.",
+    ["endpoint", "reason"],
+)
+BREAKER_TRIPS = metrics.Counter(
+    "okx_circuit_breaker_trips_total",
+    "Times the OKX circuit breaker opened.",
+)
+BREAKER_REJECTIONS = metrics.Counter(
+    "okx_circuit_breaker_rejections_total",
+    "OKX calls failed fast while the circuit breaker was open.",
+    ["endpoint"],
+)
+
+
+class GovernorTimeout(ValueError):
+    """No token for an OKX endpoint within ``OKX_GOVERNOR_MAX_WAIT``."""
+
+
+class CircuitOpen(ValueError):
+    """OKX calls are short-circuited after repeated upstream failures."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed → open → one trial per cooldown."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now (half-open lets one through)."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            # Trial call; the next one waits for another cooldown unless it succeeds
+            self.opened_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    BREAKER_TRIPS.inc()
+                self.opened_at = time.monotonic()
+
+
+def endpoint_limit(path: str) -> Limit:
+    """Token bucket for ``path``: burst + steady refill within the headroom budget."""
+    requests, per = OKX_ENDPOINT_LIMITS.get(path, DEFAULT_ENDPOINT_LIMIT)
+    budget = max(1, int(requests * settings.OKX_GOVERNOR_HEADROOM))
+    burst = max(1, budget // 4)
+    rate = max(budget - burst, 1) / per
+    return Limit(burst, burst / rate)
+
+
+_limiter = None
+_breaker = None
+
+
+def breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(settings.OKX_BREAKER_THRESHOLD, settings.OKX_BREAKER_COOLDOWN)
+    return _breaker
+
+
+BREAKER_OPEN = metrics.Gauge(
+    "okx_circuit_breaker_open",
+    "1 while this process's OKX circuit breaker is open.",
+)
+BREAKER_OPEN.set_function(lambda: int(breaker().is_open))
+
+
+def limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        longest = max(per for _, per in OKX_ENDPOINT_LIMITS.values())
+        memory = MemoryBackend(len(OKX_ENDPOINT_LIMITS) + 16, longest * 2)
+        if settings.CACHE_REDIS_URL:
+            _limiter = RateLimiter(RedisBackend(settings.CACHE_REDIS_URL), fallback=memory)
+        else:
+            _limiter = RateLimiter(memory)
+    return _limiter
+
+
+async def acquire(path: str):
+    """Wait for a token of ``path``'s bucket; raises ``GovernorTimeout``."""
+    limit = endpoint_limit(path)
+    key = f"okxgov:{path}"
+    started = time.monotonic()
+    deadline = started + settings.OKX_GOVERNOR_MAX_WAIT
+    while True:
+        decision = await limiter().acheck(key, limit)
+        if decision.allowed:
+            break
+        # Spread the waiters over the next token interval
+        delay = decision.wait + random.uniform(0, limit.period / limit.capacity)
+        if time.monotonic() + delay > deadline:
+            raise GovernorTimeout("⚠️ OKX is busy right now — please try again shortly.")
+        await asyncio.sleep(delay)
+    waited = time.monotonic() - started
+    if waited:
+        GOVERNOR_WAIT_SECONDS.labels(endpoint=path).inc(waited)
+
+
+def backoff(attempt: int, retry_after: str = None) -> float:
+    """Full-jitter exponential backoff; honours a numeric ``Retry-After``."""
+    ceiling = min(settings.OKX_RETRY_BACKOFF_MAX, settings.OKX_RETRY_BACKOFF * 2 ** attempt)
+    delay = random.uniform(0, ceiling)
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+async def okx_get(path: str, params: dict = None) -> httpx.Response:
+    """GET an OKX REST ``path`` within its budget, retrying transient failures.
+
+    Returns the last response (callers check ``status_code``); a transport
+    error on the last attempt is raised, and ``CircuitOpen`` while the
+    breaker is open.
+    """
+    url = f"{settings.OKX_BASE}{path}"
+    circuit = breaker()
+    for attempt in range(settings.OKX_MAX_RETRIES + 1):
+        last = attempt == settings.OKX_MAX_RETRIES
+        if not circuit.allow():
+            BREAKER_REJECTIONS.labels(endpoint=path).inc()
+            raise CircuitOpen("⚠️ OKX is unavailable right now — please try again shortly.")
+        await acquire(path)
+        try:
+            with upstream_call("okx", path) as call:
+                client = await HttpClientSingleton.get_client()
+                r = await client.get(url, params=params)
+                call.status = r.status_code
+        except httpx.TransportError:
+            circuit.record_failure()
+            if last:
+                raise
+            OKX_RETRIES.labels(endpoint=path, reason="transport").inc()
+            await asyncio.sleep(backoff(attempt))
+            continue
+        if r.status_code >= 500:
+            circuit.record_failure()
+        else:
+            circuit.record_success()
+        if r.status_code != 429 and r.status_code < 500 or last:
+            return r
+        OKX_RETRIES.labels(endpoint=path, reason=str(r.status_code)).inc()
+        await asyncio.sleep(backoff(attempt, r.headers.get("Retry-After")))
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+
+from core import metrics
+
+POOL_LOOKUPS = metrics.Counter(
+    "okx_client_pool_lookups_total",
+    "OKX AsyncClient pool lookups, by whether a live client was reused.",
+    ["result"],
+)
+POOL_CLIENTS = metrics.Gauge(
+    "okx_client_pool_open_clients",
+    "Number of open pooled OKX AsyncClients, over all worker processes.",
+    multiprocess_mode="livesum",
+)
+
+
+async def _client_lifespan(owner, loop, client: httpx.AsyncClient):
+    """Keep ``client`` open for as long as its event loop lives.
+
+    The generator is started once and then left suspended. ``asyncio.run``
+    (used by both ``async_to_sync`` and uvicorn) calls
+    ``loop.shutdown_asyncgens()`` before closing the loop, which runs the
+    ``finally`` block below while the loop can still drive the close.
+
+    The pool entry is dropped there too: it holds this generator, whose
+    frame references the loop, so the weak key alone would never expire.
+    """
+    try:
+        yield client
+    finally:
+        with owner._lock:
+            entry = owner._clients.get(loop)
+            if entry is not None and entry[0] is client:
+                del owner._clients[loop]
+        await client.aclose()
+
+
+class HttpClientSingleton:
+    """One long-lived AsyncClient per event loop.
+
+    AsyncClient instances bind to the event loop they are created on, so a
+    client can't be shared across the short-lived loops created by
+    ``asgiref.async_to_sync``. Instead we keep one client per running loop:
+    under ASGI that means one pooled client per worker, and under WSGI one
+    client per request that is shared by the symbol, ticker and candle calls
+    (and their retries). Clients are closed when their loop shuts down.
+
+    Subclasses pool clients for other upstreams: they declare their own
+    ``_clients`` and ``base_setting`` (the settings name of the base URL).
+    """
+
+    _clients = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+    base_setting = "OKX_BASE"
+    headers = {}
+
+    @classmethod
+    def _build_client(cls):
+        limits = httpx.Limits(
+            max_keepalive_connections=settings.OKX_HTTP_MAX_KEEPALIVE,
+            max_connections=settings.OKX_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.OKX_HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            settings.OKX_HTTP_TIMEOUT,
+            connect=settings.OKX_HTTP_CONNECT_TIMEOUT,
+        )
+        return httpx.AsyncClient(
+            timeout=timeout,
+            limits=limits,
+            http2=True,
+            verify=True,
+            base_url=getattr(settings, cls.base_setting),
+            headers=cls.headers,
+        )
+
+    @classmethod
+    async def get_client(cls):
+        """Return the pooled client for the running event loop.
+
+        Callers must NOT close the returned client (no ``async with``).
+        """
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            entry = cls._clients.get(loop)
+        if entry is not None and not entry[0].is_closed:
+            POOL_LOOKUPS.labels(result="hit").inc()
+            return entry[0]
+
+        POOL_LOOKUPS.labels(result="miss").inc()
+        client = cls._build_client()
+        lifespan = _client_lifespan(cls, loop, client)
+        await lifespan.__anext__()
+        with cls._lock:
+            cls._clients[loop] = (client, lifespan)
+        return client
+
+    @classmethod
+    async def aclose(cls):
+        """Close the client bound to the running loop, if any."""
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            entry = cls._clients.pop(loop, None)
+        if entry is not None:
+            await entry[1].aclose()
+
+    @classmethod
+    def open_clients(cls) -> int:
+        with cls._lock:
+            entries = list(cls._clients.values())
+        return sum(1 for client, _ in entries if not client.is_closed)
+
+    @classmethod
+    def stats(cls) -> dict:
+        hits = misses = 0
+        for labels, value in POOL_LOOKUPS.samples():
+            if labels["result"] == "hit":
+                hits = value
+            else:
+                misses = value
+        return {"hits": hits, "misses": misses, "open_clients": cls.open_clients()}
+
+
+POOL_CLIENTS.set_function(HttpClientSingleton.open_clients)
+
+
+class BinanceClient(HttpClientSingleton):
+    _clients = weakref.WeakKeyDictionary()
+    base_setting = "BINANCE_BASE"
+
+
+class CoinGeckoClient(HttpClientSingleton):
+    _clients = weakref.WeakKeyDictionary()
+    base_setting = "COINGECKO_BASE"
+    headers = {"x-cg-demo-api-key": settings.COINGECKO_API_KEY} if settings.COINGECKO_API_KEY else {}
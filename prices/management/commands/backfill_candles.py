@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prices.candles import BAR_MS, backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the local candle store from OKX history-candles.\n"
+        "Pages through history at the maximum page size and bulk-upserts each page. "
+        "Example: manage.py backfill_candles BTC ETH SOL --days 365"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "symbols",
+            nargs="+",
+            help="Assets (BTC) or instIds (BTC-USDT) to backfill.",
+        )
+        parser.add_argument("--bar", default="1D", choices=sorted(BAR_MS), help="Candle size (default 1D).")
+        parser.add_argument("--days", type=int, default=365, help="How far back to go (default 365).")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Number of instruments backfilled at the same time (default 4).",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        inst_ids = [
+            s.upper() if "-" in s else f"{s.upper()}-USDT"
+            for s in options["symbols"]
+        ]
+        since = int((time.time() - options["days"] * 86400) * 1000)
+        results = asyncio.run(
+            self._backfill_all(inst_ids, options["bar"], since, options["concurrency"])
+        )
+
+        failed = False
+        for inst_id, result in zip(inst_ids, results):
+            if isinstance(result, Exception):
+                failed = True
+                self.stdout.write(self.style.ERROR(f"{inst_id}: {result}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{inst_id}: stored {result} candle(s)"))
+        if failed:
+            raise CommandError("Some instruments failed to backfill.")
+
+    async def _backfill_all(self, inst_ids, bar, since, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(inst_id):
+            async with semaphore:
+                return await backfill(inst_id, bar, since)
+
+        return await asyncio.gather(*(one(i) for i in inst_ids), return_exceptions=True)
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.core.management.base import BaseCommand
+
+from core.tiered_cache import TieredCache
+from prices.symbols import SymbolIndex
+
+
+class RemoteCache:
+    """The shared cache with a fixed round-trip delay, standing in for Redis."""
+
+    def __init__(self, backend, rtt: float):
+        self.backend = backend
+        self.rtt = rtt
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self.rtt)
+            return method(*args, **kwargs)
+        return call
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark of hot-key reads through core.tiered_cache vs the shared "
+        "cache alone. The shared cache is the configured Django cache plus a "
+        "simulated network round trip (--rtt-ms); values are a 1000-pair symbol "
+        "index string and a 1000-entry ticker snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reads", type=int, default=2000, help="Reads per key and mode.")
+        parser.add_argument("--rtt-ms", type=float, default=0.3, help="Simulated shared-cache round trip.")
+
+    def handle(self, *args, **options):
+        n = options["reads"]
+        remote = RemoteCache(shared_cache, options["rtt_ms"] / 1000)
+        tiered = TieredCache(remote, settings.TIERED_CACHE_PREFIXES)
+
+        index = SymbolIndex.from_inst_ids({f"C{i}-USDT" for i in range(1000)}).dumps()
+        snapshot = {f"C{i}-USDT": f"{i}.125" for i in range(1000)}
+        values = {"okx_symbol_index": index, "tickers:spot-usdt": snapshot}
+        for key, value in values.items():
+            shared_cache.set(key, value, 600)
+
+        self.stdout.write(f"{n} reads per key, µs per read")
+        self.stdout.write(f"{'':22}{'shared':>10}{'tiered':>10}{'speed-up':>10}")
+        for key in values:
+            before = self._time(lambda: remote.get(key), n)
+            after = self._time(lambda: tiered.get(key), n)
+            self.stdout.write(f"{key:22}{before:>10.1f}{after:>10.1f}{before / after:>9.1f}x")
+        for tier, figures in tiered.stats().items():
+            self.stdout.write(f"{tier} hit ratio: {figures['hit_ratio']:.4f}")
+
+    @staticmethod
+    def _time(fn, n):
+        started = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - started) / n * 1e6
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from prices.http import BinanceClient, CoinGeckoClient, HttpClientSingleton
+from prices.providers import PROVIDERS, hedged_price
+from prices.stubs import binance_rest, coingecko_rest, httpstub, okx_rest
+
+
+class Command(BaseCommand):
+    help = (
+        "Tail latency of current-price lookups with and without hedging, against "
+        "the bundled stub servers (prices.stubs) on local ports. OKX answers in "
+        "--latency-ms, but --tail-rate of its requests take --tail-ms longer; "
+        "Binance and CoinGecko answer in a steady --latency-ms. The OKX governor "
+        "budget is lifted for the run, as the stub has no limit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lookups", type=int, default=200, help="Sequential lookups per mode.")
+        parser.add_argument("--latency-ms", type=float, default=20)
+        parser.add_argument("--tail-rate", type=float, default=0.05)
+        parser.add_argument("--tail-ms", type=float, default=500)
+        parser.add_argument("--hedge-ms", type=float, default=60, help="PRICE_HEDGE_DELAY for the hedged run.")
+
+    def handle(self, *args, **options):
+        latency = options["latency_ms"] / 1000
+        servers = {
+            "OKX_BASE": httpstub.serve(okx_rest.ROUTES, latency=latency, tail_rate=options["tail_rate"],
+                                       tail_latency=options["tail_ms"] / 1000),
+            "BINANCE_BASE": httpstub.serve(binance_rest.ROUTES, latency=latency),
+            "COINGECKO_BASE": httpstub.serve(coingecko_rest.ROUTES, latency=latency),
+        }
+        for server in servers.values():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        bases = {name: f"http://127.0.0.1:{server.server_port}" for name, server in servers.items()}
+
+        n = options["lookups"]
+        chain = [PROVIDERS["okx"], PROVIDERS["binance"]]
+        try:
+            with override_settings(**bases, OKX_GOVERNOR_HEADROOM=1000, OKX_BREAKER_THRESHOLD=10 ** 9):
+                plain = asyncio.run(self._run(n, chain[:1], -1))
+                hedged = asyncio.run(self._run(n, chain, options["hedge_ms"] / 1000))
+        finally:
+            for server in servers.values():
+                server.shutdown()
+
+        self.stdout.write(f"{n} lookups, ms")
+        self.stdout.write(f"{'':18}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+        for label, timings in (("okx only", plain), (f"hedged @{options['hedge_ms']:g}ms", hedged)):
+            timings.sort()
+            row = "".join(f"{timings[min(n - 1, int(q * n))] * 1000:>8.1f}" for q in (0.5, 0.95, 0.99))
+            self.stdout.write(f"{label:18}{row}{timings[-1] * 1000:>8.1f}")
+        for provider in chain:
+            self.stdout.write(str(provider.stats()))
+
+    async def _run(self, n, chain, delay):
+        timings = []
+        try:
+            for _ in range(n):
+                started = time.perf_counter()
+                await hedged_price("BTC-USDT", delay=delay, chain=chain)
+                timings.append(time.perf_counter() - started)
+        finally:
+            for client in (HttpClientSingleton, BinanceClient, CoinGeckoClient):
+                await client.aclose()
+        return timings
@@ -0,0 +1,30 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from prices.stream import TickerStream
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream live prices from the OKX public WebSocket into the shared cache.\n"
+        "Runs until interrupted, reconnecting and re-subscribing automatically. "
+        "Symbols default to TICKER_STREAM_SYMBOLS; use --url ws://127.0.0.1:8765 "
+        "with `python -m prices.stubs.okx_ws` to run offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", help="Assets (BTC) or instIds (BTC-USDT) to subscribe to.")
+        parser.add_argument("--url", help="WebSocket URL (default OKX_WS_PUBLIC_URL).")
+
+    def handle(self, *args, **options):
+        symbols = [s.upper() for s in options["symbols"]] or settings.TICKER_STREAM_SYMBOLS
+        inst_ids = [s if "-" in s else f"{s}-USDT" for s in symbols]
+        stream = TickerStream(inst_ids, url=options.get("url"))
+
+        self.stdout.write(self.style.NOTICE(f"Streaming {len(stream.inst_ids)} instrument(s) from {stream.url}"))
+        try:
+            asyncio.run(stream.run())
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("Stopped."))
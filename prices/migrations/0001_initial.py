@@ -0,0 +1,35 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inst_id', models.CharField(max_length=32)),
+                ('bar', models.CharField(max_length=8)),
+                ('ts', models.BigIntegerField()),
+                ('open', models.DecimalField(decimal_places=18, max_digits=40)),
+                ('high', models.DecimalField(decimal_places=18, max_digits=40)),
+                ('low', models.DecimalField(decimal_places=18, max_digits=40)),
+                ('close', models.DecimalField(decimal_places=18, max_digits=40)),
+                ('volume', models.DecimalField(decimal_places=18, max_digits=40)),
+            ],
+            options={
+                'ordering': ['inst_id', 'bar', '-ts'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='candle',
+            constraint=models.UniqueConstraint(fields=('inst_id', 'bar', 'ts'), name='candle_inst_bar_ts'),
+        ),
+    ]
@@ -1,3 +1,26 @@
 from django.db import models
 
-# Create your models here.
+
+class Candle(models.Model):
+    """A confirmed (closed, immutable) OKX candlestick bar."""
+
+    inst_id = models.CharField(max_length=32)
+    bar = models.CharField(max_length=8)
+    # Bar open time in milliseconds since the epoch, as returned by OKX
+    ts = models.BigIntegerField()
+    open = models.DecimalField(max_digits=40, decimal_places=18)
+    high = models.DecimalField(max_digits=40, decimal_places=18)
+    low = models.DecimalField(max_digits=40, decimal_places=18)
+    close = models.DecimalField(max_digits=40, decimal_places=18)
+    volume = models.DecimalField(max_digits=40, decimal_places=18)
+
+    class Meta:
+        # The unique constraint doubles as the compound (inst_id, bar, ts)
+        # index used by range lookups and is the conflict target for upserts.
+        constraints = [
+            models.UniqueConstraint(fields=["inst_id", "bar", "ts"], name="candle_inst_bar_ts"),
+        ]
+        ordering = ["inst_id", "bar", "-ts"]
+
+    def __str__(self):
+        return f"{self.inst_id} {self.bar} @ {self.ts}"
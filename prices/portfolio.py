@@ -0,0 +1,157 @@
+"""
+Portfolio valuation against a reference date.
+
+``value_portfolio`` prices every holding in one pass. Symbols are resolved
+from the in-process index, current prices come from one bulk tickers call
+(``fetch_current_prices``) and the historical closes are fetched
+concurrently, at most ``PORTFOLIO_CONCURRENCY`` at a time, within
+``PORTFOLIO_BUDGET_SECONDS``. Holdings that cannot be priced in time are
+reported under ``errors`` instead of failing the whole valuation, and
+holdings priced from stale cache entries are listed under ``stale``.
+
+The result is tabular (``columns`` + ``rows``) to stay compact for
+portfolios of hundreds of coins.
+"""
+import asyncio
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from .services import (
+    coerce_date, fetch_close_at_date, fetch_current_prices, percent_change, resolve_symbol, served_stale_age,
+)
+from .singleflight import track_staleness
+
+COLUMNS = [
+    "symbol", "quantity", "price_on_date", "current_price",
+    "value_on_date", "current_value", "pnl", "pnl_pct",
+]
+
+
+def parse_holdings(raw) -> dict:
+    """Return ``{SYMBOL: quantity}`` from ``[{"symbol", "quantity"}]`` or ``[[symbol, quantity]]``.
+
+    Quantities of a repeated symbol are added up. Raises ``ValueError`` for
+    malformed input.
+    """
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("holdings must be a non-empty list of (symbol, quantity) pairs")
+    if len(raw) > settings.PORTFOLIO_MAX_HOLDINGS:
+        raise ValueError(f"too many holdings (max {settings.PORTFOLIO_MAX_HOLDINGS})")
+
+    holdings = {}
+    for item in raw:
+        if isinstance(item, dict):
+            symbol, quantity = item.get("symbol"), item.get("quantity")
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            symbol, quantity = item
+        else:
+            raise ValueError(f"invalid holding: {item!r}")
+        try:
+            quantity = Decimal(str(quantity))
+        except InvalidOperation:
+            raise ValueError(f"invalid quantity for {symbol}: {quantity!r}")
+        if not symbol or not isinstance(symbol, str) or not quantity.is_finite() or quantity < 0:
+            raise ValueError(f"invalid holding: {item!r}")
+        symbol = symbol.strip().upper()
+        holdings[symbol] = holdings.get(symbol, Decimal("0")) + quantity
+    return holdings
+
+
+def _money(value: Decimal) -> str:
+    return format(value.normalize(), "f")
+
+
+async def value_portfolio(holdings: dict, dt=None) -> dict:
+    """Value ``{symbol: quantity}`` now and on ``dt`` (default: today)."""
+    timings = {}
+    started = time.perf_counter()
+    dt = coerce_date(dt) if dt else date.today()
+    errors = {}
+
+    # ✅ Resolve symbols (in-process index; one upstream call at most)
+    resolved = await asyncio.gather(*(resolve_symbol(s) for s in holdings), return_exceptions=True)
+    inst_ids = {}
+    for symbol, result in zip(holdings, resolved):
+        if isinstance(result, Exception):
+            errors[symbol] = str(result)
+        else:
+            inst_ids[symbol] = result
+    timings["validate"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # ✅ Current prices in bulk, historical closes with bounded fan-out
+    semaphore = asyncio.Semaphore(settings.PORTFOLIO_CONCURRENCY)
+
+    async def close(inst_id):
+        async with semaphore:
+            return await fetch_close_at_date(inst_id, dt)
+
+    fetch_started = time.perf_counter()
+    with track_staleness() as served:
+        history = {s: asyncio.ensure_future(close(i)) for s, i in inst_ids.items()}
+        current = asyncio.ensure_future(fetch_current_prices(set(inst_ids.values()), return_exceptions=True))
+    pending = {current, *history.values()}
+    try:
+        _, pending = await asyncio.wait(pending, timeout=settings.PORTFOLIO_BUDGET_SECONDS)
+    finally:
+        for task in pending:
+            task.cancel()
+    timings["prices"] = round((time.perf_counter() - fetch_started) * 1000, 1)
+
+    current_prices = {}
+    if current.done() and not current.cancelled():
+        if current.exception() is None:
+            current_prices = current.result()
+        else:
+            current_prices = {i: current.exception() for i in inst_ids.values()}
+
+    # ✅ One pass over the holdings
+    rows = []
+    stale = {}
+    total_then = total_now = Decimal("0")
+    for symbol, inst_id in inst_ids.items():
+        quantity = holdings[symbol]
+        task = history[symbol]
+        if not task.done() or task.cancelled():
+            errors[symbol] = "⚠️ Price lookup took too long."
+            continue
+        old_price, new_price = task.exception() or task.result(), current_prices.get(inst_id)
+        if new_price is None:
+            errors[symbol] = "⚠️ Price lookup took too long."
+            continue
+        failed = next((p for p in (old_price, new_price) if isinstance(p, Exception)), None)
+        if failed is not None:
+            errors[symbol] = str(failed) or "An error occurred while fetching price data"
+            continue
+
+        age = served_stale_age(served, inst_id, dt)
+        if age is not None:
+            stale[symbol] = round(age)
+        value_then, value_now = quantity * old_price, quantity * new_price
+        total_then += value_then
+        total_now += value_now
+        rows.append([
+            inst_id.split("-")[0], str(quantity), str(old_price), str(new_price),
+            _money(value_then), _money(value_now), _money(value_now - value_then),
+            str(percent_change(value_now, value_then)),
+        ])
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    return {
+        "date": str(dt),
+        "quote": "USDT",
+        "columns": COLUMNS,
+        "rows": rows,
+        "totals": {
+            "holdings": len(rows),
+            "value_on_date": _money(total_then),
+            "current_value": _money(total_now),
+            "pnl": _money(total_now - total_then),
+            "pnl_pct": str(percent_change(total_now, total_then)),
+        },
+        "errors": [{"symbol": s, "error": e} for s, e in errors.items()],
+        "stale": [{"symbol": s, "stale_seconds": age} for s, age in stale.items()],
+        "timings_ms": timings,
+    }
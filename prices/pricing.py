@@ -1,24 +1,10 @@
-import requests
-from django.core.cache import cache
+from .services import fetch_current_quote, resolve_symbol
 
-COINGECKO_URL = "https://api.coingecko.com/api/v3/simple/price"
 
-def get_cached_price(symbol: str):
-    key = f"price:{symbol.lower()}"
-    cached_price = cache.get(key)
+async def get_cached_price(symbol: str):
+    """``(price, provider)`` for a ticker or asset name.
 
-    if cached_price:
-        return cached_price, "cached"
-
-    response = requests.get(COINGECKO_URL, params={
-        "ids": symbol,
-        "vs_currencies": "usd"
-    })
-
-    data = response.json().get(symbol)
-    price = data["usd"]
-
-    # Cache for 5 minutes (avoid rate limit)
-    cache.set(key, price, timeout=300)
-
-    return price, "api"
+    A thin wrapper over ``fetch_current_quote``: the OKX price when one is
+    cached, else the hedged lookup across ``PRICE_PROVIDERS``.
+    """
+    return await fetch_current_quote(await resolve_symbol(symbol))
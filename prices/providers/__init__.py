@@ -0,0 +1,108 @@
+"""
+Current-price providers behind one async interface.
+
+Each provider (``okx``, ``binance``, ``coingecko``) prices an OKX-style
+instId (``"BTC-USDT"``) and keeps its own latency and error figures
+(``Provider.stats()``, ``price_provider_*`` on /metrics).
+
+``hedged_price`` asks the providers of ``PRICE_PROVIDERS`` in order: the
+primary first, then the next one whenever the previous has not answered
+within ``PRICE_HEDGE_DELAY`` seconds or has failed. The first usable price
+wins and the requests still in flight are cancelled, so a slow primary
+costs at most the hedge delay plus the secondary's latency.
+
+Comparisons, multi-asset comparisons and portfolios get their current
+prices from ``prices.services.fetch_current_quote``, which hedges through
+``hedged_price`` whenever no OKX price is cached and names the provider that
+answered in the artifact (``price_source``).
+"""
+import asyncio
+
+from django.conf import settings
+
+from core import metrics
+from .base import Provider, ProviderError
+from .binance import BinanceProvider
+from .coingecko import CoinGeckoProvider
+from .okx import OKXProvider
+
+PROVIDERS = {p.name: p for p in (OKXProvider(), BinanceProvider(), CoinGeckoProvider())}
+
+HEDGES = metrics.Counter(
+    "price_hedges_total",
+    "Hedged current-price lookups, by why the next provider was asked.",
+    ["reason"],
+)
+HEDGE_WINS = metrics.Counter(
+    "price_hedge_wins_total",
+    "Hedged current-price lookups, by the provider that answered.",
+    ["provider"],
+)
+
+
+def get_provider(name: str) -> Provider:
+    try:
+        return PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown price provider {name!r} (choose from {', '.join(PROVIDERS)})")
+
+
+def providers() -> list:
+    """The configured providers, primary first."""
+    return [get_provider(name) for name in settings.PRICE_PROVIDERS]
+
+
+def provider_stats() -> list:
+    return [p.stats() for p in PROVIDERS.values()]
+
+
+async def hedged_price(inst_id: str, delay: float = None, chain: list = None) -> tuple:
+    """``(price, provider name)`` from the first provider to answer.
+
+    A negative ``delay`` only moves on to the next provider after a failure.
+    If every provider fails, the primary's error is raised.
+    """
+    delay = settings.PRICE_HEDGE_DELAY if delay is None else delay
+    chain = providers() if chain is None else chain
+    if not chain:
+        raise ProviderError("No price providers configured")
+    pending, errors, waiting = {}, {}, list(chain)
+
+    def launch():
+        provider = waiting.pop(0)
+        pending[asyncio.ensure_future(provider.price(inst_id))] = provider
+
+    launch()
+    try:
+        while pending:
+            timeout = delay if waiting and delay >= 0 else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                HEDGES.labels(reason="slow").inc()
+                launch()
+                continue
+            for task in done:
+                provider = pending.pop(task)
+                if task.exception() is None:
+                    HEDGE_WINS.labels(provider=provider.name).inc()
+                    return task.result(), provider.name
+                errors[provider.name] = task.exception()
+            if not pending and waiting:
+                HEDGES.labels(reason="error").inc()
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise next(errors[p.name] for p in chain if p.name in errors)
+
+
+PROVIDER_LATENCY = metrics.Gauge(
+    "price_provider_latency_ms",
+    "Recent latency percentiles of successful current-price requests per provider.",
+    ["provider", "quantile"],
+)
+for _name in PROVIDERS:
+    for _q in ("p50", "p95", "p99"):
+        PROVIDER_LATENCY.labels(provider=_name, quantile=_q).set_function(
+            lambda name=_name, q=_q: PROVIDERS[name].stats()["latency_ms"][q] or float("nan")
+        )
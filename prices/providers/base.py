@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+
+from django.conf import settings
+
+from core import metrics
+from core.rate_limit import Limit, MemoryBackend, RateLimiter, RedisBackend
+
+PROVIDER_REQUESTS = metrics.Counter(
+    "price_provider_requests_total",
+    "Current-price requests per provider, by outcome.",
+    ["provider", "outcome"],
+)
+PROVIDER_SECONDS = metrics.Counter(
+    "price_provider_seconds_total",
+    "Time spent in completed current-price requests per provider.",
+    ["provider"],
+)
+
+# Latencies kept per provider for the percentiles in ``Provider.stats()``
+LATENCY_WINDOW = 512
+
+
+class ProviderError(ValueError):
+    """A provider could not price an instrument."""
+
+
+_limiter = None
+
+
+def limiter() -> RateLimiter:
+    """Budgets of all providers; shared through Redis like the OKX governor's."""
+    global _limiter
+    if _limiter is None:
+        memory = MemoryBackend(64, 3600)
+        if settings.CACHE_REDIS_URL:
+            _limiter = RateLimiter(RedisBackend(settings.CACHE_REDIS_URL), fallback=memory)
+        else:
+            _limiter = RateLimiter(memory)
+    return _limiter
+
+
+class Provider:
+    """One upstream source of current prices.
+
+    Subclasses implement ``fetch(inst_id)`` for a validated OKX-style instId
+    (``"BTC-USDT"``) and return the last price as a ``Decimal``. ``price``
+    wraps it with the per-provider latency and error accounting.
+
+    ``budget`` (requests, seconds) caps the calls made to the provider across
+    workers; over budget, ``price`` fails at once rather than queueing, so a
+    hedge simply moves on to the next provider.
+    """
+
+    name = None
+    budget = None
+
+    def __init__(self):
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._requests = 0
+        self._errors = 0
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    async def fetch(self, inst_id: str) -> Decimal:
+        raise NotImplementedError
+
+    async def price(self, inst_id: str) -> Decimal:
+        if self.budget is not None:
+            decision = await limiter().acheck(f"provider:{self.name}", Limit(*self.budget))
+            if not decision.allowed:
+                PROVIDER_REQUESTS.labels(provider=self.name, outcome="over_budget").inc()
+                raise ProviderError(f"{self.name} request budget exhausted")
+        started = time.perf_counter()
+        try:
+            price = await self.fetch(inst_id)
+            if price is None or not price.is_finite() or price <= 0:
+                raise ProviderError(f"{self.name} returned no usable price for {inst_id}")
+        except asyncio.CancelledError:
+            # A hedge that lost the race; not a failure of the provider
+            PROVIDER_REQUESTS.labels(provider=self.name, outcome="cancelled").inc()
+            raise
+        except Exception as e:
+            self._record(time.perf_counter() - started, e)
+            raise
+        self._record(time.perf_counter() - started)
+        return price
+
+    def _record(self, elapsed: float, error: Exception = None):
+        PROVIDER_REQUESTS.labels(provider=self.name, outcome="error" if error else "ok").inc()
+        PROVIDER_SECONDS.labels(provider=self.name).inc(elapsed)
+        with self._lock:
+            self._requests += 1
+            if error is not None:
+                self._errors += 1
+                self._last_error = str(error) or type(error).__name__
+            else:
+                self._latencies.append(elapsed)
+
+    def stats(self) -> dict:
+        """Requests, error rate and latency percentiles (ms) of successful calls."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            requests, errors, last_error = self._requests, self._errors, self._last_error
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+
+        return {
+            "provider": self.name,
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else None,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+            "last_error": last_error,
+        }
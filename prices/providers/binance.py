@@ -0,0 +1,30 @@
+from decimal import Decimal, InvalidOperation
+
+import httpx
+
+from core.instrumentation import upstream_call
+from ..http import BinanceClient
+from .base import Provider, ProviderError
+
+
+class BinanceProvider(Provider):
+    """``/api/v3/ticker/price`` (weight 2; the IP limit is 6000 weight per minute)."""
+
+    name = "binance"
+    budget = (1200, 60)
+
+    async def fetch(self, inst_id: str) -> Decimal:
+        symbol = inst_id.replace("-", "")
+        try:
+            with upstream_call("binance", "/api/v3/ticker/price") as call:
+                client = await BinanceClient.get_client()
+                r = await client.get("/api/v3/ticker/price", params={"symbol": symbol})
+                call.status = r.status_code
+        except httpx.HTTPError as e:
+            raise ProviderError(f"binance: {type(e).__name__}")
+        if r.status_code != 200:
+            raise ProviderError(f"binance returned HTTP {r.status_code} for {symbol}")
+        try:
+            return Decimal(r.json()["price"])
+        except (ValueError, KeyError, TypeError, InvalidOperation):
+            raise ProviderError(f"binance returned no price for {symbol}")
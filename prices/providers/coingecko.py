@@ -0,0 +1,34 @@
+from decimal import Decimal, InvalidOperation
+
+import httpx
+
+from core.instrumentation import upstream_call
+from ..http import CoinGeckoClient
+from .base import Provider, ProviderError
+
+
+class CoinGeckoProvider(Provider):
+    """``/api/v3/simple/price`` by ticker symbol, quoted in USD.
+
+    CoinGecko resolves a symbol shared by several coins to the top-ranked
+    one. The demo plan allows 30 calls per minute.
+    """
+
+    name = "coingecko"
+    budget = (25, 60)
+
+    async def fetch(self, inst_id: str) -> Decimal:
+        symbol = inst_id.split("-")[0].lower()
+        try:
+            with upstream_call("coingecko", "/api/v3/simple/price") as call:
+                client = await CoinGeckoClient.get_client()
+                r = await client.get("/api/v3/simple/price", params={"symbols": symbol, "vs_currencies": "usd"})
+                call.status = r.status_code
+        except httpx.HTTPError as e:
+            raise ProviderError(f"coingecko: {type(e).__name__}")
+        if r.status_code != 200:
+            raise ProviderError(f"coingecko returned HTTP {r.status_code} for {symbol}")
+        try:
+            return Decimal(str(r.json()[symbol]["usd"]))
+        except (ValueError, KeyError, TypeError, InvalidOperation):
+            raise ProviderError(f"coingecko returned no price for {symbol}")
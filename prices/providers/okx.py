@@ -0,0 +1,24 @@
+from decimal import Decimal, InvalidOperation
+
+import httpx
+
+from ..governor import okx_get
+from .base import Provider, ProviderError
+
+
+class OKXProvider(Provider):
+    """``/api/v5/market/ticker`` through the OKX request governor."""
+
+    name = "okx"
+
+    async def fetch(self, inst_id: str) -> Decimal:
+        try:
+            r = await okx_get("/api/v5/market/ticker", {"instId": inst_id})
+        except httpx.HTTPError:
+            raise ProviderError("⚠️ Network error fetching price — try again.")
+        if r.status_code != 200:
+            raise ProviderError("Unable to fetch current price — please try again shortly.")
+        try:
+            return Decimal(r.json()["data"][0]["last"])
+        except (ValueError, KeyError, IndexError, TypeError, InvalidOperation):
+            raise ProviderError("⚠️ Network error fetching price — try again.")
@@ -1,137 +1,184 @@
 # ai/services.py
-import httpx
 from decimal import Decimal, getcontext, ROUND_HALF_UP
-from django.core.cache import cache
 from django.conf import settings
 from datetime import datetime, date
 from dateutil.parser import parse as parse_date
 from datetime import date as DateType, datetime
+import ast
 import asyncio
+import time
 
 getcontext().prec = 18
-import uuid
-
-OKX_BASE = settings.OKX_BASE
-
-# Common symbols that should always be available as a safe fallback
-COMMON_SYMBOLS = {
-    "BTC-USDT",
-    "ETH-USDT",
-    "SOL-USDT",
-    "XRP-USDT",
-    "ADA-USDT",
-    "DOGE-USDT",
-    "DOT-USDT",
-}
-
-class HttpClientSingleton:
-    """Create a fresh AsyncClient per-call.
-
-    AsyncClient instances bind to the event loop they are created on. Reusing
-    a single AsyncClient across multiple short-lived event loops (created by
-    asgiref.async_to_sync) can cause "Event loop is closed" errors. To avoid
-    that, return a new client for each call and use an async context manager to
-    ensure it is properly closed.
-    """
-
-    @classmethod
-    async def get_client(cls):
-        limits = httpx.Limits(max_keepalive_connections=5, max_connections=10)
-        timeout = httpx.Timeout(30.0, connect=10.0, read=20.0, write=20.0)
-        base = OKX_BASE if OKX_BASE else "https://www.okx.com"
-        return httpx.AsyncClient(
-            timeout=timeout,
-            limits=limits,
-            http2=True,
-            verify=True,
-            base_url=base
-        )
 
+from core import envelopes, metrics
+from core.tiered_cache import cache
+from .candles import fetch_candle_page, store_candles_in_passing, stored_candle_before
+from .governor import okx_get
+from .providers import hedged_price
+from .singleflight import note_stale, single_flight, stale_while_revalidate, track_staleness
+from .symbols import COMMON_SYMBOLS, SymbolIndex, current_index, index_is_fresh, install_index
+from .tickers import fetch_spot_tickers
+
+PRICE_STAGE_SECONDS = metrics.Histogram(
+    "price_stage_duration_seconds",
+    "Latency of symbol, current-price and historical-price lookups, cache hits included.",
+    ["stage"],
+)
+SYMBOL_INDEX_LOOKUPS = metrics.Counter(
+    "symbol_index_lookups_total",
+    "fetch_okx_symbols calls: in-process index, reloaded (shared cache or OKX) or fallback.",
+    ["result"],
+)
 
 # ✅ Fetch OKX trading symbols and cache
-async def fetch_okx_symbols():
-    key = "okx_symbols"
-    cached = cache.get(key)
-    if cached:
-        # ensure common symbols are present in the cached set
-        try:
-            cached.update(COMMON_SYMBOLS)
-        except Exception:
-            # if cache stored a non-mutable type, replace it
-            cached = set(cached) | COMMON_SYMBOLS
-            cache.set(key, cached, 86400)
-        return cached
-
-    url = f"{OKX_BASE}/api/v5/public/instruments?instType=SPOT"
+@PRICE_STAGE_SECONDS.labels(stage="fetch_okx_symbols").time()
+async def fetch_okx_symbols() -> SymbolIndex:
+    """Return the OKX SPOT symbol index.
 
+    The decoded index is kept in-process for SYMBOL_INDEX_LOCAL_TTL seconds;
+    after that it is re-read from the shared cache (compact string, 1 hour)
+    or rebuilt from OKX, and swapped in atomically.
+    """
+    if index_is_fresh():
+        SYMBOL_INDEX_LOOKUPS.labels(result="local").inc()
+        return current_index()
     try:
-        async with await HttpClientSingleton.get_client() as client:
-            r = await client.get(url)
-            if r.status_code == 429:
-                # rate limited — return fallback but don't cache bad data
-                return COMMON_SYMBOLS
+        # concurrent misses share one upstream request
+        data = await single_flight("okx_symbol_index", _request_okx_symbols, 3600)
+    except Exception:
+        # rate limited or unavailable — keep the last index (or the common
+        # fallback) but don't cache bad data
+        SYMBOL_INDEX_LOOKUPS.labels(result="fallback").inc()
+        return current_index()
+    SYMBOL_INDEX_LOOKUPS.labels(result="reloaded").inc()
+    index = SymbolIndex.loads(data)
+    install_index(index, settings.SYMBOL_INDEX_LOCAL_TTL)
+    return index
+
+
+async def _request_okx_symbols() -> str:
+    r = await okx_get("/api/v5/public/instruments", {"instType": "SPOT"})
+    if r.status_code != 200:
+        raise ValueError(f"OKX instruments returned HTTP {r.status_code}")
 
-            if r.status_code != 200:
-                return COMMON_SYMBOLS
+    data = r.json()
+    symbols = {item["instId"] for item in data.get("data", [])}
+    if not symbols:
+        raise ValueError("OKX instruments returned no symbols")
 
-            data = r.json()
-            symbols = {item["instId"] for item in data.get("data", [])}
-            if not symbols:
-                return COMMON_SYMBOLS
+    # Always include common symbols to be robust
+    symbols.update(COMMON_SYMBOLS)
+    return SymbolIndex.from_inst_ids(symbols).dumps()
 
-            # Always include common symbols to be robust
-            symbols.update(COMMON_SYMBOLS)
-            cache.set(key, symbols, 3600)  # cache for 1 hour
-            return symbols
 
-    except Exception:
-        return COMMON_SYMBOLS
+async def resolve_symbol(symbol: str) -> str:
+    """Resolve a ticker or asset name and return its ``-USDT`` instId.
 
+    ``symbol`` may be a ticker ("btc") or a name/alias ("bitcoin",
+    "hamster kombat"); see ``SymbolIndex.resolve``.
+    """
+    index = await fetch_okx_symbols()
+    base = index.resolve(symbol) if symbol else None
+    if not base or not index.has_pair(base, "USDT"):
+        raise ValueError(f"❌ '{symbol}' not found on OKX. Please try another coin.")
+    return f"{base}-USDT"
 
-async def is_valid_symbol(symbol: str):
-    formatted = f"{symbol.upper()}-USDT"
-    # Quick allow-list for known top symbols
-    if formatted in COMMON_SYMBOLS:
-        return True
 
-    symbols = await fetch_okx_symbols()
-    return formatted in symbols
+def coerce_date(dt) -> DateType:
+    """
+    dt can be a datetime.date object or a string.
+    """
+    # Convert string to date if needed
+    if isinstance(dt, str):
+        try:
+            return parse_date(dt).date()
+        except Exception:
+            raise ValueError(f"Invalid date format: {dt}")
+    if isinstance(dt, datetime):
+        return dt.date()
+    if not isinstance(dt, DateType):
+        raise ValueError(f"dt must be a date object or string, got {type(dt)}")
+    return dt
 
 
 # ✅ Current price from OKX
 async def okx_price(symbol: str):
-    full_symbol = f"{symbol.upper()}-USDT"
+    full_symbol = await resolve_symbol(symbol)
+    price, _ = await fetch_current_quote(full_symbol)
+    return price
 
-    if not await is_valid_symbol(symbol):
-        raise ValueError(f"❌ '{symbol}' not found on OKX. Please try another coin.")
 
-    key = f"price:{full_symbol}"
-    cached = cache.get(key)
-    if cached:
-        return Decimal(str(cached))
+@PRICE_STAGE_SECONDS.labels(stage="fetch_current_quote").time()
+async def fetch_current_quote(full_symbol: str) -> tuple:
+    """``(price, provider)`` for an already-validated instId.
 
-    url = f"{OKX_BASE}/api/v5/market/ticker?instId={full_symbol}"
+    ``price:{instId}`` holds OKX prices (ticker stream, snapshot, bulk
+    lookups) and is used first. Otherwise the ``PRICE_PROVIDERS`` are asked
+    through ``hedged_price`` and the answer is cached under
+    ``quote:{instId}`` together with the provider that gave it, so a
+    Binance price is never passed off as an OKX one. Quotes are served stale
+    (and refreshed in the background) for up to ``PRICE_STALE_TTL`` seconds.
+    """
+    cached = await cache.aget(f"price:{full_symbol}")
+    if cached is not None:
+        return Decimal(str(cached)), "okx"
+    (last, provider), _ = await stale_while_revalidate(
+        f"quote:{full_symbol}", lambda: _request_quote(full_symbol),
+        settings.PRICE_CACHE_TTL, settings.PRICE_STALE_TTL,
+    )
+    return Decimal(last), provider
+
+
+async def _request_quote(full_symbol: str) -> list:
+    price, provider = await hedged_price(full_symbol)
+    # Cached as a string like the snapshot and stream values
+    return [str(price), provider]
 
-    for _ in range(3):
-        try:
-            async with await HttpClientSingleton.get_client() as client:
-                r = await client.get(url)
-            if r.status_code == 429:  # Rate limit
-                await asyncio.sleep(0.3)
-                continue
 
-            if r.status_code != 200:
-                raise ValueError("Unable to fetch current price — please try again shortly.")
+async def fetch_current_quotes(full_symbols, return_exceptions: bool = False) -> dict:
+    """Current quotes for several validated instIds: ``{instId: (Decimal, provider)}``.
 
-            result = r.json()
-            last = result["data"][0]["last"]
-            cache.set(key, last, 10)
-            return Decimal(last)
+    With ``return_exceptions`` a symbol whose price cannot be fetched maps to
+    the exception instead of failing the whole call.
+
+    Prices already in the cache (ticker snapshot, stream, earlier lookups)
+    are used as-is; the rest come from one bulk tickers call, whose full
+    ``-USDT`` snapshot is shared by every caller for 10 seconds. Anything the
+    bulk call does not return falls back to ``fetch_current_quote``. A stale
+    snapshot is used (and refreshed in the background) like a stale price.
+    """
+    keys = {s: f"price:{s}" for s in full_symbols}
+    cached = await cache.aget_many(list(keys.values()))
+    quotes = {s: (Decimal(str(cached[k])), "okx") for s, k in keys.items() if cached.get(k) is not None}
 
+    missing = sorted(set(full_symbols) - set(quotes))
+    if missing:
+        try:
+            snapshot, age = await stale_while_revalidate(
+                "tickers:spot-usdt", fetch_spot_tickers, settings.PRICE_CACHE_TTL, settings.PRICE_STALE_TTL
+            )
         except Exception:
-            await asyncio.sleep(0.2)
+            # Bulk call unavailable: every symbol falls back to its own quote
+            snapshot, age = {}, None
+        fetched = {s: snapshot[s] for s in missing if s in snapshot}
+        if age is None:
+            await cache.aset_many({f"price:{s}": last for s, last in fetched.items()}, settings.PRICE_CACHE_TTL)
+        else:
+            for s in fetched:
+                note_stale(f"price:{s}", age)
+        quotes.update({s: (Decimal(str(last)), "okx") for s, last in fetched.items()})
+        leftovers = [s for s in missing if s not in quotes]
+        fallback = await asyncio.gather(
+            *(fetch_current_quote(s) for s in leftovers), return_exceptions=return_exceptions
+        )
+        quotes.update(zip(leftovers, fallback))
+    return quotes
+
 
-    raise ValueError("⚠️ Network error fetching price — try again.")
+async def fetch_current_prices(full_symbols, return_exceptions: bool = False) -> dict:
+    """``fetch_current_quotes`` without the providers: ``{instId: Decimal}``."""
+    quotes = await fetch_current_quotes(full_symbols, return_exceptions)
+    return {s: q if isinstance(q, Exception) else q[0] for s, q in quotes.items()}
 
 
 # ✅ Historical price
@@ -140,44 +187,38 @@ async def okx_price_at_date(symbol: str, dt):
     """
     dt can be a datetime.date object or a string.
     """
-    # Convert string to date if needed
-    if isinstance(dt, str):
-        try:
-            dt = parse_date(dt).date()
-        except Exception:
-            raise ValueError(f"Invalid date format: {dt}")
-    elif not isinstance(dt, DateType):
-        raise ValueError(f"dt must be a date object or string, got {type(dt)}")
+    dt = coerce_date(dt)
+    full_symbol = await resolve_symbol(symbol)
+    return await fetch_close_at_date(full_symbol, dt)
 
-    full_symbol = f"{symbol.upper()}-USDT"
 
-    if not await is_valid_symbol(symbol):
-        raise ValueError(f"❌ '{symbol}' not found on OKX. Please try another coin.")
+@PRICE_STAGE_SECONDS.labels(stage="fetch_close_at_date").time()
+async def fetch_close_at_date(full_symbol: str, dt: DateType) -> Decimal:
+    """Daily close for an already-validated instId (stale-while-revalidate)."""
+    close, _ = await stale_while_revalidate(
+        f"hist:{full_symbol}:{dt}", lambda: _request_close(full_symbol, dt),
+        settings.HISTORY_CACHE_TTL, settings.HISTORY_STALE_TTL,
+    )
+    return Decimal(str(close))
 
-    key = f"hist:{full_symbol}:{dt}"
-    cached = cache.get(key)
-    if cached:
-        return Decimal(str(cached))
 
+async def _request_close(full_symbol: str, dt: DateType) -> str:
     start = int(datetime(dt.year, dt.month, dt.day).timestamp() * 1000)
 
-    url = (
-        f"{OKX_BASE}/api/v5/market/history-candles?"
-        f"instId={full_symbol}&bar=1D&limit=1&after={start}"
-    )
-    async with await HttpClientSingleton.get_client() as client:
-        r = await client.get(url)
+    # Past closes never change: serve them from the local candle store
+    stored = await stored_candle_before(full_symbol, "1D", start)
+    if stored is not None:
+        return format(stored.close.normalize(), "f")
 
-    if r.status_code != 200:
-        raise ValueError("⚠️ Unable to fetch historical price — try another date.")
-
-    data = r.json().get("data", [])
+    # Missing range: fetch a full page ending at the requested date so
+    # neighbouring dates are stored too.
+    data = await fetch_candle_page(full_symbol, "1D", after=start)
     if not data:
         raise ValueError("⚠️ No data for that date.")
 
-    close = data[0][4]
-    cache.set(key, close, 3600)
-    return Decimal(close)
+    await store_candles_in_passing(full_symbol, "1D", data)
+
+    return data[0][4]
 
 
 
@@ -195,13 +236,13 @@ def direction(pc: Decimal):
 
 getcontext().prec = 18
 
-def build_task_response(asset: str, old_price: Decimal, new_price: Decimal, dt: date):
+def build_task_response(asset: str, old_price: Decimal, new_price: Decimal, dt: date, timings: dict = None,
+                        stale_age: float = None, source: str = None):
     """
     Builds Telex-compliant JSON-RPC response structure
     """
-    task_id = str(uuid.uuid4())
-    msg_id_user = str(uuid.uuid4())
-    msg_id_agent = str(uuid.uuid4())
+    task_id = envelopes.new_id()
+    at = envelopes.timestamp()
 
     pc = percent_change(new_price, old_price)
     dir_text = direction(pc)
@@ -215,77 +256,238 @@ def build_task_response(asset: str, old_price: Decimal, new_price: Decimal, dt:
         f"Percentage change: {pc}%\n"
         f"Direction: {dir_text}\n"
     )
+    if source:
+        text_msg += f"Current price source: {source}\n"
+    if stale_age is not None:
+        text_msg += f"Note: cached prices from {round(stale_age)}s ago — a refresh is under way.\n"
+
+    # Structured artifact, sent as a data part (a JSON object, not a repr)
+    artifact_data = _comparison_row(asset, old_price, new_price, dt, pc, stale_age, source)
+    if timings:
+        artifact_data["timings_ms"] = timings
+
+    agent_msg = envelopes.message("agent", [envelopes.text_part(text_msg)], task_id)
+    user_msg = envelopes.message("user", [envelopes.text_part(f"Check {asset} price {dt}")], task_id)
+    return {
+        "jsonrpc": "2.0",
+        "id": task_id,
+        "result": envelopes.task(
+            task_id, f"crypto-{asset.lower()}", "completed", agent_msg,
+            [envelopes.artifact("comparison_data", [envelopes.data_part(artifact_data)])],
+            history=[user_msg, agent_msg], at=at,
+        ),
+        "error": None
+    }
+
+def comparison_figures(comp: dict):
+    """Return the figures dict of a comparison task built by build_task_response."""
+    try:
+        artifacts = comp["result"]["artifacts"]
+    except (KeyError, TypeError):
+        return None
+    for artifact in artifacts:
+        if artifact.get("name") != "comparison_data":
+            continue
+        for part in artifact.get("parts", []):
+            if part.get("kind") == "data":
+                return part.get("data")
+            if part.get("kind") == "text":
+                try:
+                    value = ast.literal_eval(part.get("text", ""))
+                except (ValueError, SyntaxError):
+                    continue
+                if isinstance(value, dict):
+                    return value
+    return None
+
+
+async def _timed(timings: dict, stage: str, awaitable):
+    """Await ``awaitable`` and record its wall time (ms) under ``stage``."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        elapsed = time.perf_counter() - started
+        timings[stage] = round(elapsed * 1000, 1)
+        PRICE_STAGE_SECONDS.labels(stage=f"comparison_{stage}").observe(elapsed)
+
+
+async def get_comparison(asset: str, dt: date = None):
+    """Compare the close on ``dt`` with the current price of ``asset``.
+
+    The lookups form a small dependency graph: the symbol is validated once,
+    then the historical close and the current price are fetched
+    concurrently. The whole graph shares one latency budget
+    (``COMPARISON_BUDGET_SECONDS``) and per-stage timings are reported in the
+    artifact under ``timings_ms``.
+    """
+    timings = {}
+    started = time.perf_counter()
+    budget = settings.COMPARISON_BUDGET_SECONDS
+    try:
+        # If no date provided, use today
+        dt = coerce_date(dt) if dt else date.today()
+
+        with track_staleness() as served:
+            async with asyncio.timeout(budget):
+                full_symbol = await _timed(timings, "validate", resolve_symbol(asset))
+                # Get historical and current prices
+                old_price, (new_price, source) = await asyncio.gather(
+                    _timed(timings, "history", fetch_close_at_date(full_symbol, dt)),
+                    _timed(timings, "ticker", fetch_current_quote(full_symbol)),
+                )
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        # Return the full task response dict (views expect a dict)
+        base = full_symbol.split("-")[0]
+        return build_task_response(
+            base, old_price, new_price, dt, timings, served_stale_age(served, full_symbol, dt), source,
+        )
+    except TimeoutError:
+        return {
+            "error": "COMPARISON_FAILED",
+            "details": "⚠️ Price lookup took too long — please try again shortly.",
+            "timings_ms": timings,
+        }
+    except Exception as e:
+        error_msg = str(e) if str(e) else "An error occurred while fetching price data"
+        return {"error": "COMPARISON_FAILED", "details": error_msg}
 
-    # Structured artifact (optional, can be used by agent programmatically)
-    artifact_data = {
-        "asset": asset.upper(),
+
+def served_stale_age(served: dict, full_symbol: str, dt: date = None):
+    """Age (seconds) of the oldest stale price used for ``full_symbol``, or ``None``."""
+    keys = [f"price:{full_symbol}", f"quote:{full_symbol}"] + ([f"hist:{full_symbol}:{dt}"] if dt else [])
+    ages = [served[k] for k in keys if k in served]
+    return max(ages) if ages else None
+
+
+def _comparison_row(base: str, old_price: Decimal, new_price: Decimal, dt: date, pc: Decimal = None,
+                    stale_age: float = None, source: str = None) -> dict:
+    if pc is None:
+        pc = percent_change(new_price, old_price)
+    row = {
+        "asset": base.upper(),
         "date": str(dt),
         "price_on_date": str(old_price),
         "current_price": str(new_price),
         "percent_change": str(pc),
-        "direction": dir_text
+        "direction": direction(pc),
+        "stale": stale_age is not None,
     }
+    if stale_age is not None:
+        row["stale_seconds"] = round(stale_age)
+    if source:
+        # Provider that answered for the current price (see fetch_current_quote)
+        row["price_source"] = source
+    return row
 
+
+def build_multi_task_response(rows: list, errors: dict, dt: date, timings: dict = None):
+    """
+    Combined Telex task for several assets: one ``comparison_data`` artifact
+    (with a data part) per asset, in the order they were asked for.
+    """
+    task_id = envelopes.new_id()
+
+    lines = [f"Date checked: {dt}"]
+    for row in rows:
+        lines.append(
+            f"{row['asset']}: ${row['price_on_date']} → ${row['current_price']} "
+            f"({row['percent_change']}%, {row['direction']})"
+            + (f" [cached {row['stale_seconds']}s ago]" if row.get("stale") else "")
+        )
+    for asset, error in errors.items():
+        lines.append(f"{asset}: {error}")
+
+    artifacts = [
+        envelopes.artifact("comparison_data", [envelopes.data_part(dict(row, timings_ms=timings) if timings else row)])
+        for row in rows
+    ]
+    agent_msg = envelopes.message("agent", [envelopes.text_part("\n".join(lines) + "\n")], task_id)
     return {
         "jsonrpc": "2.0",
         "id": task_id,
-        "result": {
-            "id": task_id,
-            "contextId": f"crypto-{asset.lower()}",
-            "status": {
-                "state": "completed",
-                "timestamp": datetime.utcnow().isoformat(),
-                "message": {
-                    "kind": "message",
-                    "role": "agent",
-                    "parts": [
-                        {"kind": "text", "text": text_msg}
-                    ],
-                    "messageId": msg_id_agent,
-                    "taskId": task_id
-                }
-            },
-            "artifacts": [
-                {
-                    "artifactId": str(uuid.uuid4()),
-                    "name": "comparison_data",
-                    "parts": [
-                        {"kind": "text", "text": str(artifact_data)}
-                    ]
-                }
-            ],
-            "history": [
-                {
-                    "kind": "message",
-                    "role": "user",
-                    "parts": [{"kind": "text", "text": f"Check {asset} price {dt}"}],
-                    "messageId": msg_id_user,
-                    "taskId": task_id
-                },
-                {
-                    "kind": "message",
-                    "role": "agent",
-                    "parts": [{"kind": "text", "text": text_msg}],
-                    "messageId": msg_id_agent,
-                    "taskId": task_id
-                }
-            ],
-            "kind": "task"
-        },
+        "result": envelopes.task(
+            task_id, "crypto-" + "-".join(row["asset"].lower() for row in rows), "completed",
+            agent_msg, artifacts,
+        ),
         "error": None
     }
 
-async def get_comparison(asset: str, dt: date = None):
-    try:
-        # If no date provided, use today
-        if dt is None:
-            dt = date.today()
 
-        # Get historical and current prices
-        old_price = await okx_price_at_date(asset, dt)
-        new_price = await okx_price(asset)
-        # Return the full task response dict (views expect a dict)
-        return build_task_response(asset, old_price, new_price, dt)
+def comparison_rows(comp: dict) -> list:
+    """Figures of every asset in a (single or multi-asset) comparison task."""
+    try:
+        artifacts = comp["result"]["artifacts"]
+    except (KeyError, TypeError):
+        return []
+    rows = []
+    for artifact in artifacts:
+        figures = comparison_figures({"result": {"artifacts": [artifact]}})
+        if figures is not None:
+            rows.append(figures)
+    return rows
+
+
+async def get_multi_comparison(assets: list, dt: date = None):
+    """Compare several assets against one date in a single task.
+
+    Symbols are resolved from the in-process index, current prices come from
+    one bulk tickers call (``fetch_current_quotes``) and the historical
+    closes are fetched concurrently, all within ``COMPARISON_BUDGET_SECONDS``.
+    Assets that cannot be resolved or priced are reported in the status
+    message; the comparison only fails if none of them can be.
+    """
+    timings = {}
+    started = time.perf_counter()
+    try:
+        dt = coerce_date(dt) if dt else date.today()
+
+        async with asyncio.timeout(settings.COMPARISON_BUDGET_SECONDS):
+            errors = {}
+            full_symbols = []
+            resolved = await _timed(timings, "validate", asyncio.gather(
+                *(resolve_symbol(a) for a in assets), return_exceptions=True
+            ))
+            for asset, result in zip(assets, resolved):
+                if isinstance(result, Exception):
+                    errors[str(asset).upper()] = str(result)
+                elif result not in full_symbols:
+                    full_symbols.append(result)
+            if not full_symbols:
+                raise ValueError(" ".join(errors.values()) or "No assets to compare.")
+
+            with track_staleness() as served:
+                closes, current = await asyncio.gather(
+                    _timed(timings, "history", asyncio.gather(
+                        *(fetch_close_at_date(s, dt) for s in full_symbols), return_exceptions=True
+                    )),
+                    _timed(timings, "ticker", fetch_current_quotes(full_symbols, return_exceptions=True)),
+                )
+
+        rows = []
+        for full_symbol, old_price in zip(full_symbols, closes):
+            base = full_symbol.split("-")[0]
+            quote = current[full_symbol]
+            for failed in (old_price, quote):
+                if isinstance(failed, Exception):
+                    errors[base] = str(failed)
+            if base in errors:
+                continue
+            new_price, source = quote
+            rows.append(_comparison_row(
+                base, old_price, new_price, dt, stale_age=served_stale_age(served, full_symbol, dt), source=source,
+            ))
+        if not rows:
+            raise ValueError(" ".join(errors.values()))
+
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        return build_multi_task_response(rows, errors, dt, timings)
+    except TimeoutError:
+        return {
+            "error": "COMPARISON_FAILED",
+            "details": "⚠️ Price lookup took too long — please try again shortly.",
+            "timings_ms": timings,
+        }
     except Exception as e:
         error_msg = str(e) if str(e) else "An error occurred while fetching price data"
         return {"error": "COMPARISON_FAILED", "details": error_msg}
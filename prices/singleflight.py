@@ -0,0 +1,252 @@
+"""
+Single-flight coalescing for upstream cache misses.
+
+When a hot key such as ``price:BTC-USDT`` expires, every in-flight request
+misses at the same moment. ``single_flight`` makes sure only one of them
+goes upstream:
+
+* inside a process, concurrent misses on the same key await one shared
+  future;
+* across gunicorn workers and hosts, a short lock in the shared Django cache
+  (``cache.aadd``) elects one refresher. The other workers serve the previous
+  value if there is one, otherwise they poll the cache briefly for the
+  refreshed value before falling back to their own fetch.
+
+``stale_while_revalidate`` adds a soft/hard TTL on top: once the fresh value
+has expired, the last good value is served at once (for up to the hard TTL)
+while one background task refreshes it. Lookups served stale are recorded
+for the surrounding ``track_staleness()`` block, so responses can say so.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from core import metrics
+from core.tiered_cache import cache
+
+SINGLE_FLIGHT = metrics.Counter(
+    "singleflight_requests_total",
+    "Cache misses handled by single_flight, by how they were resolved.",
+    ["outcome"],
+)
+
+CACHE_LOOKUPS = metrics.Counter(
+    "cache_lookups_total",
+    "single_flight / stale_while_revalidate lookups, by cache (key prefix) and result.",
+    ["cache", "result"],
+)
+SWR_LOOKUPS = metrics.Counter(
+    "swr_lookups_total",
+    "stale_while_revalidate lookups, by result.",
+    ["result"],
+)
+STALE_SERVED = metrics.Counter(
+    "stale_served_total",
+    "Lookups answered with a stale value, by cache (key prefix).",
+    ["cache"],
+)
+SWR_REFRESHES = metrics.Counter(
+    "swr_background_refreshes_total",
+    "Background refreshes of stale keys, by outcome.",
+    ["outcome"],
+)
+
+_inflight = {}
+_lock = threading.Lock()
+_refreshing = {}
+_staleness = contextvars.ContextVar("staleness", default=None)
+
+
+def cache_name(key: str) -> str:
+    """Metrics label for ``key``: its prefix (``price``, ``hist``, ...)."""
+    return key.split(":", 1)[0]
+
+
+async def single_flight(key: str, fetch, timeout: int, stale_timeout: int = None):
+    """Return the cached value for ``key`` or fetch it once for all callers.
+
+    ``fetch`` is a zero-argument async callable returning the value to cache
+    for ``timeout`` seconds. Exceptions raised by ``fetch`` are shared with
+    every caller waiting on the same key and nothing is cached. The last good
+    value is kept for ``stale_timeout`` seconds (default: ``timeout`` ×
+    ``SINGLEFLIGHT_STALE_FACTOR``).
+    """
+    cached = await cache.aget(key)
+    CACHE_LOOKUPS.labels(cache=cache_name(key), result="hit" if cached is not None else "miss").inc()
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    with _lock:
+        future = _inflight.get((loop, key))
+        leader = future is None
+        if leader:
+            future = loop.create_future()
+            _inflight[(loop, key)] = future
+
+    if not leader:
+        SINGLE_FLIGHT.labels(outcome="coalesced").inc()
+        try:
+            value, age = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The leader was cancelled rather than us: take over the fetch.
+            if future.cancelled() and not asyncio.current_task().cancelling():
+                return await single_flight(key, fetch, timeout, stale_timeout)
+            raise
+        if age is not None:
+            note_stale(key, age)
+        return value
+
+    try:
+        value, age = await _fetch_across_workers(key, fetch, timeout, stale_timeout)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        # Mark retrieved so a flight without followers doesn't log a warning.
+        future.exception()
+        raise
+    else:
+        # Followers get the age too, so each of them reports a stale answer
+        future.set_result((value, age))
+        if age is not None:
+            note_stale(key, age)
+        return value
+    finally:
+        with _lock:
+            _inflight.pop((loop, key), None)
+
+
+async def _fetch_across_workers(key: str, fetch, timeout: int, stale_timeout: int = None):
+    """``(value, age)``; ``age`` is set when another worker's refresh left us the stale copy."""
+    lock_key = f"lock:{key}"
+    stale_key = f"stale:{key}"
+    token = uuid.uuid4().hex
+
+    if not await cache.aadd(lock_key, token, settings.SINGLEFLIGHT_LOCK_TIMEOUT):
+        # Another worker is refreshing this key.
+        stale = _unpack_stale(await cache.aget(stale_key))
+        if stale is not None:
+            SINGLE_FLIGHT.labels(outcome="stale").inc()
+            return stale[0], max(0.0, time.time() - stale[1])
+
+        deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+            value = await cache.aget(key)
+            if value is not None:
+                SINGLE_FLIGHT.labels(outcome="waited").inc()
+                return value, None
+            if await cache.aget(lock_key) is None:
+                # The refresher gave up without storing a value.
+                break
+
+        SINGLE_FLIGHT.labels(outcome="fallback").inc()
+        value = await fetch()
+        await _store(key, stale_key, value, timeout, stale_timeout)
+        return value, None
+
+    SINGLE_FLIGHT.labels(outcome="leader").inc()
+    try:
+        value = await fetch()
+        await _store(key, stale_key, value, timeout, stale_timeout)
+        return value, None
+    finally:
+        if await cache.aget(lock_key) == token:
+            await cache.adelete(lock_key)
+
+
+async def _store(key: str, stale_key: str, value, timeout: int, stale_timeout: int = None):
+    await cache.aset(key, value, timeout)
+    # The stale copy carries its write time so readers know how old it is
+    await cache.aset(stale_key, (value, time.time()), stale_timeout or timeout * settings.SINGLEFLIGHT_STALE_FACTOR)
+
+
+def _unpack_stale(stale):
+    """``(value, stored_at)`` of a stale entry; ``None`` for a missing or bare value."""
+    if isinstance(stale, tuple) and len(stale) == 2:
+        return stale
+    return None
+
+
+@contextmanager
+def track_staleness():
+    """Collect ``{key: age_seconds}`` for every lookup served stale in this block."""
+    served = {}
+    token = _staleness.set(served)
+    try:
+        yield served
+    finally:
+        _staleness.reset(token)
+
+
+def note_stale(key: str, age: float):
+    """Record that ``key`` was served ``age`` seconds old (see ``track_staleness``)."""
+    STALE_SERVED.labels(cache=cache_name(key)).inc()
+    served = _staleness.get()
+    if served is not None:
+        served[key] = max(age, served.get(key, 0))
+
+
+async def stale_while_revalidate(key: str, fetch, timeout: int, stale_timeout: int):
+    """Return ``(value, age)`` for ``key``; ``age`` is ``None`` when fresh.
+
+    A fresh value (younger than ``timeout``) is returned as is. Past that,
+    the last good value is returned immediately, for up to ``stale_timeout``
+    seconds after it was fetched, and one background task per process
+    refreshes it. With nothing to serve, the caller fetches through
+    ``single_flight`` and upstream errors are raised as usual.
+    """
+    value = await cache.aget(key)
+    if value is not None:
+        SWR_LOOKUPS.labels(result="fresh").inc()
+        CACHE_LOOKUPS.labels(cache=cache_name(key), result="hit").inc()
+        return value, None
+
+    stale = _unpack_stale(await cache.aget(f"stale:{key}"))
+    if stale is not None:
+        value, stored_at = stale
+        age = max(0.0, time.time() - stored_at)
+        SWR_LOOKUPS.labels(result="stale").inc()
+        CACHE_LOOKUPS.labels(cache=cache_name(key), result="stale").inc()
+        note_stale(key, age)
+        _refresh_in_background(key, fetch, timeout, stale_timeout)
+        return value, age
+
+    SWR_LOOKUPS.labels(result="miss").inc()
+    return await single_flight(key, fetch, timeout, stale_timeout), None
+
+
+def _refresh_in_background(key: str, fetch, timeout: int, stale_timeout: int):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if (loop, key) in _refreshing:
+            return
+        _refreshing[(loop, key)] = None
+
+    async def refresh():
+        try:
+            await single_flight(key, fetch, timeout, stale_timeout)
+        except asyncio.CancelledError:
+            SWR_REFRESHES.labels(outcome="cancelled").inc()
+        except Exception:
+            SWR_REFRESHES.labels(outcome="failed").inc()
+        else:
+            SWR_REFRESHES.labels(outcome="refreshed").inc()
+        finally:
+            with _lock:
+                _refreshing.pop((loop, key), None)
+
+    # Detached from the request: the refresh outlives the response, and its
+    # lookups are not reported as the request's staleness. The entry in
+    # ``_refreshing`` keeps the task referenced until it is done.
+    task = loop.create_task(refresh(), context=contextvars.Context())
+    with _lock:
+        if (loop, key) in _refreshing:
+            _refreshing[(loop, key)] = task
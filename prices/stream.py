@@ -0,0 +1,151 @@
+"""
+Streaming ticker ingester for the OKX public WebSocket.
+
+``TickerStream`` subscribes to the ``tickers`` channel for a set of
+instruments, keeps the latest price of each in memory and flushes changed
+prices to the shared ``price:{instId}`` cache keys that
+``fetch_current_quote`` reads, so current prices are served without any
+upstream request. Dropped connections are re-opened with exponential
+backoff and every instrument is re-subscribed.
+
+An error event for one instrument (e.g. an instId OKX does not list) drops
+that instrument from the subscription and keeps the connection open, so a
+bad symbol can't put the stream into a reconnect loop. A failed cache write
+keeps the prices pending for the next flush.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+
+import redis
+from django.conf import settings
+from django_redis.exceptions import ConnectionInterrupted
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+from core import metrics
+from core.tiered_cache import cache
+
+logger = logging.getLogger(__name__)
+
+STREAM_MESSAGES = metrics.Counter(
+    "ticker_stream_updates_total",
+    "Ticker updates received from the OKX WebSocket.",
+)
+STREAM_RECONNECTS = metrics.Counter(
+    "ticker_stream_reconnects_total",
+    "Times the ticker stream had to reconnect.",
+)
+STREAM_ERRORS = metrics.Counter(
+    "ticker_stream_errors_total",
+    "Error events from the OKX WebSocket and failed cache flushes.",
+    ["kind"],
+)
+
+# OKX closes idle connections after 30s; send a text "ping" before that
+PING_INTERVAL = 25
+
+
+class TickerStream:
+    def __init__(self, inst_ids, url: str = None, ttl: int = None, flush_interval: float = None):
+        self.inst_ids = sorted(set(inst_ids))
+        self.url = url or settings.OKX_WS_PUBLIC_URL
+        self.ttl = ttl or settings.TICKER_STREAM_TTL
+        self.flush_interval = flush_interval or settings.TICKER_STREAM_FLUSH_INTERVAL
+        # instId -> (last, ts_ms)
+        self.latest = {}
+        self._dirty = set()
+
+    def subscribe_message(self) -> str:
+        return json.dumps({
+            "op": "subscribe",
+            "args": [{"channel": "tickers", "instId": i} for i in self.inst_ids],
+        })
+
+    def handle_message(self, raw: str):
+        """Apply one WebSocket frame to the latest-price table."""
+        if raw == "pong":
+            return
+        message = json.loads(raw)
+        if message.get("event") == "error":
+            self.handle_error(message)
+            return
+        for item in message.get("data", []):
+            inst_id, last = item.get("instId"), item.get("last")
+            if not inst_id or not last:
+                continue
+            self.latest[inst_id] = (last, int(item.get("ts") or time.time() * 1000))
+            self._dirty.add(inst_id)
+            STREAM_MESSAGES.inc()
+
+    def handle_error(self, message: dict):
+        """Log an error event and stop subscribing to the instrument it names."""
+        STREAM_ERRORS.labels(kind="event").inc()
+        text = f"{message.get('code')}: {message.get('msg')}"
+        named = (message.get("arg") or {}).get("instId")
+        msg = message.get("msg") or ""
+        rejected = [
+            i for i in self.inst_ids
+            if i == named or re.search(rf"(?<![\w-]){re.escape(i)}(?![\w-])", msg)
+        ]
+        if not rejected:
+            logger.warning("OKX ticker stream error %s", text)
+            return
+        logger.warning("OKX ticker stream error %s; dropping %s", text, ", ".join(rejected))
+        self.inst_ids = [i for i in self.inst_ids if i not in rejected]
+        for inst_id in rejected:
+            self.latest.pop(inst_id, None)
+            self._dirty.discard(inst_id)
+
+    def flush(self) -> int:
+        """Write changed prices to the cache in one ``set_many``."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        try:
+            # Rewritten every flush, so other workers' L1 copies just expire
+            cache.set_many({f"price:{i}": self.latest[i][0] for i in dirty}, self.ttl, announce=False)
+        except (redis.RedisError, ConnectionInterrupted) as exc:
+            STREAM_ERRORS.labels(kind="flush").inc()
+            logger.warning("OKX ticker stream flush failed: %s", exc)
+            # Newer ticks for the same instruments may arrive meanwhile
+            self._dirty |= dirty
+            return 0
+        return len(dirty)
+
+    async def run(self, max_backoff: float = 30.0):
+        """Stream forever, reconnecting and re-subscribing on any failure."""
+        backoff = 0.5
+        while True:
+            started = time.monotonic()
+            try:
+                await self._run_once()
+            except (OSError, WebSocketException, ValueError, asyncio.TimeoutError):
+                pass
+            if time.monotonic() - started > max_backoff:
+                # The connection was healthy for a while: retry quickly
+                backoff = 0.5
+            STREAM_RECONNECTS.inc()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+    async def _run_once(self):
+        async with connect(self.url, ping_interval=None, open_timeout=10) as ws:
+            await ws.send(self.subscribe_message())
+            last_flush = time.monotonic()
+            last_message = time.monotonic()
+            while True:
+                timeout = max(0.01, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout)
+                    last_message = time.monotonic()
+                    self.handle_message(raw)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - last_message > PING_INTERVAL:
+                        await ws.send("ping")
+                        last_message = time.monotonic()
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = time.monotonic()
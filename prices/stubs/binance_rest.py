@@ -0,0 +1,24 @@
+"""
+Local stand-in for the Binance spot REST API (``/api/v3/ticker/price``).
+
+    python -m prices.stubs.binance_rest --port 8802 --error-rate 0.2
+    BINANCE_BASE=http://127.0.0.1:8802 python manage.py runserver
+"""
+from .httpstub import BASE_PRICES, RandomWalk, main
+
+walk = RandomWalk()
+
+
+def ticker_price(params):
+    symbol = params.get("symbol", "")
+    base = symbol[:-4] if symbol.endswith("USDT") else ""
+    if base not in BASE_PRICES:
+        return 400, {"code": -1121, "msg": "Invalid symbol."}
+    return 200, {"symbol": symbol, "price": f"{walk.last(base):.8f}"}
+
+
+ROUTES = {"/api/v3/ticker/price": ticker_price}
+
+
+if __name__ == "__main__":
+    main(__doc__, ROUTES, 8802, "BINANCE_BASE")
@@ -0,0 +1,29 @@
+"""
+Local stand-in for the CoinGecko REST API (``/api/v3/simple/price``).
+
+    python -m prices.stubs.coingecko_rest --port 8803 --latency 0.3
+    COINGECKO_BASE=http://127.0.0.1:8803 python manage.py runserver
+"""
+from .httpstub import BASE_PRICES, RandomWalk, main
+
+walk = RandomWalk()
+
+
+def simple_price(params):
+    symbols = [s for s in params.get("symbols", "").lower().split(",") if s]
+    currencies = [c for c in params.get("vs_currencies", "").lower().split(",") if c]
+    if not symbols or not currencies:
+        return 400, {"error": "Missing parameter symbols or vs_currencies"}
+    # Unknown symbols are left out, as upstream does
+    return 200, {
+        s: {c: round(walk.last(s), 8) for c in currencies if c == "usd"}
+        for s in symbols
+        if s.upper() in BASE_PRICES
+    }
+
+
+ROUTES = {"/api/v3/simple/price": simple_price}
+
+
+if __name__ == "__main__":
+    main(__doc__, ROUTES, 8803, "COINGECKO_BASE")
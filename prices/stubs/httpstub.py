@@ -0,0 +1,92 @@
+"""
+Shared plumbing for the REST stand-in servers in this package.
+
+``serve(routes, ...)`` runs a threaded stdlib HTTP server that answers GETs
+from ``routes`` (``{path: handler(params) -> (status, payload)}``) with JSON,
+after an optional delay, and fails a share of requests with HTTP 503 so the
+retry, breaker and hedging paths can be exercised offline.
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BASE_PRICES = {"BTC": 100000.0, "ETH": 4000.0, "SOL": 200.0, "DOGE": 0.2, "XRP": 2.5}
+
+
+class RandomWalk:
+    """Last price per base currency, nudged a little on every read."""
+
+    def __init__(self):
+        self.prices = dict(BASE_PRICES)
+
+    def last(self, base: str) -> float:
+        price = self.prices.setdefault(base.upper(), 1.0)
+        price *= 1 + random.uniform(-0.001, 0.001)
+        self.prices[base.upper()] = price
+        return price
+
+
+def make_handler(routes: dict, latency: float = 0.0, error_rate: float = 0.0,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this each
+        # keep-alive response waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            delay = latency + (tail_latency if random.random() < tail_rate else 0.0)
+            if delay:
+                time.sleep(delay)
+            route = routes.get(url.path)
+            if route is None:
+                status, payload = 404, {"error": f"no route {url.path}"}
+            elif random.random() < error_rate:
+                status, payload = 503, {"error": "stub failure"}
+            else:
+                status, payload = route(dict(parse_qsl(url.query)))
+            body = json.dumps(payload).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up, e.g. a hedged request that lost the race
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(routes: dict, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+          error_rate: float = 0.0, tail_rate: float = 0.0, tail_latency: float = 0.0) -> ThreadingHTTPServer:
+    """Bind the server (``port=0`` picks a free one); call ``serve_forever()`` on it."""
+    handler = make_handler(routes, latency, error_rate, tail_rate, tail_latency)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(doc: str, routes: dict, default_port: int, setting: str):
+    parser = argparse.ArgumentParser(description=doc.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503.")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Share of requests that are slow.")
+    parser.add_argument("--tail-latency", type=float, default=1.0, help="Extra seconds for a slow request.")
+    args = parser.parse_args()
+    server = serve(routes, args.host, args.port, args.latency, args.error_rate, args.tail_rate, args.tail_latency)
+    print(f"{setting}=http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
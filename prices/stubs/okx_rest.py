@@ -0,0 +1,78 @@
+"""
+Local stand-in for the OKX public REST API.
+
+Serves the endpoints the price code calls (``public/instruments``,
+``market/ticker``, ``market/tickers`` and ``market/history-candles``) in
+OKX's response format, with random-walk prices::
+
+    python -m prices.stubs.okx_rest --port 8801 --latency 0.05
+    OKX_BASE=http://127.0.0.1:8801 python manage.py runserver
+"""
+import math
+import time
+
+from .httpstub import BASE_PRICES, RandomWalk, main
+
+BAR_MS = {"1m": 60_000, "1H": 3_600_000, "4H": 14_400_000, "1D": 86_400_000, "1W": 604_800_000}
+
+walk = RandomWalk()
+
+
+def _ok(data: list):
+    return 200, {"code": "0", "msg": "", "data": data}
+
+
+def _ticker(inst_id: str) -> dict:
+    return {
+        "instType": "SPOT",
+        "instId": inst_id,
+        "last": f"{walk.last(inst_id.split('-')[0]):.8g}",
+        "ts": str(int(time.time() * 1000)),
+    }
+
+
+def instruments(params):
+    return _ok([
+        {"instType": "SPOT", "instId": f"{base}-USDT", "baseCcy": base, "quoteCcy": "USDT", "state": "live"}
+        for base in BASE_PRICES
+    ])
+
+
+def ticker(params):
+    inst_id = params.get("instId", "")
+    if inst_id.split("-")[0] not in BASE_PRICES:
+        return 200, {"code": "51001", "msg": "Instrument ID does not exist", "data": []}
+    return _ok([_ticker(inst_id)])
+
+
+def tickers(params):
+    return _ok([_ticker(f"{base}-USDT") for base in BASE_PRICES])
+
+
+def history_candles(params):
+    base = params.get("instId", "").split("-")[0]
+    step = BAR_MS.get(params.get("bar", "1D"), BAR_MS["1D"])
+    limit = min(int(params.get("limit", 100)), 100)
+    now = int(time.time() * 1000)
+    before = min(int(params.get("after", now)), now)
+    start = (before - 1) // step * step
+    rows = []
+    for i in range(limit):
+        ts = start - i * step
+        # A smooth, deterministic curve, so repeated lookups agree
+        close = f"{BASE_PRICES.get(base, 1.0) * (1 + 0.2 * math.sin(ts / (30 * 86_400_000))):.8g}"
+        confirm = "1" if ts + step <= now else "0"
+        rows.append([str(ts), close, close, close, close, "1000", "1000", "1000", confirm])
+    return _ok(rows)
+
+
+ROUTES = {
+    "/api/v5/public/instruments": instruments,
+    "/api/v5/market/ticker": ticker,
+    "/api/v5/market/tickers": tickers,
+    "/api/v5/market/history-candles": history_candles,
+}
+
+
+if __name__ == "__main__":
+    main(__doc__, ROUTES, 8801, "OKX_BASE")
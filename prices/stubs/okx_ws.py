@@ -0,0 +1,96 @@
+"""
+Local stand-in for the OKX public WebSocket (``tickers`` channel).
+
+Speaks just enough of the protocol for ``prices.stream.TickerStream``:
+subscribe acks, text ``ping``/``pong`` and random-walk ticker pushes for
+every subscribed instrument. Use it to run the ingester offline::
+
+    python -m prices.stubs.okx_ws --port 8765
+    python manage.py stream_tickers --url ws://127.0.0.1:8765 BTC ETH
+
+``--drop-after`` closes each connection after N pushes to exercise
+reconnect/resubscribe.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+BASE_PRICES = {"BTC": 100000.0, "ETH": 4000.0, "SOL": 200.0}
+
+
+def ticker_push(inst_id: str, last: float) -> str:
+    return json.dumps({
+        "arg": {"channel": "tickers", "instId": inst_id},
+        "data": [{
+            "instType": "SPOT",
+            "instId": inst_id,
+            "last": f"{last:.8g}",
+            "ts": str(int(time.time() * 1000)),
+        }],
+    })
+
+
+def make_handler(interval: float = 0.1, drop_after: int = 0):
+    async def handler(websocket):
+        subscribed = {}
+        pushes = 0
+
+        async def pump():
+            nonlocal pushes
+            try:
+                while True:
+                    await asyncio.sleep(interval)
+                    for inst_id in list(subscribed):
+                        subscribed[inst_id] *= 1 + random.uniform(-0.001, 0.001)
+                        await websocket.send(ticker_push(inst_id, subscribed[inst_id]))
+                        pushes += 1
+                        if drop_after and pushes >= drop_after:
+                            await websocket.close()
+                            return
+            except ConnectionClosed:
+                pass
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            async for raw in websocket:
+                if raw == "ping":
+                    await websocket.send("pong")
+                    continue
+                message = json.loads(raw)
+                if message.get("op") != "subscribe":
+                    continue
+                for arg in message.get("args", []):
+                    inst_id = arg.get("instId", "")
+                    base = inst_id.split("-")[0]
+                    subscribed.setdefault(inst_id, BASE_PRICES.get(base, 1.0))
+                    await websocket.send(json.dumps({"event": "subscribe", "arg": arg, "connId": "stub"}))
+        except ConnectionClosed:
+            pass
+        finally:
+            pump_task.cancel()
+
+    return handler
+
+
+async def serve_forever(host: str = "127.0.0.1", port: int = 8765, interval: float = 0.1, drop_after: int = 0):
+    async with serve(make_handler(interval, drop_after), host, port) as server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=float, default=0.1, help="Seconds between pushes.")
+    parser.add_argument("--drop-after", type=int, default=0, help="Close each connection after N pushes.")
+    args = parser.parse_args()
+    asyncio.run(serve_forever(args.host, args.port, args.interval, args.drop_after))
+
+
+if __name__ == "__main__":
+    main()
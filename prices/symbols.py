@@ -0,0 +1,243 @@
+"""
+Compact, immutable index of OKX SPOT instruments.
+
+``SymbolIndex`` maps each base currency to the quote currencies it trades
+against and resolves asset names and aliases ("bitcoin", "hamster kombat")
+to base symbols, with bounded edit-distance matching for misspelled names.
+Ticker-shaped input is never fuzzy-matched, so an unlisted ticker one edit
+away from an alias ("PEPES") is reported as not found rather than priced
+as another coin.
+
+The shared cache stores the index as one compact string
+(``BTC:USDC,USDT|ETH:BTC,USDT|...``) instead of a pickled set of instIds.
+Each process keeps the decoded index in memory and replaces it wholesale
+(an atomic reference swap) when it refreshes, so validation and name
+resolution need no cache round trip.
+"""
+import re
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+# Common symbols that should always be available as a safe fallback
+COMMON_SYMBOLS = {
+    "BTC-USDT",
+    "ETH-USDT",
+    "SOL-USDT",
+    "XRP-USDT",
+    "ADA-USDT",
+    "DOGE-USDT",
+    "DOT-USDT",
+}
+
+# Display names used for name resolution and for the ``asset`` field.
+ASSET_NAMES = {
+    "BTC": "bitcoin",
+    "ETH": "ethereum",
+    "SOL": "solana",
+    "XRP": "ripple",
+    "ADA": "cardano",
+    "DOGE": "dogecoin",
+    "DOT": "polkadot",
+    "BNB": "binance coin",
+    "LTC": "litecoin",
+    "TRX": "tron",
+    "TON": "toncoin",
+    "LINK": "chainlink",
+    "AVAX": "avalanche",
+    "SHIB": "shiba inu",
+    "PEPE": "pepe",
+    "BCH": "bitcoin cash",
+    "ETC": "ethereum classic",
+    "XLM": "stellar",
+    "ATOM": "cosmos",
+    "NEAR": "near protocol",
+    "APT": "aptos",
+    "SUI": "sui",
+    "ARB": "arbitrum",
+    "OP": "optimism",
+    "POL": "polygon",
+    "UNI": "uniswap",
+    "AAVE": "aave",
+    "FIL": "filecoin",
+    "HBAR": "hedera",
+    "ICP": "internet computer",
+    "PI": "pi network",
+    "HMSTR": "hamster kombat",
+    "NOT": "notcoin",
+    "DOGS": "dogs",
+    "WIF": "dogwifhat",
+    "BONK": "bonk",
+    "TRUMP": "official trump",
+    "USDT": "tether",
+    "USDC": "usd coin",
+}
+
+# Extra aliases; keys are normalized (see _normalize).
+EXTRA_ALIASES = {
+    "btc": "BTC",
+    "xbt": "BTC",
+    "ether": "ETH",
+    "eth": "ETH",
+    "sol": "SOL",
+    "doge": "DOGE",
+    "bnb": "BNB",
+    "matic": "POL",
+    "polygon matic": "POL",
+    "shiba": "SHIB",
+    "hamster": "HMSTR",
+    "hamster coin": "HMSTR",
+    "pi": "PI",
+    "pinetwork": "PI",
+    "avax": "AVAX",
+    "ton": "TON",
+}
+
+_NOISE = re.compile(r"[^a-z0-9 ]+")
+_SUFFIXES = (" coin", " token", " crypto")
+
+
+def _normalize(text: str) -> str:
+    text = _NOISE.sub(" ", text.lower().replace("-", " ").replace("_", " "))
+    text = " ".join(text.split())
+    for suffix in _SUFFIXES:
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[: -len(suffix)]
+    return text
+
+
+def _looks_like_ticker(text: str) -> bool:
+    """One short alphanumeric word, or one written in capitals ("PEPES", "dogx", "HAMSTR")."""
+    word = text.strip().lstrip("$")
+    return word.isalnum() and (len(word) <= 5 or word.isupper())
+
+
+def _distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between a and b, or ``limit + 1`` once exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def _default_aliases() -> dict:
+    aliases = {_normalize(name): symbol for symbol, name in ASSET_NAMES.items()}
+    aliases.update(EXTRA_ALIASES)
+    return aliases
+
+
+DEFAULT_ALIASES = MappingProxyType(_default_aliases())
+
+
+@dataclass(frozen=True, eq=False)
+class SymbolIndex:
+    # base currency -> sorted tuple of quote currencies
+    pairs: MappingProxyType
+    aliases: MappingProxyType = field(default_factory=lambda: DEFAULT_ALIASES)
+    built_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_inst_ids(cls, inst_ids) -> "SymbolIndex":
+        pairs = {}
+        for inst_id in inst_ids:
+            base, _, quote = inst_id.upper().partition("-")
+            if base and quote:
+                pairs.setdefault(base, set()).add(quote)
+        return cls(MappingProxyType({b: tuple(sorted(q)) for b, q in pairs.items()}))
+
+    def dumps(self) -> str:
+        """Compact serialization: ``BASE:QUOTE,QUOTE|BASE:QUOTE``."""
+        return "|".join(f"{b}:{','.join(q)}" for b, q in sorted(self.pairs.items()))
+
+    @classmethod
+    def loads(cls, data: str) -> "SymbolIndex":
+        pairs = {}
+        for chunk in data.split("|") if data else ():
+            base, _, quotes = chunk.partition(":")
+            pairs[base] = tuple(quotes.split(","))
+        return cls(MappingProxyType(pairs))
+
+    def __len__(self):
+        return sum(len(q) for q in self.pairs.values())
+
+    def quotes(self, base: str) -> tuple:
+        return self.pairs.get(base.upper(), ())
+
+    def has_pair(self, base: str, quote: str = "USDT") -> bool:
+        return quote.upper() in self.quotes(base)
+
+    def name(self, base: str) -> str:
+        return ASSET_NAMES.get(base.upper(), base.lower())
+
+    def resolve(self, text: str, fuzzy: bool = True):
+        """Resolve a ticker, name or alias to a listed base symbol.
+
+        Tries, in order: the exact ticker, an exact alias/name, and (for
+        names that don't look like a ticker) the closest alias within an
+        edit distance of 1, or 2 for inputs of eight letters or more. Returns
+        ``None`` when nothing matches or the closest aliases are a tie
+        between different symbols.
+        """
+        if not text:
+            return None
+        upper = text.strip().upper()
+        if upper in self.pairs:
+            return upper
+
+        key = _normalize(text)
+        symbol = self.aliases.get(key)
+        if symbol is None and key.replace(" ", "") in self.aliases:
+            symbol = self.aliases[key.replace(" ", "")]
+        if symbol is None and fuzzy and len(key) >= 4 and not _looks_like_ticker(text):
+            symbol = self._closest(key)
+        if symbol and symbol in self.pairs:
+            return symbol
+        return None
+
+    def _closest(self, key: str):
+        """The one symbol whose aliases are nearest to ``key``, or ``None`` if tied or too far."""
+        limit = 2 if len(key) >= 8 else 1
+        best, found = limit + 1, set()
+        for alias, candidate in self.aliases.items():
+            if len(alias) < 4:
+                continue
+            distance = _distance(key, alias, limit)
+            if distance < best:
+                best, found = distance, {candidate}
+            elif distance == best:
+                found.add(candidate)
+        return found.pop() if best <= limit and len(found) == 1 else None
+
+
+FALLBACK_INDEX = SymbolIndex.from_inst_ids(COMMON_SYMBOLS)
+
+# (index, expires_at) for this process; replaced as a whole, never mutated
+_current = None
+
+
+def current_index() -> SymbolIndex:
+    """Return this process's index (or the fallback) without any I/O."""
+    entry = _current
+    return entry[0] if entry else FALLBACK_INDEX
+
+
+def index_is_fresh() -> bool:
+    entry = _current
+    return entry is not None and entry[1] > time.monotonic()
+
+
+def install_index(index: SymbolIndex, ttl: float):
+    """Atomically swap in a freshly built index for ``ttl`` seconds."""
+    global _current
+    _current = (index, time.monotonic() + ttl)
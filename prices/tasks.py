@@ -0,0 +1,11 @@
+import asyncio
+
+from celery import shared_task
+
+from .tickers import refresh_ticker_snapshot as _refresh_ticker_snapshot
+
+
+@shared_task(ignore_result=True)
+def refresh_ticker_snapshot():
+    """Periodic (Celery beat) bulk refresh of every tracked SPOT price."""
+    return asyncio.run(_refresh_ticker_snapshot())
@@ -1,3 +1,615 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from types import MappingProxyType
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+import redis
+from django.core.cache import cache as shared_cache
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.tiered_cache import cache
+from . import candles, governor, portfolio, services, trend
+from .governor import CircuitBreaker
+from .http import BinanceClient, HttpClientSingleton
+from .models import Candle
+from .providers import PROVIDERS, hedged_price
+from .providers.base import PROVIDER_REQUESTS, ProviderError
+from .singleflight import single_flight, stale_while_revalidate, track_staleness
+from .stream import TickerStream
+from .stubs import binance_rest, httpstub, okx_rest
+from .symbols import SymbolIndex
+
+
+class HttpClientPoolTests(SimpleTestCase):
+    def test_entries_are_dropped_when_their_loop_shuts_down(self):
+        async def use():
+            first = await HttpClientSingleton.get_client()
+            self.assertIs(await HttpClientSingleton.get_client(), first)
+            await BinanceClient.get_client()
+
+        for _ in range(5):
+            asyncio.run(use())
+        self.assertEqual(len(HttpClientSingleton._clients), 0)
+        self.assertEqual(len(BinanceClient._clients), 0)
+
+
+def clear_caches():
+    shared_cache.clear()
+    cache.clear_local()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "101.5"
+
+        values = await asyncio.gather(*(single_flight("price:BTC-USDT", fetch, 10) for _ in range(10)))
+        self.assertEqual(values, ["101.5"] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(await single_flight("price:BTC-USDT", fetch, 10), "101.5")
+        self.assertEqual(len(calls), 1)
+
+    async def test_errors_are_shared_and_not_cached(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        results = await asyncio.gather(
+            *(single_flight("price:BTC-USDT", fetch, 10) for _ in range(3)), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(cache.get("price:BTC-USDT"))
+
+    async def test_stale_copy_is_served_while_another_worker_refreshes(self):
+        cache.set("stale:price:BTC-USDT", ("99", time.time() - 30), 300)
+        cache.add("lock:price:BTC-USDT", "other-worker", 5)
+
+        async def fetch():
+            raise AssertionError("the lock holder is refreshing")
+
+        with track_staleness() as served:
+            value = await single_flight("price:BTC-USDT", fetch, 10)
+        self.assertEqual(value, "99")
+        self.assertAlmostEqual(served["price:BTC-USDT"], 30, delta=5)
+
+    async def test_waiting_on_another_worker_keeps_the_loop_free(self):
+        cache.add("lock:price:BTC-USDT", "other-worker", 5)
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.005)
+
+        async def fetch():
+            return "101.5"
+
+        async def other_worker():
+            await asyncio.sleep(0.05)
+            await cache.aset("price:BTC-USDT", "100")
+
+        background = asyncio.create_task(ticker())
+        # The sync API would block the loop on an L2 round trip
+        blocking = {name: mock.Mock(side_effect=AssertionError(name)) for name in ("get", "add", "set", "delete")}
+        with mock.patch.multiple(cache, **blocking):
+            value, _ = await asyncio.gather(single_flight("price:BTC-USDT", fetch, 10), other_worker())
+        background.cancel()
+        self.assertEqual(value, "100")
+        self.assertGreater(len(ticks), 5)
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    async def test_stale_value_is_served_while_one_refresh_runs(self):
+        cache.set("stale:price:ETH-USDT", ("4000", time.time() - 20), 300)
+        release = asyncio.Event()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return "4100"
+
+        with track_staleness() as served:
+            first = await stale_while_revalidate("price:ETH-USDT", fetch, 10, 300)
+            second = await stale_while_revalidate("price:ETH-USDT", fetch, 10, 300)
+        self.assertEqual(first[0], "4000")
+        self.assertAlmostEqual(first[1], 20, delta=5)
+        self.assertEqual(second[0], "4000")
+        self.assertIn("price:ETH-USDT", served)
+
+        release.set()
+        for _ in range(50):
+            if cache.get("price:ETH-USDT") is not None:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(await stale_while_revalidate("price:ETH-USDT", fetch, 10, 300), ("4100", None))
+
+    async def test_miss_without_stale_copy_fetches_inline(self):
+        async def fetch():
+            return "1"
+
+        self.assertEqual(await stale_while_revalidate("price:SOL-USDT", fetch, 10, 300), ("1", None))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_threshold_and_closes_after_successful_trial(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        # One trial call per cooldown
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+
+@override_settings(OKX_RETRY_BACKOFF=0.001, OKX_RETRY_BACKOFF_MAX=0.002, OKX_MAX_RETRIES=2,
+                   OKX_BREAKER_THRESHOLD=2, OKX_BREAKER_COOLDOWN=60, OKX_GOVERNOR_MAX_WAIT=0.5)
+class GovernorTests(SimpleTestCase):
+    def setUp(self):
+        governor._limiter = None
+        governor._breaker = None
+        self.responses = []
+        self.requests = []
+
+        async def handler(request):
+            self.requests.append(request.url.path)
+            return self.responses.pop(0) if self.responses else httpx.Response(200, json={"data": []})
+
+        transport = httpx.MockTransport(handler)
+        patcher = mock.patch.object(
+            HttpClientSingleton, "_build_client",
+            classmethod(lambda cls: httpx.AsyncClient(transport=transport, base_url="https://www.okx.com")),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_budget_stays_under_the_documented_limit(self):
+        limit = governor.endpoint_limit("/api/v5/market/ticker")
+        # 80% of 20 per 2 s: a burst of 4, then 12 per 2 s
+        self.assertEqual(limit.capacity, 4)
+        self.assertAlmostEqual(limit.capacity / limit.period, 6.0)
+
+    async def test_retries_429_then_returns_the_response(self):
+        self.responses = [httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, json={"data": []})]
+        r = await governor.okx_get("/api/v5/market/ticker", {"instId": "BTC-USDT"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_waits_for_a_token_instead_of_failing(self):
+        started = time.monotonic()
+        for _ in range(6):
+            await governor.acquire("/api/v5/market/ticker")
+        # 4 burst tokens, then one every 1/6 s
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+    async def test_breaker_fails_fast_after_repeated_5xx(self):
+        self.responses = [httpx.Response(503) for _ in range(3)]
+        # The second failed attempt opens the breaker, so the retry is refused
+        with self.assertRaises(governor.CircuitOpen):
+            await governor.okx_get("/api/v5/market/ticker")
+        with self.assertRaises(governor.CircuitOpen):
+            await governor.okx_get("/api/v5/market/ticker")
+        self.assertEqual(len(self.requests), 2)
+
+
+class TickerStreamTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_error_event_drops_only_the_rejected_instrument(self):
+        stream = TickerStream(["BTC-USDT", "ETH-USDT", "WETH-USDT"])
+        stream.handle_message(json.dumps({
+            "event": "error", "code": "60018",
+            "msg": "Wrong URL or channel:tickers,instId:WETH-USDT doesn't exist.",
+        }))
+        self.assertEqual(stream.inst_ids, ["BTC-USDT", "ETH-USDT"])
+        stream.handle_message(json.dumps({"event": "error", "code": "50011", "msg": "Too many requests"}))
+        self.assertEqual(stream.inst_ids, ["BTC-USDT", "ETH-USDT"])
+
+    def test_failed_flush_keeps_prices_pending(self):
+        stream = TickerStream(["BTC-USDT"])
+        stream.handle_message(json.dumps({"data": [{"instId": "BTC-USDT", "last": "101.5", "ts": "1"}]}))
+        with mock.patch.object(cache, "set_many", side_effect=redis.ConnectionError("down")):
+            self.assertEqual(stream.flush(), 0)
+        self.assertEqual(stream.flush(), 1)
+        self.assertEqual(cache.get("price:BTC-USDT"), "101.5")
+
+
+class HedgedPriceTests(SimpleTestCase):
+    """``hedged_price`` against the bundled OKX and Binance stub servers."""
+
+    def setUp(self):
+        governor._limiter = None
+        governor._breaker = None
+
+    def stub(self, routes, **options):
+        server = httpstub.serve(routes, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    def lookup(self, chain, delay, okx=None, binance=None):
+        bases = dict(
+            OKX_BASE=self.stub(okx_rest.ROUTES, **(okx or {})),
+            BINANCE_BASE=self.stub(binance_rest.ROUTES, **(binance or {})),
+        )
+
+        async def run():
+            try:
+                started = time.perf_counter()
+                price, provider = await hedged_price("BTC-USDT", delay=delay, chain=[PROVIDERS[p] for p in chain])
+                elapsed = time.perf_counter() - started
+                # Let the cancelled loser unwind before checking for leftovers
+                await asyncio.sleep(0.05)
+                leftovers = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                return price, provider, elapsed, leftovers
+            finally:
+                await HttpClientSingleton.aclose()
+                await BinanceClient.aclose()
+
+        with override_settings(**bases):
+            return asyncio.run(run())
+
+    @staticmethod
+    def requests_of(provider, outcome):
+        return sum(v for labels, v in PROVIDER_REQUESTS.samples()
+                   if labels == {"provider": provider, "outcome": outcome})
+
+    def test_fast_primary_is_not_hedged(self):
+        binance_before = self.requests_of("binance", "ok") + self.requests_of("binance", "cancelled")
+        price, provider, _, _ = self.lookup(["okx", "binance"], 0.3)
+        self.assertEqual(provider, "okx")
+        self.assertGreater(price, 0)
+        self.assertEqual(self.requests_of("binance", "ok") + self.requests_of("binance", "cancelled"), binance_before)
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        cancelled = self.requests_of("okx", "cancelled")
+        _, provider, elapsed, leftovers = self.lookup(["okx", "binance"], 0.05, okx={"latency": 1.0})
+        self.assertEqual(provider, "binance")
+        # Hedge delay plus the secondary's latency, not the primary's second
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(self.requests_of("okx", "cancelled"), cancelled + 1)
+        self.assertEqual(leftovers, [])
+
+    def test_error_moves_on_without_waiting_for_the_delay(self):
+        _, provider, elapsed, _ = self.lookup(["binance", "okx"], 5, binance={"error_rate": 1.0})
+        self.assertEqual(provider, "okx")
+        self.assertLess(elapsed, 1)
+
+    def test_primary_error_is_raised_when_every_provider_fails(self):
+        with self.assertRaisesRegex(ProviderError, "binance returned HTTP 503"):
+            self.lookup(["binance"], -1, binance={"error_rate": 1.0})
+
+
+class CurrentQuoteTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+        self.addCleanup(clear_caches)
+
+    async def test_cached_okx_price_is_used_first(self):
+        cache.set("price:BTC-USDT", "100")
+        with mock.patch.object(services, "hedged_price") as hedged:
+            self.assertEqual(await services.fetch_current_quote("BTC-USDT"), (Decimal("100"), "okx"))
+        hedged.assert_not_called()
+
+    async def test_hedged_answer_is_cached_with_its_provider(self):
+        with mock.patch.object(services, "hedged_price", return_value=(Decimal("101.5"), "binance")) as hedged:
+            first = await services.fetch_current_quote("BTC-USDT")
+            second = await services.fetch_current_quote("BTC-USDT")
+        self.assertEqual(first, (Decimal("101.5"), "binance"))
+        self.assertEqual(second, first)
+        self.assertEqual(hedged.await_count, 1)
+        self.assertIsNone(cache.get("price:BTC-USDT"))
+
+    async def test_comparison_names_the_provider(self):
+        with mock.patch.object(services, "resolve_symbol", return_value="BTC-USDT"), \
+                mock.patch.object(services, "fetch_close_at_date", return_value=Decimal("100")), \
+                mock.patch.object(services, "hedged_price", return_value=(Decimal("110"), "binance")):
+            comp = await services.get_comparison("btc", "2025-01-01")
+        figures = services.comparison_figures(comp)
+        self.assertEqual(figures["current_price"], "110")
+        self.assertEqual(figures["price_source"], "binance")
+
+
+class ComparisonTests(SimpleTestCase):
+    async def test_history_and_ticker_are_fetched_concurrently(self):
+        running = []
+
+        async def slow(value):
+            running.append(1)
+            await asyncio.sleep(0.1)
+            # Both lookups are in flight before either finishes
+            self.assertEqual(len(running), 2)
+            return value
+
+        async def close_at_date(full_symbol, dt):
+            return await slow(Decimal("100"))
+
+        async def current_quote(full_symbol):
+            return await slow((Decimal("110"), "okx"))
+
+        with mock.patch.object(services, "resolve_symbol", return_value="BTC-USDT"), \
+                mock.patch.object(services, "fetch_close_at_date", side_effect=close_at_date), \
+                mock.patch.object(services, "fetch_current_quote", side_effect=current_quote):
+            started = time.perf_counter()
+            comp = await services.get_comparison("btc", "2025-01-01")
+            elapsed = time.perf_counter() - started
+        self.assertLess(elapsed, 0.18)
+        figures = services.comparison_figures(comp)
+        self.assertEqual((figures["price_on_date"], figures["current_price"]), ("100", "110"))
+        timings = comp["result"]["artifacts"][0]["parts"][0]["data"]["timings_ms"]
+        self.assertGreaterEqual(timings["history"], 100)
+        self.assertLess(timings["total"], 180)
+
+    async def test_nlp_compare_returns_the_comparison_without_an_analysis(self):
+        comp = {"result": {"status": {"state": "completed"}}}
+        parsed = {"symbol": "BTC", "date": "2025-01-01"}
+        with mock.patch("prices.views.parse_text", return_value=parsed), \
+                mock.patch("prices.views.get_comparison", return_value=comp), \
+                mock.patch("ai.services.response_text") as response_text:
+            r = await self.async_client.post("/api/v1/nlp/compare/", {"text": "btc since new year"},
+                                             content_type="application/json")
+        self.assertEqual(r.json(), comp)
+        response_text.assert_not_called()
+
+
+class SymbolIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SymbolIndex.from_inst_ids({
+            "BTC-USDT", "BTC-USDC", "ETH-USDT", "ETH-BTC", "DOGE-USDT", "DOGS-USDT", "PEPE-USDT", "HMSTR-USDT",
+        })
+
+    def test_dumps_and_loads_round_trip(self):
+        data = self.index.dumps()
+        self.assertTrue(data.startswith("BTC:USDC,USDT|DOGE:USDT|"))
+        loaded = SymbolIndex.loads(data)
+        self.assertEqual(dict(loaded.pairs), dict(self.index.pairs))
+        self.assertEqual(len(loaded), 8)
+        self.assertEqual(len(SymbolIndex.loads("")), 0)
+
+    def test_resolves_tickers_names_and_aliases(self):
+        self.assertEqual(self.index.resolve("btc"), "BTC")
+        self.assertEqual(self.index.resolve(" Bitcoin "), "BTC")
+        self.assertEqual(self.index.resolve("hamster kombat"), "HMSTR")
+        self.assertEqual(self.index.resolve("Hamster-Coin"), "HMSTR")
+        self.assertIsNone(self.index.resolve("solana"))  # not listed
+        self.assertIsNone(self.index.resolve(""))
+
+    def test_fuzzy_matches_misspelled_names(self):
+        self.assertEqual(self.index.resolve("bitcoi"), "BTC")
+        self.assertEqual(self.index.resolve("etherium"), "ETH")
+        self.assertEqual(self.index.resolve("hamstr kombat"), "HMSTR")
+        self.assertIsNone(self.index.resolve("etherium", fuzzy=False))
+
+    def test_ticker_shaped_input_is_not_fuzzed(self):
+        self.assertIsNone(self.index.resolve("PEPES"))
+        self.assertIsNone(self.index.resolve("pepes"))
+        self.assertIsNone(self.index.resolve("DOGX"))
+        self.assertIsNone(self.index.resolve("BITCOI"))
+
+    def test_ties_between_symbols_are_rejected(self):
+        aliases = MappingProxyType({"alphaa": "AAA", "alphab": "BBB", "gammaa": "CCC", "gamma a": "CCC"})
+        index = SymbolIndex(SymbolIndex.from_inst_ids({"AAA-USDT", "BBB-USDT", "CCC-USDT"}).pairs, aliases)
+        self.assertIsNone(index.resolve("alphac"))
+        # Two aliases of the same symbol are not a tie
+        self.assertEqual(index.resolve("gammab"), "CCC")
+
+
+DAY = candles.BAR_MS["1D"]
+
+
+def candle_row(ts, close="100", confirm="1"):
+    return [str(ts), "99", "101", "98", close, "5", "500", "500", confirm]
+
+
+class CandleStoreTests(TestCase):
+    async def test_unconfirmed_bars_are_not_stored(self):
+        written = await candles.store_candles("BTC-USDT", "1D", [candle_row(2 * DAY, confirm="0"), candle_row(DAY)])
+        self.assertEqual(written, 1)
+        self.assertEqual([c.ts async for c in Candle.objects.all()], [DAY])
+
+    async def test_rewrites_upsert_on_instrument_bar_and_time(self):
+        await candles.store_candles("BTC-USDT", "1D", [candle_row(DAY, close="100")])
+        await candles.store_candles("BTC-USDT", "1D", [candle_row(DAY, close="105")])
+        await candles.store_candles("BTC-USDT", "1H", [candle_row(DAY, close="90")])
+        self.assertEqual(await Candle.objects.acount(), 2)
+        stored = await Candle.objects.aget(inst_id="BTC-USDT", bar="1D", ts=DAY)
+        self.assertEqual(stored.close, Decimal("105"))
+
+    async def test_stored_candle_before_returns_the_bar_just_before(self):
+        await candles.store_candles("BTC-USDT", "1D", [candle_row(ts) for ts in (DAY, 2 * DAY, 3 * DAY)])
+        self.assertEqual((await candles.stored_candle_before("BTC-USDT", "1D", 3 * DAY)).ts, 2 * DAY)
+        self.assertEqual((await candles.stored_candle_before("BTC-USDT", "1D", 3 * DAY + 1)).ts, 3 * DAY)
+        # Nothing opened in the day before 5 * DAY: a gap, not the 3 * DAY bar
+        self.assertIsNone(await candles.stored_candle_before("BTC-USDT", "1D", 5 * DAY))
+        self.assertIsNone(await candles.stored_candle_before("ETH-USDT", "1D", 3 * DAY))
+
+    async def test_backfill_pages_back_in_full_pages(self):
+        newest = 300 * DAY
+        cursors = []
+
+        async def page(inst_id, bar, after=None, limit=candles.CANDLE_PAGE_LIMIT):
+            cursors.append(after)
+            top = newest if after is None else after - DAY
+            # The last page is short: the instrument's first listed day
+            return [candle_row(ts) for ts in range(top, max(top - limit * DAY, 60 * DAY), -DAY)]
+
+        with mock.patch.object(candles, "fetch_candle_page", side_effect=page):
+            written = await candles.backfill("BTC-USDT", "1D", since=0)
+        self.assertEqual(cursors, [None, 201 * DAY, 101 * DAY])
+        self.assertEqual(written, 240)
+        self.assertEqual(await Candle.objects.acount(), 240)
+
+    async def test_backfill_stops_once_past_since(self):
+        async def page(inst_id, bar, after=None, limit=candles.CANDLE_PAGE_LIMIT):
+            return [candle_row(ts) for ts in range(300 * DAY, 200 * DAY, -DAY)]
+
+        with mock.patch.object(candles, "fetch_candle_page", side_effect=page) as fetch:
+            await candles.backfill("BTC-USDT", "1D", since=250 * DAY)
+        self.assertEqual(fetch.await_count, 1)
+
+
+class CandleStoreErrorTests(SimpleTestCase):
+    def errors(self, operation):
+        return dict(((labels["operation"], value) for labels, value in candles.STORE_ERRORS.samples())).get(operation, 0)
+
+    async def test_failed_read_is_logged_counted_and_a_miss(self):
+        before = self.errors("read")
+        with mock.patch.object(Candle.objects, "filter", side_effect=DatabaseError("no such table")), \
+                self.assertLogs("prices.candles", "WARNING"):
+            self.assertIsNone(await candles.stored_candle_before("BTC-USDT", "1D", DAY))
+        self.assertEqual(self.errors("read"), before + 1)
+
+    async def test_failed_write_still_answers_the_lookup(self):
+        before = self.errors("write")
+        with mock.patch.object(services, "stored_candle_before", return_value=None), \
+                mock.patch.object(services, "fetch_candle_page", return_value=[candle_row(DAY, close="42")]), \
+                mock.patch.object(candles, "store_candles", side_effect=DatabaseError("database is locked")), \
+                self.assertLogs("prices.candles", "WARNING"):
+            close = await services._request_close("BTC-USDT", date(2025, 1, 2))
+        self.assertEqual(close, "42")
+        self.assertEqual(self.errors("write"), before + 1)
+
+
+class TrendMathTests(SimpleTestCase):
+    def test_ema_closed_form_matches_the_recursion(self):
+        closes = 100 + np.cumsum(np.random.default_rng(1).normal(0, 2, 200))
+        for period in (2, 7, 30):
+            alpha = 2 / (period + 1)
+            expected = [closes[0]]
+            for x in closes[1:]:
+                expected.append(alpha * x + (1 - alpha) * expected[-1])
+            np.testing.assert_allclose(trend.ema(closes, period), expected, rtol=1e-9)
+
+    def test_sma_window_edges(self):
+        values = np.array([1.0, 2.0, 3.0, 4.0])
+        np.testing.assert_array_equal(trend.sma(values, 2), [np.nan, 1.5, 2.5, 3.5])
+        np.testing.assert_array_equal(trend.sma(values, 4), [np.nan, np.nan, np.nan, 2.5])
+        self.assertTrue(np.isnan(trend.sma(values, 5)).all())
+        np.testing.assert_array_equal(trend.sma(values, 1), values)
+
+    def rows(self, closes):
+        return [[str(i * DAY), str(c), str(c), str(c), str(c)] for i, c in enumerate(closes)]
+
+    def test_max_drawdown_is_peak_to_trough(self):
+        figures = trend.compute_trend(self.rows([100, 120, 90, 130, 104, 110]), "1D")
+        # 120 -> 90 is -25%; the later 130 -> 104 is only -20%
+        self.assertEqual(figures["max_drawdown_pct"], -25.0)
+        self.assertEqual(figures["return_pct"], 10.0)
+        self.assertEqual((figures["high"], figures["low"]), (130.0, 90.0))
+
+    def test_volatility_is_annualized_log_return_stdev(self):
+        # Alternating +10% / -10%: log returns of ln(1.1) and ln(0.9)
+        closes = [100.0]
+        for i in range(10):
+            closes.append(closes[-1] * (1.1 if i % 2 == 0 else 0.9))
+        figures = trend.compute_trend(self.rows(closes), "1D")
+        expected = np.std([np.log(1.1), np.log(0.9)] * 5, ddof=1) * np.sqrt(365) * 100
+        self.assertAlmostEqual(figures["volatility_pct"], round(expected, 4))
+        flat = trend.compute_trend(self.rows([100, 100, 100]), "1D")
+        self.assertEqual(flat["volatility_pct"], 0.0)
+        self.assertIsNone(trend.compute_trend(self.rows([100, 110]), "1D")["volatility_pct"])
+
+
+class ParseHoldingsTests(SimpleTestCase):
+    def test_both_shapes_and_repeated_symbols(self):
+        holdings = portfolio.parse_holdings([{"symbol": "btc", "quantity": "0.5"}, ["ETH", 2], (" btc ", 0.25)])
+        self.assertEqual(holdings, {"BTC": Decimal("0.75"), "ETH": Decimal("2")})
+
+    @override_settings(PORTFOLIO_MAX_HOLDINGS=2)
+    def test_malformed_input_is_rejected(self):
+        for raw in (
+            None, [], {"BTC": 1}, [["BTC"]], [{"symbol": "BTC", "quantity": "lots"}], [["BTC", -1]],
+            [["BTC", "NaN"]], [["BTC", "Infinity"]], [[7, 1]], [{"quantity": 1}], [["A", 1], ["B", 1], ["C", 1]],
+        ):
+            with self.subTest(raw=raw), self.assertRaises(ValueError):
+                portfolio.parse_holdings(raw)
+
+
+class ValuePortfolioTests(SimpleTestCase):
+    def setUp(self):
+        self.closes = {"BTC-USDT": Decimal("100"), "ETH-USDT": Decimal("10")}
+        self.current = {"BTC-USDT": Decimal("110"), "ETH-USDT": Decimal("8")}
+
+        async def resolve(symbol):
+            if symbol == "NOPE":
+                raise ValueError("❌ Unknown symbol")
+            return f"{symbol}-USDT"
+
+        async def close(inst_id, dt):
+            if inst_id == "SLOW-USDT":
+                await asyncio.sleep(1)
+            if inst_id == "DOWN-USDT":
+                raise ValueError("upstream down")
+            return self.closes.get(inst_id, Decimal("1"))
+
+        async def current(inst_ids, return_exceptions=False):
+            return {i: self.current.get(i, Decimal("1")) for i in inst_ids}
+
+        for name, fn in (("resolve_symbol", resolve), ("fetch_close_at_date", close), ("fetch_current_prices", current)):
+            patcher = mock.patch.object(portfolio, name, side_effect=fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_rows_and_totals(self):
+        result = await portfolio.value_portfolio({"BTC": Decimal("2"), "ETH": Decimal("10")}, date(2025, 1, 1))
+        rows = {row[0]: dict(zip(result["columns"], row)) for row in result["rows"]}
+        self.assertEqual(rows["BTC"]["pnl"], "20")
+        self.assertEqual(rows["ETH"]["pnl_pct"], "-20.0000")
+        # 200 + 100 then, 220 + 80 now
+        self.assertEqual(result["totals"], {
+            "holdings": 2, "value_on_date": "300", "current_value": "300", "pnl": "0", "pnl_pct": "0.0000",
+        })
+        self.assertEqual(result["errors"], [])
+
+    @override_settings(PORTFOLIO_BUDGET_SECONDS=0.1)
+    async def test_failing_holdings_are_reported_not_fatal(self):
+        holdings = {"BTC": Decimal("1"), "NOPE": Decimal("1"), "DOWN": Decimal("1"), "SLOW": Decimal("1")}
+        started = time.perf_counter()
+        result = await portfolio.value_portfolio(holdings, date(2025, 1, 1))
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual([row[0] for row in result["rows"]], ["BTC"])
+        errors = {e["symbol"]: e["error"] for e in result["errors"]}
+        self.assertEqual(errors, {
+            "NOPE": "❌ Unknown symbol", "DOWN": "upstream down", "SLOW": "⚠️ Price lookup took too long.",
+        })
+        self.assertEqual(result["totals"]["current_value"], "110")
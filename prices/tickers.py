@@ -0,0 +1,75 @@
+"""
+Bulk ticker snapshots.
+
+One ``/api/v5/market/tickers?instType=SPOT`` call returns the last price of
+every SPOT instrument. ``refresh_ticker_snapshot`` writes all of them to the
+same ``price:{instId}`` keys ``fetch_current_quote`` reads, in a single
+``aset_many``, so current prices almost never need a per-symbol request.
+"""
+import time
+
+from django.conf import settings
+
+from core import metrics
+from core.tiered_cache import cache
+from .governor import okx_get
+
+SNAPSHOT_TS_KEY = "tickers:snapshot_ts"
+
+
+def _snapshot_age():
+    ts = cache.get(SNAPSHOT_TS_KEY)
+    return time.time() - ts if ts else float("nan")
+
+
+SNAPSHOT_AGE = metrics.Gauge(
+    "ticker_snapshot_age_seconds",
+    "Seconds since the bulk ticker snapshot was last written to the cache.",
+    multiprocess_mode="max",
+)
+SNAPSHOT_AGE.set_function(_snapshot_age)
+
+
+def tracked_instruments():
+    """Return the configured instId subset, or ``None`` for every -USDT pair."""
+    symbols = settings.TICKER_SNAPSHOT_SYMBOLS
+    if not symbols:
+        return None
+    return {s if "-" in s else f"{s}-USDT" for s in symbols}
+
+
+async def fetch_spot_tickers(inst_ids=None) -> dict:
+    """Return ``{instId: last}`` for SPOT tickers in one upstream call.
+
+    ``inst_ids`` limits the result to a subset; by default every ``-USDT``
+    pair is returned.
+    """
+    r = await okx_get("/api/v5/market/tickers", {"instType": "SPOT"})
+    if r.status_code != 200:
+        raise ValueError(f"OKX tickers returned HTTP {r.status_code}")
+
+    prices = {}
+    for item in r.json().get("data", []):
+        inst_id = item.get("instId", "")
+        if inst_ids is None:
+            if not inst_id.endswith("-USDT"):
+                continue
+        elif inst_id not in inst_ids:
+            continue
+        if item.get("last"):
+            prices[inst_id] = item["last"]
+    return prices
+
+
+async def refresh_ticker_snapshot() -> int:
+    """Fetch the bulk snapshot and write it to the cache. Returns its size."""
+    prices = await fetch_spot_tickers(tracked_instruments())
+    if not prices:
+        return 0
+
+    # ✅ No invalidation broadcast: other workers' L1 copies expire before the next snapshot
+    await cache.aset_many(
+        {f"price:{inst_id}": last for inst_id, last in prices.items()}, settings.TICKER_SNAPSHOT_TTL, announce=False,
+    )
+    await cache.aset(SNAPSHOT_TS_KEY, time.time(), None)
+    return len(prices)
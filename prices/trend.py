@@ -0,0 +1,194 @@
+"""
+Trend analytics over a window of candles.
+
+``get_trend("BTC", "7d")`` fetches the closing candles of the window in one
+or two ``history-candles`` pages and computes, with NumPy array math over
+float64 series:
+
+- total and per-bar returns,
+- realized volatility (standard deviation of log returns, annualized),
+- SMA / EMA series,
+- maximum drawdown,
+- high / low of the window.
+
+Windows are ``<N>d`` or ``<N>w``. Daily bars are used while the window fits
+in ``TREND_MAX_BARS`` bars, weekly bars beyond that. Results are cached per
+``(symbol, bar, window)`` for ``TREND_CACHE_TTL`` seconds; past that the
+previous figures are served, flagged ``stale``, for up to ``TREND_STALE_TTL``
+seconds while they are recomputed in the background.
+"""
+import math
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+
+from .candles import BAR_MS, CANDLE_PAGE_LIMIT, fetch_candle_page, store_candles_in_passing
+from .services import resolve_symbol
+from .singleflight import stale_while_revalidate
+
+WINDOW_RE = re.compile(r"^(\d{1,4})\s*([dw])$")
+
+# Bars per year, for annualizing volatility
+PERIODS_PER_YEAR = {"1D": 365, "1W": 52}
+# Default SMA/EMA period per bar size
+DEFAULT_PERIOD = {"1D": 7, "1W": 4}
+
+
+def parse_window(window: str):
+    """Return ``(window, bar, points)`` for a window like ``"7d"`` or ``"4w"``.
+
+    ``points`` is the number of closes needed: one per bar in the window plus
+    the close the window starts from.
+    """
+    m = WINDOW_RE.match((window or "").strip().lower())
+    if not m:
+        raise ValueError("❌ Unsupported window — use days or weeks, e.g. 7d or 4w.")
+    n, unit = int(m.group(1)), m.group(2)
+    days = n * (7 if unit == "w" else 1)
+    bar = "1D" if days < settings.TREND_MAX_BARS else "1W"
+    bars = math.ceil(days * BAR_MS["1D"] / BAR_MS[bar])
+    if n < 1 or bars + 1 > settings.TREND_MAX_BARS:
+        raise ValueError(f"❌ Window {window} is out of range — try a shorter one.")
+    return f"{n}{unit}", bar, bars + 1
+
+
+async def fetch_candle_range(inst_id: str, bar: str, points: int) -> list:
+    """Return the latest ``points`` raw candle rows, oldest first.
+
+    Pages backwards one ``history-candles`` page at a time (so one or two
+    calls for any supported window). Confirmed bars are stored in passing.
+    """
+    rows, cursor = [], None
+    while len(rows) < points:
+        page = await fetch_candle_page(inst_id, bar, after=cursor, limit=CANDLE_PAGE_LIMIT)
+        if not page:
+            break
+        rows.extend(page)
+        await store_candles_in_passing(inst_id, bar, page)
+        if len(page) < CANDLE_PAGE_LIMIT:
+            break
+        cursor = int(page[-1][0])
+    rows = rows[:points]
+    rows.reverse()
+    return rows
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """Exponential moving average seeded with the first value.
+
+    Closed form of ``ema[t] = a * x[t] + (1 - a) * ema[t - 1]``, computed with
+    one cumulative sum. ``(1 - a) ** -t`` stays finite for the window sizes
+    ``parse_window`` allows.
+    """
+    alpha = 2 / (period + 1)
+    decay = 1 - alpha
+    t = np.arange(len(values))
+    terms = alpha * values * decay ** -t
+    terms[0] = values[0]
+    return np.cumsum(terms) * decay ** t
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """Simple moving average; the first ``period - 1`` entries are NaN."""
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        csum = np.cumsum(np.insert(values, 0, 0.0))
+        out[period - 1:] = (csum[period:] - csum[:-period]) / period
+    return out
+
+
+def _iso(ts_ms) -> str:
+    return datetime.fromtimestamp(int(ts_ms) / 1000, tz=timezone.utc).date().isoformat()
+
+
+def _round(value, digits: int = 4):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def _series(values: np.ndarray, digits: int = 8) -> list:
+    return [None if not np.isfinite(v) else round(float(v), digits) for v in values]
+
+
+def compute_trend(rows: list, bar: str, period: int = None) -> dict:
+    """Trend figures for raw candle rows ordered oldest first."""
+    if len(rows) < 2:
+        raise ValueError("⚠️ Not enough price history for that window.")
+
+    table = np.array([row[:5] for row in rows], dtype=np.float64)
+    ts, high, low, close = table[:, 0], table[:, 2], table[:, 3], table[:, 4]
+
+    period = max(2, min(period or DEFAULT_PERIOD[bar], len(close)))
+    returns = close[1:] / close[:-1] - 1
+    log_returns = np.diff(np.log(close))
+    volatility = (
+        log_returns.std(ddof=1) * math.sqrt(PERIODS_PER_YEAR[bar])
+        if len(log_returns) > 1 else float("nan")
+    )
+    drawdown = close / np.maximum.accumulate(close) - 1
+    sma_series = sma(close, period)
+    ema_series = ema(close, period)
+    hi, lo = int(high.argmax()), int(low.argmin())
+
+    return {
+        "bar": bar,
+        "points": len(close),
+        "start": _iso(ts[0]),
+        "end": _iso(ts[-1]),
+        "first_close": _round(close[0], 8),
+        "last_close": _round(close[-1], 8),
+        "return_pct": _round((close[-1] / close[0] - 1) * 100),
+        "mean_return_pct": _round(returns.mean() * 100),
+        "volatility_pct": _round(volatility * 100),
+        "period": period,
+        "sma": _round(sma_series[-1], 8),
+        "ema": _round(ema_series[-1], 8),
+        "max_drawdown_pct": _round(drawdown.min() * 100),
+        "high": _round(high[hi], 8),
+        "high_date": _iso(ts[hi]),
+        "low": _round(low[lo], 8),
+        "low_date": _iso(ts[lo]),
+        "series": {
+            "date": [_iso(t) for t in ts],
+            "close": _series(close),
+            "sma": _series(sma_series),
+            "ema": _series(ema_series),
+        },
+    }
+
+
+async def get_trend(asset: str, window: str = "7d") -> dict:
+    """Trend figures of ``asset`` over ``window``; raises ``ValueError``."""
+    window, bar, points = parse_window(window)
+    full_symbol = await resolve_symbol(asset)
+
+    async def _compute():
+        rows = await fetch_candle_range(full_symbol, bar, points)
+        return compute_trend(rows, bar)
+
+    trend, age = await stale_while_revalidate(
+        f"trend:{full_symbol}:{bar}:{window}", _compute, settings.TREND_CACHE_TTL, settings.TREND_STALE_TTL
+    )
+    result = {"asset": full_symbol.split("-")[0], "symbol": full_symbol, "window": window, **trend, "stale": age is not None}
+    if age is not None:
+        result["stale_seconds"] = round(age)
+    return result
+
+
+def trend_summary(trend: dict) -> str:
+    """Human-readable summary of ``get_trend`` figures."""
+    change = trend["return_pct"] or 0
+    direction = "up" if change > 0 else "down" if change < 0 else "flat"
+    return (
+        f"Asset: {trend['asset']}\n"
+        f"Window: {trend['window']} ({trend['start']} → {trend['end']}, {trend['points']} {trend['bar']} closes)\n"
+        f"Change: {trend['return_pct']}% ({direction})\n"
+        f"Close: ${trend['first_close']} → ${trend['last_close']}\n"
+        f"High / low: ${trend['high']} ({trend['high_date']}) / ${trend['low']} ({trend['low_date']})\n"
+        f"SMA{trend['period']}: ${trend['sma']}  EMA{trend['period']}: ${trend['ema']}\n"
+        f"Max drawdown: {trend['max_drawdown_pct']}%\n"
+        f"Volatility (annualized): {trend['volatility_pct']}%\n"
+        + (f"Note: cached figures from {trend['stale_seconds']}s ago — a refresh is under way.\n"
+           if trend.get("stale") else "")
+    )
@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import CompareAPIView, NLPToCompareAPIView
+from .views import CompareAPIView, NLPToCompareAPIView, PortfolioAPIView, TrendAPIView
 
 urlpatterns = [
     path("crypto/<str:asset>/compare/", CompareAPIView.as_view(), name="crypto-compare"),
+    path("crypto/<str:asset>/trend/", TrendAPIView.as_view(), name="crypto-trend"),
     path("nlp/compare/", NLPToCompareAPIView.as_view(), name="nlp-compare"),
+    path("portfolio/", PortfolioAPIView.as_view(), name="portfolio"),
 ]
@@ -1,60 +1,130 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from .services import get_comparison
-from ai.services import parse_text, response_text
-from asgiref.sync import async_to_sync
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from core.renderers import ORJSONResponse
+from .services import get_comparison, get_multi_comparison
+from .portfolio import parse_holdings, value_portfolio
+from .trend import get_trend
+from ai.services import parse_text
 from datetime import datetime
+import json
 
-class NLPToCompareAPIView(APIView):
-    def post(self, request):
-        text = request.data.get("text", "")
+
+def _request_json(request) -> dict:
+    """Return the JSON body of ``request`` (or its form data) as a dict."""
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST.dict()
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class NLPToCompareAPIView(View):
+    http_method_names = ["post"]
+
+    async def post(self, request):
+        text = _request_json(request).get("text", "")
         if not text:
-            return Response({"detail": "text required"}, status=400)
+            return ORJSONResponse({"detail": "text required"}, status=400)
 
-        parsed = async_to_sync(parse_text)(text)
+        parsed = await parse_text(text)
         asset = parsed.get("symbol")
+        symbols = [a["symbol"] for a in parsed.get("assets") or [] if a.get("symbol")]
         ds = parsed.get("date")
 
+        if asset and parsed.get("intent") == "trend":
+            try:
+                return ORJSONResponse(await get_trend(asset, parsed.get("window") or "7d"))
+            except Exception as e:
+                return ORJSONResponse({"detail": str(e)}, status=400)
+
         if not asset or not ds:
-            return Response({"detail": "could not detect crypto/date"}, status=400)
+            return ORJSONResponse({"detail": "could not detect crypto/date"}, status=400)
 
         try:
             dt = datetime.fromisoformat(ds).date()
         except:
-            return Response({"detail": "invalid date"}, status=400)
+            return ORJSONResponse({"detail": "invalid date"}, status=400)
 
         try:
             # Return Telex-compliant response directly
-            result = async_to_sync(get_comparison)(asset, dt)
-            reply = async_to_sync(response_text)(result)
-
-            return Response(result)  # Already Telex-compliant
+            if len(symbols) > 1:
+                result = await get_multi_comparison(symbols, dt)
+            else:
+                result = await get_comparison(asset, dt)
+            return ORJSONResponse(result)  # Already Telex-compliant
 
         except Exception as e:
-            return Response({"response": str(e)}, status=400)
+            return ORJSONResponse({"response": str(e)}, status=400)
 
 
-class CompareAPIView(APIView):
+class CompareAPIView(View):
     """
     GET /api/v1/crypto/<asset>/compare/?date=YYYY-MM-DD
     """
-    def get(self, request, asset):
-        date_str = request.query_params.get("date")
+    http_method_names = ["get"]
+
+    async def get(self, request, asset):
+        date_str = request.GET.get("date")
         if not date_str:
-            return Response(
+            return ORJSONResponse(
                 {"detail": "date queryparam required YYYY-MM-DD"},
-                status=status.HTTP_400_BAD_REQUEST
+                status=400
             )
         try:
             dt = datetime.fromisoformat(date_str).date()
         except Exception:
-            return Response(
+            return ORJSONResponse(
                 {"detail": "invalid date format; use YYYY-MM-DD"},
-                status=status.HTTP_400_BAD_REQUEST
+                status=400
             )
         try:
-            result = async_to_sync(get_comparison)(asset, dt)
-            return Response(result)  # Already Telex-compliant
+            result = await get_comparison(asset, dt)
+            return ORJSONResponse(result)  # Already Telex-compliant
+        except Exception as e:
+            return ORJSONResponse({"detail": str(e)}, status=400)
+
+
+class TrendAPIView(View):
+    """
+    GET /api/v1/crypto/<asset>/trend/?window=7d  (N days: 7d, N weeks: 4w)
+    """
+    http_method_names = ["get"]
+
+    async def get(self, request, asset):
+        window = request.GET.get("window", "7d")
+        try:
+            return ORJSONResponse(await get_trend(asset, window))
+        except Exception as e:
+            return ORJSONResponse({"detail": str(e)}, status=400)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class PortfolioAPIView(View):
+    """
+    POST /api/v1/portfolio/
+    {"holdings": [{"symbol": "BTC", "quantity": "0.5"}, ["ETH", 2]], "date": "YYYY-MM-DD"}
+    """
+    http_method_names = ["post"]
+
+    async def post(self, request):
+        data = _request_json(request)
+        try:
+            holdings = parse_holdings(data.get("holdings"))
+        except ValueError as e:
+            return ORJSONResponse({"detail": str(e)}, status=400)
+
+        dt = None
+        if data.get("date"):
+            try:
+                dt = datetime.fromisoformat(data["date"]).date()
+            except (TypeError, ValueError):
+                return ORJSONResponse({"detail": "invalid date format; use YYYY-MM-DD"}, status=400)
+
+        try:
+            return ORJSONResponse(await value_portfolio(holdings, dt))
         except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return ORJSONResponse({"detail": str(e)}, status=400)